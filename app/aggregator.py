@@ -1,144 +1,177 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from decimal import Decimal
-from sqlalchemy import func, select
-import time, statistics
-
-from .crud import stats_last_hour, fetch_series
-from .signals import signal_bs
-from .db import Price, engine
-
-# 🔹 Volatilidad de la última hora (compatible con SQLite y otros motores)
-def volatility_last_hour(db: Session, crypto: str) -> Optional[Decimal]:
-    one_hour_ago = int(time.time()) - 3600
-
-    if engine.dialect.name == "sqlite":
-        # Calcular en Python
-        stmt = select(Price.amount_dec).where(
-            Price.crypto == crypto, Price.ts >= one_hour_ago
-        )
-        rows = [row[0] for row in db.execute(stmt).all()]
-        if not rows:
-            return None
-        return Decimal(str(statistics.pstdev(rows)))
-    else:
-        # Usar stddev nativo en motores que lo soportan
-        stmt = select(func.stddev(Price.amount_dec)).where(
-            Price.crypto == crypto, Price.ts >= one_hour_ago
-        )
-        return db.execute(stmt).scalar()
-
-# 🔹 % cambio en 24h (cálculo en Python para compatibilidad con SQLite)
-def pct_change_24h(db: Session, crypto: str) -> Optional[float]:
+import time
+
+from .crud import iter_series, iter_series_many
+from .rollups import iter_rollups, mean_str, price_str, read_rollups_many, RollupRow
+from .retention import COARSER, policy as retention_policy
+from . import downsample
+from .metrics import timed
+from .ring import tick_ring
+
+# 🔹 Lectura por niveles: la parte anterior a la retención del nivel pedido
+# se completa con el siguiente nivel más grueso (buckets alineados, sin solapes)
+def _tiered_rollups_many(db: Session, cryptos: List[str], resolution: str, since: int) -> Dict[str, List[RollupRow]]:
+    cutoff = retention_policy.cutoff(resolution)
+    older: Dict[str, List[RollupRow]] = {c: [] for c in cryptos}
+    if cutoff is not None and since < cutoff:
+        coarse = _tiered_rollups_many(db, cryptos, COARSER[resolution], since)
+        older = {c: [r for r in rows if r[0] < cutoff] for c, rows in coarse.items()}
+        since = cutoff
+    current = read_rollups_many(db, cryptos, resolution, since)
+    return {c: older[c] + current[c] for c in cryptos}
+
+def _tiered_rollups(db: Session, crypto: str, resolution: str, since: int) -> List[RollupRow]:
+    return _tiered_rollups_many(db, [crypto], resolution, since)[crypto]
+
+def _since(resolution: str) -> int:
     now = int(time.time())
-    day_ago = now - 86400
-    stmt = select(Price.amount_dec).where(
-        Price.crypto == crypto, Price.ts >= day_ago
-    ).order_by(Price.ts.asc())
-    rows = [row[0] for row in db.execute(stmt).all()]
-    if len(rows) < 2:
-        return None
-    first, last = rows[0], rows[-1]
-    return float((last - first) / first * 100)
-
-# 🔹 Fila de la tabla
-def table_row(db: Session, crypto: str) -> Dict[str, Any]:
-    # Métricas de 1h
-    high, low, avg = stats_last_hour(db, crypto)
-    since = int(time.time()) - 3600
-    series = fetch_series(db, crypto, since)
-
-    prices = [row[1] for row in series]
-    amount_str = series[-1][2] if series else "-"
-    sig = signal_bs(prices, avg)
-
-    # Extras
-    vol = volatility_last_hour(db, crypto)
-    pct24 = pct_change_24h(db, crypto)
-
+    if resolution == "second":
+        return now - 60
+    elif resolution == "minute":
+        return now - 3600
+    elif resolution == "hour":
+        return now - 24 * 3600
+    elif resolution == "day":
+        return now - 30 * 24 * 3600
+    raise ValueError("resolution must be one of: second, minute, hour, day")
+
+def _avg_points(rows: List[RollupRow]) -> List[Dict[str, Any]]:
+    # Promedio por bucket desde los rollups (sum / count)
+    return [{"ts": ts, "price": mean_str(total, count, o, h, l, c)} for ts, o, h, l, c, total, count in rows]
+
+# 🔹 Ticks recientes [(ts, precio)]: del ring buffer (ring.py) si cubre la ventana,
+# si no de la DB (solo los pares que faltan)
+def _recent_series(db: Session, cryptos: List[str], since: int) -> Dict[str, List[Tuple[int, str]]]:
+    out: Dict[str, List[Tuple[int, str]]] = {}
+    missing: List[str] = []
+    for crypto in cryptos:
+        rows = tick_ring.read(crypto, since)
+        if rows is None:
+            missing.append(crypto)
+        else:
+            out[crypto] = rows
+    if missing:
+        for crypto in missing:
+            out[crypto] = []
+        for crypto, ts, _, amount_str in iter_series_many(db, missing, since):
+            out[crypto].append((ts, amount_str))
+    return out
+
+# 🔹 Arrays de varios pares: una consulta por nivel para todos los pares
+@timed
+def arrays_many(db: Session, cryptos: List[str], resolution: str) -> Dict[str, List[Dict[str, Any]]]:
+    since = _since(resolution)
+    if resolution != "second":
+        return {c: _avg_points(rows) for c, rows in _tiered_rollups_many(db, cryptos, resolution, since).items()}
+
+    # Ticks crudos; lo anterior a la retención cruda sale de los rollups de minuto
+    cutoff = retention_policy.cutoff("second")
+    older: Dict[str, List[Dict[str, Any]]] = {c: [] for c in cryptos}
+    if since < cutoff:
+        minute = _tiered_rollups_many(db, cryptos, "minute", since)
+        older = {c: _avg_points([r for r in rows if r[0] < cutoff]) for c, rows in minute.items()}
+        since = cutoff
+    series = _recent_series(db, cryptos, since)
     return {
-        "crypto": crypto,
-        "actual_price": amount_str,
-        "highest_1h": str(high) if high is not None else "-",
-        "lower_1h": str(low) if low is not None else "-",
-        "avg_1h": str(avg) if avg is not None else "-",
-        "signal": sig,
-        "volatility_1h": str(vol) if vol else "-",
-        "pct_change_24h": f"{pct24:.2f}%" if pct24 else "-"
+        c: older[c] + [{"ts": ts, "price": amount_str} for ts, amount_str in series[c]]
+        for c in cryptos
     }
 
 # 🔹 Arrays (series de tiempo promediadas)
 def arrays(db: Session, crypto: str, resolution: str) -> List[Dict[str, Any]]:
+    return arrays_many(db, [crypto], resolution)[crypto]
+
+# 🔹 Bucketer incremental: ticks (ts, amount_str) en orden -> una vela por bucket
+# de `size` segundos con el string exacto de cada tick. Emite cada vela al llegar
+# el primer tick del bucket siguiente: la memoria es la de la vela abierta
+def tick_candles(ticks, size: int = 1) -> Iterator[Dict[str, Any]]:
+    candle: Optional[Dict[str, Any]] = None
+    for ts, amount_str in ticks:
+        price = Decimal(amount_str)
+        ts = ts // size * size
+        if candle is not None and candle["ts"] == ts:
+            if price > Decimal(candle["high"]):
+                candle["high"] = amount_str
+            if price < Decimal(candle["low"]):
+                candle["low"] = amount_str
+            candle["close"] = amount_str
+            continue
+        if candle is not None:
+            yield candle
+        candle = {"ts": ts, "open": amount_str, "high": amount_str, "low": amount_str, "close": amount_str}
+    if candle is not None:
+        yield candle
+
+# 🔹 OHLC (velas): second desde los ticks crudos, minute/hour/day desde los rollups
+@timed
+def ohlc(db: Session, crypto: str, resolution: str) -> List[Dict[str, Any]]:
     now = int(time.time())
     if resolution == "second":
-        since = now - 60
-    elif resolution == "minute":
+        # Últimos 5 minutos, una vela por segundo con el string exacto de cada tick
+        return list(tick_candles(_recent_series(db, [crypto], now - 300)[crypto]))
+    if resolution == "minute":
         since = now - 3600
     elif resolution == "hour":
-        since = now - 24 * 3600
+        since = now - 86400
     elif resolution == "day":
-        since = now - 30 * 24 * 3600
+        since = now - 30 * 86400
     else:
         raise ValueError("resolution must be one of: second, minute, hour, day")
 
-    series = fetch_series(db, crypto, since)  # (ts, amount_dec, amount_str)
-
-    buckets: List[Dict[str, Any]] = []
-
-    def push_bucket(ts_key: int, values: List[Decimal]):
-        if not values:
-            return
-        avg = sum(values) / Decimal(len(values))
-        buckets.append({"ts": ts_key, "price": str(avg)})
-
-    if resolution == "second":
-        for ts, _, amount_str in series:
-            buckets.append({"ts": ts, "price": amount_str})
-        return buckets
-
-    # Caso agregado
-    size = {"minute": 60, "hour": 3600, "day": 86400}[resolution]
-    curr_key = None
-    acc: List[Decimal] = []
-    for ts, amount_dec, _ in series:
-        key = (ts // size) * size
-        if curr_key is None:
-            curr_key = key
-        if key != curr_key:
-            push_bucket(curr_key, acc)
-            curr_key = key
-            acc = [amount_dec]
-        else:
-            acc.append(amount_dec)
-    push_bucket(curr_key, acc)
-    return buckets
-
-# 🔹 OHLC (velas) para minute/hour/day
-def ohlc(db: Session, crypto: str, resolution: str) -> List[Dict[str, Any]]:
-    now = int(time.time())
-    if resolution == "minute":
-        since, size = now - 3600, 60
-    elif resolution == "hour":
-        since, size = now - 86400, 3600
-    elif resolution == "day":
-        since, size = now - 30 * 86400, 86400
+    return [
+        {"ts": ts, "open": o, "high": h, "low": l, "close": c}
+        for ts, o, h, l, c, _, _ in _tiered_rollups(db, crypto, resolution, since)
+    ]
+
+# 🔹 Rangos arbitrarios [start, end] (?from&to&max_points): se lee en streaming del
+# nivel más barato que alcanza para max_points y se reduce antes de armar la respuesta
+def _iter_tiered(db: Session, crypto: str, resolution: str, start: int, end: int) -> Iterator[RollupRow]:
+    cutoff = retention_policy.cutoff(resolution)
+    if cutoff is not None and start < cutoff:
+        for row in _iter_tiered(db, crypto, COARSER[resolution], start, min(end, cutoff - 1)):
+            if row[0] < cutoff:
+                yield row
+        start = cutoff
+    if start <= end:
+        yield from iter_rollups(db, crypto, resolution, start, end)
+
+def _iter_ticks(db: Session, crypto: str, start: int, end: int) -> Iterator[Tuple[int, str]]:
+    # Ticks crudos; lo anterior a la retención cruda sale de los rollups de minuto
+    cutoff = retention_policy.cutoff("second")
+    if start < cutoff:
+        for ts, o, h, l, c, total, count in _iter_tiered(db, crypto, "minute", start, min(end, cutoff - 1)):
+            if ts < cutoff:
+                yield ts, mean_str(total, count, o, h, l, c)
+        start = cutoff
+    if start <= end:
+        yield from iter_series(db, crypto, start, end)
+
+@timed
+def arrays_range(db: Session, crypto: str, resolution: str, start: int, end: int, max_points: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """(nivel leído, puntos reducidos con LTTB)"""
+    source = downsample.pick_resolution(resolution, start, end, max_points)
+    if source == "second":
+        points = ({"ts": ts, "price": amount_str} for ts, amount_str in _iter_ticks(db, crypto, start, end))
     else:
-        raise ValueError("OHLC supported only for minute/hour/day")
-
-    series = fetch_series(db, crypto, since)
-    buckets = {}
-    for ts, amount_dec, _ in series:
-        key = (ts // size) * size
-        if key not in buckets:
-            buckets[key] = {
-                "open": amount_dec,
-                "high": amount_dec,
-                "low": amount_dec,
-                "close": amount_dec
-            }
-        else:
-            b = buckets[key]
-            b["high"] = max(b["high"], amount_dec)
-            b["low"] = min(b["low"], amount_dec)
-            b["close"] = amount_dec
-    return [{"ts": k, **v} for k, v in sorted(buckets.items())]
+        points = (
+            {"ts": ts, "price": mean_str(total, count, o, h, l, c)}
+            for ts, o, h, l, c, total, count in _iter_tiered(db, crypto, source, start, end)
+        )
+    return source, list(downsample.lttb(points, start, end, max_points))
+
+@timed
+def ohlc_range(db: Session, crypto: str, resolution: str, start: int, end: int, max_points: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """(nivel leído, velas fusionadas hasta max_points)"""
+    source = downsample.pick_resolution(resolution, start, end, max_points)
+    width = downsample.candle_width(source, start, end, max_points)
+    if source == "second":
+        # Directo a velas del ancho final: ni lista de ticks ni velas de 1s intermedias
+        candles = tick_candles(_iter_ticks(db, crypto, start, end), width)
+    else:
+        candles = (
+            {"ts": ts, "open": o, "high": h, "low": l, "close": c}
+            for ts, o, h, l, c, _, _ in _iter_tiered(db, crypto, source, start, end)
+        )
+    return source, list(downsample.merge_candles(candles, width))
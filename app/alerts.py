@@ -0,0 +1,556 @@
+# app/alerts.py
+# Motor de alertas evaluado en el colector sobre "price_loaded":
+# - Cada regla se reduce a "la métrica M del par cruza el nivel L" (hacia arriba,
+#   abajo o ambos): precio (price_cross), % de cambio sobre una ventana
+#   (pct_change), desviación/promedio en % sobre una ventana (volatility) y
+#   EMA rápida - EMA lenta cruzando 0 (ema_cross).
+# - Índice por (par, métrica): niveles ordenados; con el valor anterior y el nuevo
+#   de la métrica, bisect da justo las reglas cruzadas. Por tick: O(métricas del
+#   par × log reglas) + las reglas que disparan, no O(reglas).
+# - Las métricas se mantienen incrementalmente (ventanas con suma/suma de
+#   cuadrados, EMA en O(1)) y solo para las combinaciones que alguna regla usa.
+# - Disparo por flanco: una regla dispara al cruzar, no mientras siga del otro lado.
+# Los eventos van a alert_events (cola local consultable por cualquier worker),
+# al webhook de la regla (si tiene) y al stream SSE ("alert").
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+from sqlalchemy import delete, insert, select
+
+from . import metrics
+from .crud import iter_series_many
+from .db import AlertEvent, AlertRule, SessionLocal, engine
+from .executor import run_db, run_write
+
+KINDS = ("price_cross", "pct_change", "ema_cross", "volatility")
+DEFAULT_WINDOW = 3600
+MAX_WINDOW = 86400
+RELOAD_SECONDS = float(os.getenv("ALERT_RELOAD_SECONDS", "2"))
+QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "1000"))
+EVENTS_KEEP = int(os.getenv("ALERT_EVENTS_KEEP", "10000"))
+WEBHOOK_TIMEOUT = float(os.getenv("ALERT_WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_RETRIES = 2
+STORE_RETRIES = 3
+
+TRIGGERED = metrics.Counter("alerts_triggered_total", "Alertas disparadas por tipo de regla", ["kind"])
+DROPPED = metrics.Counter("alerts_dropped_total", "Alertas perdidas (cola de entrega llena o error al guardar)")
+WEBHOOK_FAILURES = metrics.Counter("alerts_webhook_failures_total", "Webhooks que fallaron tras los reintentos")
+EVAL_SECONDS = metrics.Histogram("alerts_eval_seconds", "Evaluación de reglas por tick",
+                                 buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01))
+
+Rule = Dict[str, Any]
+
+
+# 🔹 Validación: regla de la API -> campos normalizados (ValueError si no es válida)
+def normalize(rule: Dict[str, Any]) -> Rule:
+    kind = rule["kind"]
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+    out: Rule = {
+        "crypto": rule["crypto"].strip().upper(),
+        "kind": kind,
+        "level": rule.get("level"),
+        "direction": rule.get("direction"),
+        "window": None,
+        "fast": None,
+        "slow": None,
+        "webhook": rule.get("webhook") or None,
+        "once": bool(rule.get("once", False)),
+    }
+    if out["webhook"] and not out["webhook"].startswith(("http://", "https://")):
+        raise ValueError("webhook must be an http(s) URL")
+    if kind == "ema_cross":
+        fast, slow = rule.get("fast") or 5, rule.get("slow") or 15
+        if not 1 <= fast < slow <= 1000:
+            raise ValueError("ema_cross needs 1 <= fast < slow <= 1000")
+        out.update(fast=fast, slow=slow, level=0.0, direction=out["direction"] or "any")
+        return out
+    if out["level"] is None or not math.isfinite(out["level"]):
+        raise ValueError(f"{kind} needs a numeric level")
+    if kind == "price_cross":
+        out["direction"] = out["direction"] or "any"
+        return out
+    window = rule.get("window") or DEFAULT_WINDOW
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f"window must be between 1 and {MAX_WINDOW} seconds")
+    out["window"] = window
+    if kind == "pct_change":
+        # El signo del nivel da la dirección por defecto: +5 sube un 5%, -5 cae un 5%
+        out["direction"] = out["direction"] or ("up" if out["level"] >= 0 else "down")
+    else:
+        out["direction"] = out["direction"] or "up"
+    return out
+
+
+def metric_key(rule: Rule) -> str:
+    kind = rule["kind"]
+    if kind == "price_cross":
+        return "price"
+    if kind == "pct_change":
+        return f"pct:{rule['window']}"
+    if kind == "volatility":
+        return f"vol:{rule['window']}"
+    return f"ema:{rule['fast']}:{rule['slow']}"
+
+
+# 🔹 Niveles ordenados de una métrica: qué reglas cruza un cambio prev -> value
+class Levels:
+    def __init__(self) -> None:
+        self.up: List[Tuple[float, int]] = []     # (nivel, id) que disparan al subir
+        self.down: List[Tuple[float, int]] = []   # (nivel, id) que disparan al bajar
+
+    def __len__(self) -> int:
+        return len({rid for _, rid in self.up} | {rid for _, rid in self.down})
+
+    def add(self, level: float, rule_id: int, direction: str) -> None:
+        if direction in ("up", "any"):
+            insort(self.up, (level, rule_id))
+        if direction in ("down", "any"):
+            insort(self.down, (level, rule_id))
+
+    def remove(self, level: float, rule_id: int) -> None:
+        for side in (self.up, self.down):
+            i = bisect_left(side, (level, rule_id))
+            if i < len(side) and side[i] == (level, rule_id):
+                del side[i]
+
+    def crossed(self, prev: float, value: float) -> List[Tuple[int, str]]:
+        if value > prev:
+            # Niveles en (prev, value]
+            lo = bisect_right(self.up, (prev, math.inf))
+            hi = bisect_right(self.up, (value, math.inf))
+            return [(rid, "up") for _, rid in self.up[lo:hi]]
+        if value < prev:
+            # Niveles en [value, prev)
+            lo = bisect_left(self.down, (value, -math.inf))
+            hi = bisect_left(self.down, (prev, -math.inf))
+            return [(rid, "down") for _, rid in self.down[lo:hi]]
+        return []
+
+
+# 🔹 Métricas incrementales de un par
+class _Window:
+    # Volatilidad con Welford al agregar y quitar (como rolling.PairWindow): sum/sumsq
+    # en float se cancelan con precios altos y arrastran error en cada desalojo
+    __slots__ = ("seconds", "ticks", "mean", "m2")
+
+    def __init__(self, seconds: int) -> None:
+        self.seconds = seconds
+        self.ticks: Deque[Tuple[int, float]] = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, ts: int, price: float) -> None:
+        self.ticks.append((ts, price))
+        delta = price - self.mean
+        self.mean += delta / len(self.ticks)
+        self.m2 += delta * (price - self.mean)
+        start = ts - self.seconds
+        while self.ticks[0][0] < start:
+            _, old = self.ticks.popleft()
+            n = len(self.ticks)
+            delta = old - self.mean
+            self.mean -= delta / n
+            self.m2 -= delta * (old - self.mean)
+
+    def pct_change(self) -> Optional[float]:
+        first = self.ticks[0][1]
+        return (self.ticks[-1][1] - first) / first * 100 if first else None
+
+    def volatility(self) -> Optional[float]:
+        # Desviación poblacional / promedio, en %
+        if not self.mean:
+            return None
+        return math.sqrt(max(0.0, self.m2 / len(self.ticks))) / abs(self.mean) * 100
+
+
+class _EmaPair:
+    __slots__ = ("kf", "ks", "fast", "slow")
+
+    def __init__(self, fast: int, slow: int) -> None:
+        self.kf = 2.0 / (fast + 1)
+        self.ks = 2.0 / (slow + 1)
+        self.fast: Optional[float] = None
+        self.slow: Optional[float] = None
+
+    def push(self, price: float) -> None:
+        if self.fast is None:
+            self.fast = self.slow = price
+            return
+        self.fast += (price - self.fast) * self.kf
+        self.slow += (price - self.slow) * self.ks
+
+
+class _PairState:
+    def __init__(self) -> None:
+        self.levels: Dict[str, Levels] = {}   # métrica -> niveles de las reglas del par
+        self.values: Dict[str, float] = {}    # último valor de cada métrica
+        self.windows: Dict[int, _Window] = {}
+        self.emas: Dict[Tuple[int, int], _EmaPair] = {}
+
+    def track(self, key: str) -> Levels:
+        # Una métrica nueva empieza vacía: su primer valor solo fija la referencia
+        name, _, arg = key.partition(":")
+        if name in ("pct", "vol"):
+            self.windows.setdefault(int(arg), _Window(int(arg)))
+        elif name == "ema":
+            fast, slow = (int(x) for x in arg.split(":"))
+            self.emas.setdefault((fast, slow), _EmaPair(fast, slow))
+        return self.levels.setdefault(key, Levels())
+
+    def untrack(self, key: str) -> None:
+        del self.levels[key]
+        self.values.pop(key, None)
+        name, _, arg = key.partition(":")
+        if name in ("pct", "vol") and f"pct:{arg}" not in self.levels and f"vol:{arg}" not in self.levels:
+            del self.windows[int(arg)]
+        elif name == "ema":
+            del self.emas[tuple(int(x) for x in arg.split(":"))]
+
+    def push(self, ts: int, price: float) -> None:
+        for w in self.windows.values():
+            w.push(ts, price)
+        for e in self.emas.values():
+            e.push(price)
+
+    def value(self, key: str, price: float) -> Optional[float]:
+        name, _, arg = key.partition(":")
+        if name == "price":
+            return price
+        if name == "pct":
+            return self.windows[int(arg)].pct_change()
+        if name == "vol":
+            return self.windows[int(arg)].volatility()
+        e = self.emas[tuple(int(x) for x in arg.split(":"))]
+        return e.fast - e.slow
+
+
+class AlertEngine:
+    def __init__(self) -> None:
+        self.rules: Dict[int, Rule] = {}
+        self._pairs: Dict[str, _PairState] = {}
+        # Reglas "once" ya disparadas cuyo evento aún no se guardó (el dispatcher las
+        # borra de la DB junto con el evento, o las devuelve con restore()):
+        # la recarga no debe volver a agregarlas
+        self._retired: Set[int] = set()
+        self._lock = threading.Lock()
+        self.active = False      # True solo en el proceso que evalúa (colector)
+        self.ticks = 0
+        self.triggered = 0
+
+    # Registro de reglas
+    def add(self, rule: Rule) -> None:
+        with self._lock:
+            if rule["id"] in self.rules or rule["id"] in self._retired:
+                return
+            self.rules[rule["id"]] = rule
+            state = self._pairs.setdefault(rule["crypto"], _PairState())
+            state.track(metric_key(rule)).add(rule["level"], rule["id"], rule["direction"])
+
+    def remove(self, rule_id: int) -> Optional[Rule]:
+        with self._lock:
+            return self._remove(rule_id)
+
+    def restore(self, rule: Rule) -> None:
+        # Regla "once" cuyo evento se perdió (cola llena o fallo al guardar): vuelve a evaluarse
+        with self._lock:
+            self._retired.discard(rule["id"])
+        self.add(rule)
+
+    def _remove(self, rule_id: int) -> Optional[Rule]:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        state, key = self._pairs[rule["crypto"]], metric_key(rule)
+        levels = state.levels[key]
+        levels.remove(rule["level"], rule_id)
+        if not levels.up and not levels.down:
+            state.untrack(key)
+            if not state.levels:
+                del self._pairs[rule["crypto"]]
+        return rule
+
+    # 🔹 Evaluación por tick (handler de "price_loaded")
+    def on_price(self, row: Dict[str, Any]) -> None:
+        if row["crypto"] not in self._pairs:
+            return
+        start = time.perf_counter()
+        fired = self.evaluate(row["crypto"], row["ts"], float(row["amount_dec"]))
+        EVAL_SECONDS.observe(time.perf_counter() - start)
+        for rule, direction, value in fired:
+            dispatcher.submit({
+                "rule_id": rule["id"],
+                "crypto": rule["crypto"],
+                "kind": rule["kind"],
+                "direction": direction,
+                "level": rule["level"],
+                "value": value,
+                "price": row["amount_str"],
+                "ts": row["ts"],
+            }, rule)
+
+    def evaluate(self, crypto: str, ts: int, price: float) -> List[Tuple[Rule, str, float]]:
+        fired: List[Tuple[Rule, str, float]] = []
+        with self._lock:
+            state = self._pairs.get(crypto)
+            if state is None:
+                return fired
+            self.ticks += 1
+            state.push(ts, price)
+            for key, levels in state.levels.items():
+                value = state.value(key, price)
+                if value is None:
+                    continue
+                prev = state.values.get(key)
+                state.values[key] = value
+                if prev is None:
+                    continue
+                for rule_id, direction in levels.crossed(prev, value):
+                    fired.append((self.rules[rule_id], direction, value))
+            for rule, _, _ in fired:
+                TRIGGERED.inc(kind=rule["kind"])
+                if rule["once"]:
+                    self._retired.add(rule["id"])
+                    self._remove(rule["id"])
+            self.triggered += len(fired)
+        return fired
+
+    def warm(self, db) -> None:
+        """Llena ventanas, EMA y valores previos con la historia reciente, sin disparar."""
+        with self._lock:
+            cryptos = list(self._pairs)
+            longest = max((s for c in cryptos for s in self._pairs[c].windows), default=0)
+        if not cryptos:
+            return
+        since = int(time.time()) - max(longest, 300)
+        for crypto, ts, amount_dec, _ in iter_series_many(db, cryptos, since):
+            price = float(amount_dec)
+            with self._lock:
+                state = self._pairs.get(crypto)
+                if state is None:
+                    continue
+                state.push(ts, price)
+                for key in state.levels:
+                    value = state.value(key, price)
+                    if value is not None:
+                        state.values[key] = value
+
+    # 🔹 Sincronización con alert_rules (reglas registradas desde otros workers)
+    def sync(self, rules: List[Rule]) -> Tuple[int, int]:
+        wanted = {r["id"]: r for r in rules}
+        with self._lock:
+            self._retired &= set(wanted)
+            removed = [rid for rid in self.rules if rid not in wanted]
+            for rid in removed:
+                self._remove(rid)
+            current = set(self.rules) | self._retired
+        added = [r for rid, r in wanted.items() if rid not in current]
+        for r in added:
+            self.add(r)
+        return len(added), len(removed)
+
+    def load(self) -> None:
+        with SessionLocal() as db:
+            self.sync(load_rules(db))
+            self.warm(db)
+        self.active = True
+        print(f"[INFO] Alertas: {len(self.rules)} reglas en {len(self._pairs)} pares")
+
+    async def reload_loop(self) -> None:
+        while True:
+            await asyncio.sleep(RELOAD_SECONDS)
+            try:
+                added, removed = self.sync(await run_db(_load_rules_db))
+                if added or removed:
+                    print(f"[INFO] Alertas: +{added} / -{removed} reglas")
+            except Exception as e:
+                print(f"[WARN] Recarga de reglas falló: {type(e).__name__}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self.active,
+                "rules": len(self.rules),
+                "pairs": len(self._pairs),
+                "metrics": sum(len(s.levels) for s in self._pairs.values()),
+                "ticks": self.ticks,
+                "triggered": self.triggered,
+                "queued": dispatcher.queue.qsize(),
+                "dropped": dispatcher.dropped,
+            }
+
+
+# 🔹 Persistencia
+def _row(r: AlertRule) -> Rule:
+    return {
+        "id": r.id, "crypto": r.crypto, "kind": r.kind, "level": r.level, "direction": r.direction,
+        "window": r.window, "fast": r.fast, "slow": r.slow, "webhook": r.webhook,
+        "once": bool(r.once), "created_at": r.created_at,
+    }
+
+
+def load_rules(db, crypto: Optional[str] = None) -> List[Rule]:
+    stmt = select(AlertRule).order_by(AlertRule.id.asc())
+    if crypto:
+        stmt = stmt.where(AlertRule.crypto == crypto)
+    return [_row(r) for r in db.execute(stmt).scalars()]
+
+
+def _load_rules_db() -> List[Rule]:
+    with SessionLocal() as db:
+        return load_rules(db)
+
+
+def create_rule(rule: Rule) -> Rule:
+    with engine.begin() as conn:
+        values = {**rule, "created_at": int(time.time())}
+        rule_id = conn.execute(insert(AlertRule).values(**values)).inserted_primary_key[0]
+    return {"id": rule_id, **values}
+
+
+def delete_rule(rule_id: int) -> bool:
+    with engine.begin() as conn:
+        return conn.execute(delete(AlertRule).where(AlertRule.id == rule_id)).rowcount > 0
+
+
+def load_events(db, after: int, limit: int, crypto: Optional[str] = None) -> List[Dict[str, Any]]:
+    stmt = select(AlertEvent.id, AlertEvent.payload).where(AlertEvent.id > after)
+    if crypto:
+        stmt = stmt.where(AlertEvent.crypto == crypto)
+    stmt = stmt.order_by(AlertEvent.id.asc()).limit(limit)
+    return [{"id": eid, **json.loads(payload)} for eid, payload in db.execute(stmt)]
+
+
+def _store_events(events: List[Dict[str, Any]], once_ids: Set[int]) -> List[Dict[str, Any]]:
+    # Una transacción por tanda: eventos + reglas "once" ya disparadas + recorte
+    out = []
+    with engine.begin() as conn:
+        for event in events:
+            payload = json.dumps(event)
+            eid = conn.execute(insert(AlertEvent).values(
+                rule_id=event["rule_id"], crypto=event["crypto"], ts=event["ts"], payload=payload,
+            )).inserted_primary_key[0]
+            out.append({"id": eid, **event})
+        if once_ids:
+            conn.execute(delete(AlertRule).where(AlertRule.id.in_(once_ids)))
+        # Cola local acotada: se conservan los últimos EVENTS_KEEP eventos
+        conn.execute(delete(AlertEvent).where(AlertEvent.id <= out[-1]["id"] - EVENTS_KEEP))
+    return out
+
+
+# 🔹 Entrega: cola acotada -> alert_events + SSE + webhooks (fuera del camino del tick)
+class AlertDispatcher:
+    def __init__(self) -> None:
+        self.queue: "asyncio.Queue[Tuple[Dict[str, Any], Rule]]" = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = 0
+        self._posts: Set[asyncio.Task] = set()   # webhooks en curso (referencia fuerte)
+        self.on_event: Optional[Callable[[Dict[str, Any]], None]] = None   # p. ej. difusión SSE
+
+    def submit(self, event: Dict[str, Any], rule: Rule) -> None:
+        try:
+            self.queue.put_nowait((event, rule))
+        except asyncio.QueueFull:
+            self._lost([rule])
+
+    async def run(self) -> None:
+        async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+            while True:
+                batch = [await self.queue.get()]
+                while not self.queue.empty() and len(batch) < 100:
+                    batch.append(self.queue.get_nowait())
+                stored = await self._store(batch)
+                if stored is None:
+                    continue
+                for event, (_, rule) in zip(stored, batch):
+                    if self.on_event is not None:
+                        self.on_event(event)
+                    if rule["webhook"]:
+                        task = asyncio.create_task(self._post(client, rule["webhook"], event))
+                        self._posts.add(task)
+                        task.add_done_callback(self._posts.discard)
+
+    async def _store(self, batch: List[Tuple[Dict[str, Any], Rule]]) -> Optional[List[Dict[str, Any]]]:
+        # Reintenta errores transitorios (p. ej. "database is locked"); si no se pudo,
+        # las reglas "once" vuelven al motor: su alerta no quedó registrada
+        once_ids = {rule["id"] for _, rule in batch if rule["once"]}
+        for attempt in range(STORE_RETRIES):
+            try:
+                return await run_write(_store_events, [e for e, _ in batch], once_ids)
+            except Exception as e:
+                print(f"[WARN] No se pudieron guardar {len(batch)} alertas "
+                      f"(intento {attempt + 1}/{STORE_RETRIES}): {type(e).__name__}: {e}")
+                await asyncio.sleep(0.5 * 2 ** attempt)
+        self._lost([rule for _, rule in batch])
+        return None
+
+    def _lost(self, rules: List[Rule]) -> None:
+        self.dropped += len(rules)
+        DROPPED.inc(len(rules))
+        for rule in rules:
+            if rule["once"]:
+                alert_engine.restore(rule)
+
+    async def _post(self, client: httpx.AsyncClient, url: str, event: Dict[str, Any]) -> None:
+        for attempt in range(WEBHOOK_RETRIES + 1):
+            try:
+                r = await client.post(url, json=event)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(2 ** attempt)
+        WEBHOOK_FAILURES.inc()
+        print(f"[WARN] Webhook de la regla {event['rule_id']} falló: {url}")
+
+
+alert_engine = AlertEngine()
+dispatcher = AlertDispatcher()
+
+
+@metrics.registry.collector
+def _alert_metrics() -> Iterable[metrics.Family]:
+    s = alert_engine.stats()
+    yield ("alerts_rules", "gauge", "Reglas de alerta cargadas en este proceso", [({}, s["rules"])])
+    yield ("alerts_queue_depth", "gauge", "Alertas esperando entrega", [({}, s["queued"])])
+
+
+if __name__ == "__main__":
+    # python -m app.alerts bench [reglas] [ticks]: costo por tick según el número de reglas
+    if len(sys.argv) < 2 or sys.argv[1] != "bench":
+        print("Uso: python -m app.alerts bench [reglas] [ticks]")
+        sys.exit(1)
+    import random
+    n_rules = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    n_ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    rnd = random.Random(1)
+    for total in sorted({100, n_rules}):
+        # Niveles repartidos como los pondrían usuarios distintos: el costo por tick
+        # crece con métricas distintas × log(reglas) + disparos, no con las reglas
+        eng = AlertEngine()
+        for i in range(total):
+            if i % 100 == 99:
+                raw = {"kind": "ema_cross", "fast": (5, 9, 12)[i % 3], "slow": (15, 21, 26)[i % 3]}
+            elif i % 3 == 0:
+                raw = {"kind": "pct_change", "level": rnd.uniform(-20, 20), "window": 300 * (1 + i % 2)}
+            elif i % 3 == 1:
+                raw = {"kind": "volatility", "level": rnd.uniform(0.5, 20), "window": 300 * (1 + i % 2)}
+            else:
+                raw = {"kind": "price_cross", "level": rnd.uniform(10, 1000)}
+            eng.add({"id": i + 1, **normalize({"crypto": "BTC-USD", **raw})})
+        price, fired = 100.0, 0
+        start = time.perf_counter()
+        for t in range(n_ticks):
+            price *= 1 + rnd.gauss(0, 0.001)
+            fired += len(eng.evaluate("BTC-USD", t, price))
+        elapsed = time.perf_counter() - start
+        print(f"[INFO] {total} reglas: {elapsed / n_ticks * 1e6:.2f} µs/tick, "
+              f"{fired / n_ticks:.3f} disparos/tick, {eng.stats()['metrics']} métricas")
@@ -0,0 +1,262 @@
+# app/bus.py
+# EventBus (observer) con dos modos:
+# - "sync": emit espera a cada handler en orden (comportamiento original).
+# - "queued": cada suscriptor tiene una cola acotada y sus propios workers;
+#   emit solo encola, así un handler lento no frena la ingesta ni a los demás.
+# Política de desborde por suscriptor: block, drop_oldest o coalesce (último por par).
+# Con concurrency=1 (por defecto) cada suscriptor procesa en orden de llegada.
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+POLICIES = ("block", "drop_oldest", "coalesce")
+
+# Límites superiores (segundos) del histograma de tiempo de proceso
+HISTOGRAM_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def default_key(data: Any) -> Hashable:
+    # Clave de coalescencia: el par del payload/fila
+    if isinstance(data, dict):
+        return data.get("crypto") or data.get("pair")
+    return None
+
+
+class Histogram:
+    def __init__(self, buckets=HISTOGRAM_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        out, acc = [], 0
+        for c in self.counts:
+            acc += c
+            out.append(acc)
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.cumulative())),
+            "sum": round(self.sum, 6),
+            "count": self.count,
+        }
+
+
+class Subscriber:
+    def __init__(
+        self,
+        event: str,
+        handler: Callable[[Any], Any],
+        policy: str,
+        maxsize: int,
+        concurrency: int,
+        key: Callable[[Any], Hashable],
+    ) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Política de EventBus desconocida: {policy!r}")
+        self.event = event
+        self.handler = handler
+        self.name = getattr(handler, "__qualname__", repr(handler))
+        self.policy = policy
+        self.maxsize = maxsize
+        self.concurrency = concurrency
+        self.key = key
+        # Cola de claves; con coalesce la clave es el par y el dato vive en _latest
+        self._order: Deque[Any] = deque()
+        self._latest: Dict[Any, Any] = {}
+        self._enqueued: Dict[Any, float] = {}   # desde cuándo espera cada clave
+        self._seq = 0
+        self._ready: Optional[asyncio.Condition] = None
+        self._workers: List["asyncio.Task[None]"] = []
+        self._busy = 0
+        # Métricas
+        self.processed = 0
+        self.errors = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.latency = Histogram()
+        self.lag = Histogram()   # espera en cola (emit → inicio del handler)
+
+    def depth(self) -> int:
+        return len(self._order)
+
+    async def handle(self, data: Any) -> None:
+        start = time.perf_counter()
+        try:
+            res = self.handler(data)
+            if asyncio.iscoroutine(res):
+                await res
+        except Exception as e:
+            self.errors += 1
+            print(f"[WARN] Handler {self.name} ({self.event}) falló: {type(e).__name__}: {e}")
+        finally:
+            self.processed += 1
+            self.latency.observe(time.perf_counter() - start)
+
+    # 🔹 Modo cola
+    def start(self) -> None:
+        self._ready = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def put(self, data: Any) -> None:
+        cond = self._ready
+        async with cond:
+            if self.policy == "coalesce":
+                k = self.key(data)
+                if k in self._latest:
+                    # Reemplaza el pendiente del mismo par, conserva su lugar en la cola
+                    self._latest[k] = data
+                    self.coalesced += 1
+                    return
+            if len(self._order) >= self.maxsize:
+                if self.policy == "block":
+                    await cond.wait_for(lambda: len(self._order) < self.maxsize)
+                else:
+                    old = self._order.popleft()
+                    self._latest.pop(old, None)
+                    self._enqueued.pop(old, None)
+                    self.dropped += 1
+            if self.policy == "coalesce":
+                k = self.key(data)
+            else:
+                self._seq += 1
+                k = self._seq
+            self._latest[k] = data
+            self._enqueued[k] = time.perf_counter()
+            self._order.append(k)
+            self.max_depth = max(self.max_depth, len(self._order))
+            cond.notify_all()
+
+    async def _work(self) -> None:
+        cond = self._ready
+        while True:
+            async with cond:
+                await cond.wait_for(lambda: bool(self._order))
+                k = self._order.popleft()
+                data = self._latest.pop(k)
+                self.lag.observe(time.perf_counter() - self._enqueued.pop(k))
+                self._busy += 1
+                cond.notify_all()   # despierta a productores bloqueados
+            try:
+                await self.handle(data)
+            finally:
+                async with cond:
+                    self._busy -= 1
+                    cond.notify_all()
+
+    async def join(self) -> None:
+        cond = self._ready
+        async with cond:
+            await cond.wait_for(lambda: not self._order and self._busy == 0)
+
+    def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "event": self.event,
+            "handler": self.name,
+            "policy": self.policy,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "capacity": self.maxsize,
+            "processed": self.processed,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "seconds": self.latency.snapshot(),
+            "lag_seconds": self.lag.snapshot(),
+        }
+
+
+class EventBus:
+    def __init__(self, mode: Optional[str] = None) -> None:
+        self.mode = (mode or os.getenv("EVENT_BUS_MODE", "sync")).lower()
+        if self.mode not in ("sync", "queued"):
+            raise ValueError(f"EVENT_BUS_MODE desconocido: {self.mode!r}")
+        self.default_policy = os.getenv("EVENT_BUS_POLICY", "block")
+        self.default_maxsize = int(os.getenv("EVENT_BUS_QUEUE_SIZE", "1000"))
+        self.default_concurrency = int(os.getenv("EVENT_BUS_CONCURRENCY", "1"))
+        self._listeners: Dict[str, List[Subscriber]] = {}
+        self._running = False
+
+    def on(
+        self,
+        event: str,
+        handler: Callable[[Any], Any],
+        policy: Optional[str] = None,
+        maxsize: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        key: Callable[[Any], Hashable] = default_key,
+    ) -> Subscriber:
+        sub = Subscriber(
+            event,
+            handler,
+            policy or self.default_policy,
+            maxsize or self.default_maxsize,
+            concurrency or self.default_concurrency,
+            key,
+        )
+        self._listeners.setdefault(event, []).append(sub)
+        if self._running:
+            sub.start()
+        return sub
+
+    def start(self) -> None:
+        # Arranca los workers (modo cola); requiere event loop en marcha
+        if self.mode != "queued" or self._running:
+            return
+        self._running = True
+        for sub in self.subscribers():
+            sub.start()
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        # Drena las colas (con límite de tiempo) y detiene los workers
+        if not self._running:
+            return
+        try:
+            await asyncio.wait_for(self.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print("[WARN] EventBus: colas sin drenar al detener")
+        for sub in self.subscribers():
+            sub.stop()
+        self._running = False
+
+    async def join(self) -> None:
+        # Espera a que todas las colas estén vacías y sin trabajo en curso
+        if not self._running:
+            return
+        for sub in self.subscribers():
+            await sub.join()
+
+    async def emit(self, event: str, data: Any) -> None:
+        for sub in self._listeners.get(event, []):
+            if self._running:
+                await sub.put(data)
+            else:
+                await sub.handle(data)
+
+    def subscribers(self) -> List[Subscriber]:
+        return [sub for subs in self._listeners.values() for sub in subs]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "running": self._running,
+                "subscribers": [sub.stats() for sub in self.subscribers()]}
@@ -0,0 +1,130 @@
+# app/cache.py
+# Caché de respuestas JSON (bytes ya serializados) para los endpoints de lectura.
+# Clave: (endpoint, resolución, crypto). Se invalida por par cuando la carga
+# inserta un tick ("price_loaded"), expira por TTL corto, desaloja por LRU y
+# deduplica misses concurrentes (single-flight): N clientes ≈ un cálculo por tick.
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from . import metrics
+
+CacheKey = Tuple[str, str, str]
+
+# crypto de las claves que dependen de todos los pares (ej. /api/table)
+ALL_PAIRS = "*"
+
+
+class ResponseCache:
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None) -> None:
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+        self._entries: "OrderedDict[CacheKey, Tuple[float, bytes]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, "asyncio.Future[bytes]"] = {}
+        self._by_crypto: Dict[str, Set[CacheKey]] = {}
+        # Generación por par: un cálculo iniciado antes de una invalidación no se guarda
+        self._generation: Dict[str, int] = {}
+        self._generation_total = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _gen(self, crypto: str) -> int:
+        if crypto == ALL_PAIRS:
+            return self._generation_total
+        return self._generation.get(crypto, 0)
+
+    def _store(self, key: CacheKey, body: bytes) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, body)
+        self._entries.move_to_end(key)
+        self._by_crypto.setdefault(key[2], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old, _ = self._entries.popitem(last=False)
+            self._by_crypto.get(old[2], set()).discard(old)
+            self.evictions += 1
+
+    def _lookup(self, key: CacheKey) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, body = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self._by_crypto.get(key[2], set()).discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    async def get_or_compute(self, key: CacheKey, compute: Callable[[], Awaitable[bytes]]) -> bytes:
+        body = self._lookup(key)
+        if body is not None:
+            self.hits += 1
+            return body
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            # wait() no cancela `pending` si se cancela esta petición, ni lanza si
+            # se canceló la del líder: en ese caso esta petición calcula por su cuenta
+            await asyncio.wait({pending})
+            if pending.cancelled():
+                return await self.get_or_compute(key, compute)
+            return pending.result()
+        self.misses += 1
+        fut: "asyncio.Future[bytes]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        gen = self._gen(key[2])
+        try:
+            body = await compute()
+        except Exception as e:
+            fut.set_exception(e)
+            # Evita "exception was never retrieved" si nadie más esperaba
+            fut.exception()
+            raise
+        else:
+            fut.set_result(body)
+            if gen == self._gen(key[2]):
+                self._store(key, body)
+            return body
+        finally:
+            # Líder cancelado (cliente desconectado): libera a los que esperaban
+            if not fut.done():
+                fut.cancel()
+            self._inflight.pop(key, None)
+
+    def invalidate(self, crypto: str) -> None:
+        # Entradas del par + las que dependen de todos los pares
+        self._generation[crypto] = self._generation.get(crypto, 0) + 1
+        self._generation_total += 1
+        for c in (crypto, ALL_PAIRS):
+            for key in self._by_crypto.pop(c, set()):
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def on_price_loaded(self, row: Dict) -> None:
+        # Handler del EventBus
+        self.invalidate(row["crypto"])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache()
+
+
+@metrics.registry.collector
+def _cache_metrics() -> Iterable[metrics.Family]:
+    stats = response_cache.stats()
+    yield ("response_cache_entries", "gauge", "Entradas en la caché de respuestas", [({}, stats.pop("entries"))])
+    yield ("response_cache_events_total", "counter", "Aciertos, fallos, esperas single-flight, desalojos e invalidaciones",
+           [({"event": k}, v) for k, v in stats.items()])
@@ -1,33 +1,56 @@
 import asyncio
+import csv
 import httpx
 import os
-from typing import Callable, Dict, List, Any
+import random
+import time
+from typing import Dict, Iterable, List, Any, Optional
+from . import metrics
 from .utils import parse_amount, now_ts, parse_crypto_pair
-from .db import SessionLocal
-from .crud import insert_price_if_changed
-from .collector_db import insert_price  # Coneccion con SQLite
-from decimal import Decimal
+from .bus import EventBus
+from .writer import BatchWriter
+from .scheduler import FetchScheduler
 
 
 COINBASE_BASE = "https://api.coinbase.com/v2/prices"
 
-class EventBus:
-    def __init__(self) -> None:
-        self._listeners: Dict[str, List[Callable[[Any], Any]]] = {}
-
-    def on(self, event: str, handler: Callable[[Any], Any]) -> None:
-        self._listeners.setdefault(event, []).append(handler)
-
-    async def emit(self, event: str, data: Any) -> None:
-        for handler in self._listeners.get(event, []):
-            res = handler(data)
-            if asyncio.iscoroutine(res):
-                await res
-
 event_bus = EventBus()
 
-# Últimos precios para calcular señal B/S
-last_prices: Dict[str, Decimal] = {}
+async def _emit_loaded(rows: List[Dict[str, Any]], buckets: List[Dict[str, Any]]) -> None:
+    # Notifica cada fila realmente insertada en prices (precio cambió)
+    # y el estado final de cada bucket de rollup tocado por el lote
+    for row in rows:
+        await event_bus.emit("price_loaded", row)
+    for bucket in buckets:
+        await event_bus.emit("rollup_updated", bucket)
+
+# Etapa de carga por lotes (ver writer.py); main arranca writer.run()
+writer = BatchWriter(on_flush=_emit_loaded)
+
+# Planificador de peticiones (ver scheduler.py); /api/fetch/stats expone sus contadores
+fetch_scheduler = FetchScheduler()
+
+TRANSFORM_SECONDS = metrics.Histogram("etl_transform_seconds", "Duración de la validación + casting de cada tick")
+
+# 🔹 Métricas leídas al exportar: planificador, EventBus y writer
+@metrics.registry.collector
+def _runtime_metrics() -> Iterable[metrics.Family]:
+    pairs = fetch_scheduler.pairs.items()
+    yield ("etl_fetch_interval_seconds", "gauge", "Intervalo adaptativo actual por par",
+           [({"pair": p}, st.interval) for p, st in pairs])
+    yield ("etl_fetch_missed_ticks_total", "counter", "Ticks no pedidos a tiempo por par",
+           [({"pair": p}, st.missed) for p, st in pairs])
+    yield ("etl_fetch_lag_seconds", "gauge", "Retraso de la última petición respecto a lo planificado",
+           [({"pair": p}, st.lag_last) for p, st in pairs])
+    yield ("etl_writer_pending", "gauge", "Ticks en el buffer del writer", [({}, writer.pending())])
+    subs = [({"event": s.event, "handler": s.name}, s) for s in event_bus.subscribers()]
+    yield ("eventbus_queue_depth", "gauge", "Eventos en cola por suscriptor", [(l, s.depth()) for l, s in subs])
+    yield ("eventbus_processed_total", "counter", "Eventos procesados", [(l, s.processed) for l, s in subs])
+    yield ("eventbus_errors_total", "counter", "Handlers que lanzaron excepción", [(l, s.errors) for l, s in subs])
+    yield ("eventbus_dropped_total", "counter", "Eventos descartados (drop_oldest)", [(l, s.dropped) for l, s in subs])
+    yield ("eventbus_coalesced_total", "counter", "Eventos reemplazados (coalesce)", [(l, s.coalesced) for l, s in subs])
+    yield ("eventbus_handler_seconds", "histogram", "Duración de cada handler", [(l, s.latency) for l, s in subs])
+    yield ("eventbus_lag_seconds", "histogram", "Espera en cola (emit → handler, modo queued)", [(l, s.lag) for l, s in subs])
 
 def get_cryptos_from_env() -> List[str]:
     raw = os.getenv("CRYPTOS", "BTC-USD,ETH-USD,SOL-USD,DOGE-USD")
@@ -45,21 +68,103 @@ async def fetch_price(client: httpx.AsyncClient, pair: str) -> Dict[str, Any]:
     ts = now_ts()
     return {"pair": pair, "amount_str": amount_str, "base": base, "currency": currency, "ts": ts}
 
-async def extraction_loop():
+# 🔹 Fuentes de precio: fetch(pair) devuelve el payload crudo de "price_raw"
+class PriceSource:
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def fetch(self, pair: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+class CoinbaseSource(PriceSource):
+    def __init__(self) -> None:
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        self.client = httpx.AsyncClient()
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+
+    async def fetch(self, pair: str) -> Dict[str, Any]:
+        return await fetch_price(self.client, pair)
+
+class SimulatedSource(PriceSource):
+    """Precios sintéticos (paseo aleatorio) o repetición de ticks grabados.
+
+    replay_path: CSV con columnas pair,amount (p. ej. exportado de prices); cada
+    par recorre sus precios en orden y vuelve a empezar. Sin archivo, cada par
+    parte de start_price y se mueve con ruido gaussiano de desviación `volatility`.
+    """
+
+    def __init__(
+        self,
+        replay_path: Optional[str] = None,
+        start_price: float = 100.0,
+        volatility: float = 0.001,
+        latency: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.start_price = start_price
+        self.volatility = volatility
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.prices: Dict[str, float] = {}
+        self.replay: Dict[str, List[str]] = {}
+        self.position: Dict[str, int] = {}
+        if replay_path:
+            with open(replay_path, newline="") as f:
+                for row in csv.DictReader(f):
+                    self.replay.setdefault(row["pair"].upper(), []).append(row["amount"])
+
+    def _next_amount(self, pair: str) -> str:
+        recorded = self.replay.get(pair)
+        if recorded:
+            i = self.position.get(pair, 0)
+            self.position[pair] = (i + 1) % len(recorded)
+            return recorded[i]
+        price = self.prices.get(pair, self.start_price)
+        price *= 1.0 + self.random.gauss(0.0, self.volatility)
+        self.prices[pair] = price
+        return f"{price:.6f}"
+
+    async def fetch(self, pair: str) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        base, currency = parse_crypto_pair(pair)
+        return {"pair": pair, "amount_str": self._next_amount(pair), "base": base, "currency": currency, "ts": now_ts()}
+
+def make_source() -> PriceSource:
+    # PRICE_SOURCE=coinbase (por defecto) | simulated
+    kind = os.getenv("PRICE_SOURCE", "coinbase").lower()
+    if kind == "simulated":
+        return SimulatedSource(
+            replay_path=os.getenv("SIM_REPLAY_PATH") or None,
+            start_price=float(os.getenv("SIM_START_PRICE", "100")),
+            volatility=float(os.getenv("SIM_VOLATILITY", "0.001")),
+            latency=float(os.getenv("SIM_LATENCY", "0")),
+            seed=int(os.environ["SIM_SEED"]) if os.getenv("SIM_SEED") else None,
+        )
+    if kind != "coinbase":
+        raise ValueError(f"PRICE_SOURCE desconocida: {kind!r}")
+    return CoinbaseSource()
+
+async def extraction_loop(source: Optional[PriceSource] = None):
     cryptos = get_cryptos_from_env()
-    interval = float(os.getenv("FETCH_INTERVAL_SECONDS", "5"))
-    async with httpx.AsyncClient() as client:
-        while True:
-            try:
-                results = await asyncio.gather(*[fetch_price(client, c) for c in cryptos], return_exceptions=True)
-                for res in results:
-                    if isinstance(res, Exception):
-                        continue
-                    await event_bus.emit("price_raw", res)
-            except Exception:
-                # evitar caídas; en producción usar logging
-                pass
-            await asyncio.sleep(interval)
+    source = source or make_source()
+    await source.start()
+
+    async def emit(payload: Dict[str, Any]) -> None:
+        await event_bus.emit("price_raw", payload)
+
+    try:
+        await fetch_scheduler.run(cryptos, source.fetch, emit)
+    finally:
+        await source.close()
 
 # Handlers (observer)
 
@@ -75,40 +180,16 @@ def transform_handler(payload: Dict[str, Any]) -> Dict[str, Any]:
     return payload
 
 def load_handler(payload: Dict[str, Any]) -> None:
-    # Inserta incrementalmente si cambió el precio
-    with SessionLocal() as db:
-        insert_price_if_changed(
-            db,
-            crypto=payload["pair"],
-            amount_str=payload["amount_str"],
-            amount_dec=payload["amount_dec"],
-            currency=payload["currency"],
-            ts=payload["ts"],
-        )
-        # Calcular señal simple y guardar en SQLite
-    base = payload["base"]
-    price = payload["amount_dec"]
-    prev_price = last_prices.get(base)
-    if prev_price is None:
-        signal = '-'
-    elif price > prev_price:
-        signal = 'B'
-    elif price < prev_price:
-        signal = 'S'
-    else:
-        signal = '-'
-    last_prices[base] = price
-
-    # Porcentaje de cambio 24h: opcional, podemos dejar None por ahora
-    change_24h = None
-
-    # Insertar en SQLite
-    insert_price(base, price, signal, change_24h)
+    # Encola el tick; BatchWriter lo inserta en prices (si cambió el precio)
+    # con una transacción por lote.
+    writer.add(payload)
 
 # Al registrar los handlers, encadenamos: price_raw -> transform_handler -> load_handler
 # price_raw llama a transform y luego a load, de forma secuencial.
 async def chain_handler(payload: Dict[str, Any]) -> None:
+    start = time.perf_counter()
     transformed = transform_handler(payload)
+    TRANSFORM_SECONDS.observe(time.perf_counter() - start)
     load_handler(transformed)
 
 def setup_event_chain() -> None:
@@ -1,115 +1,115 @@
 # app/collector_db.py
-import sqlite3
+# Almacén heredado crypto.db (tabla crypto_prices: precio REAL, timestamp texto UTC).
+# Ya no se escribe: ticks, rollups y las tres rutas de la API viven en prices.
+# Solo queda la importación única de su historial (init_db la ejecuta una vez).
+import calendar
 import os
+import sqlite3
+from datetime import datetime
 from decimal import Decimal
-from .utils import parse_amount, now_ts, parse_crypto_pair
-from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
 
-# Ruta de la DB SQLite (una carpeta arriba de app/)
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "crypto.db")
+from sqlalchemy import insert, select
 
-def get_connection():
-    return sqlite3.connect(DB_PATH)
+from . import metrics
 
-# Guardar precio en la DB
-def insert_price(crypto_symbol: str, price_usd: Decimal, signal: str = '-', change_24h: float = None):
-    conn = get_connection()
-    cur = conn.cursor()
+# Ruta de la DB SQLite (por defecto una carpeta arriba de app/)
+DB_PATH = os.getenv("COLLECTOR_DB_PATH") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "crypto.db")
 
-    # Obtener crypto_id
-    cur.execute("SELECT id FROM cryptocurrency WHERE symbol = ?", (crypto_symbol,))
-    result = cur.fetchone()
-    if not result:
-        print(f"[WARN] Crypto {crypto_symbol} no encontrada en la tabla cryptocurrency")
-        conn.close()
-        return
-    crypto_id = result[0]
-
-    # Insertar precio
-    cur.execute("""
-        INSERT INTO crypto_prices (crypto_id, price_usd, signal, change_24h)
-        VALUES (?, ?, ?, ?)
-    """, (crypto_id, float(price_usd), signal, change_24h))
-    conn.commit()
-    conn.close()
-    print(f"[INFO] Insertado: {crypto_symbol}={price_usd}$ signal={signal} change_24h={change_24h}")
-
-# Insertar criptomonedas iniciales
-def insert_cryptos_initial():
-    cryptos = [
-        ("Bitcoin", "BTC"),
-        ("Ethereum", "ETH"),
-        ("Solana", "SOL"),
-        ("Dogecoin", "DOGE")
-    ]
-    conn = get_connection()
-    cur = conn.cursor()
-    for name, symbol in cryptos:
-        cur.execute("INSERT OR IGNORE INTO cryptocurrency (name, symbol) VALUES (?, ?)", (name, symbol))
-    conn.commit()
-    conn.close()
-    print("[INFO] Criptomonedas iniciales insertadas")
-
-
-def fetch_ohlc(crypto: str, resolution: str):
+# PRAGMA user_version de crypto.db tras importar su historial (v1 fue el índice)
+IMPORTED_VERSION = 2
+
+# El mismo tick se escribía en ambos almacenes con segundos de diferencia
+_DUPLICATE_WINDOW = 2
+
+IMPORTED = metrics.Counter("legacy_import_ticks_total", "Ticks importados desde crypto.db", ["pair"])
+
+
+def _amount_str(price: float) -> str:
+    # repr() es el decimal más corto que reproduce el float guardado
+    return format(Decimal(repr(price)), "f")
+
+
+def _epoch(timestamp: str) -> int:
+    return calendar.timegm(datetime.strptime(timestamp[:19], "%Y-%m-%d %H:%M:%S").timetuple())
+
+
+def import_history(chunk: int = 5000) -> int:
+    """Copia a prices los ticks de crypto.db que prices no tiene.
+
+    Se omiten los duplicados (mismo par a ±2 s de un tick existente) y los
+    precios repetidos consecutivos, igual que hace la carga. Después se
+    reconstruyen los rollups desde el primer tick importado.
+    """
+    if not os.path.exists(DB_PATH):
+        return 0
+    from .db import Price, engine
+
+    currency = os.getenv("CURRENCY", "USD").upper()
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    now = datetime.utcnow()
-    if resolution == "second":
-        delta = timedelta(minutes=5)  # últimos 5 minutos
-        group_by = 1
-    elif resolution == "minute":
-        delta = timedelta(hours=1)
-        group_by = 60
-    elif resolution == "hour":
-        delta = timedelta(days=1)
-        group_by = 3600
-    elif resolution == "day":
-        delta = timedelta(days=30)
-        group_by = 86400
-
-    ts_from = int((now - delta).timestamp())
-    c.execute(
-        """
-        SELECT timestamp, price_usd
-        FROM crypto_prices
-        WHERE crypto_id = (SELECT id FROM cryptocurrency WHERE symbol = ?)
-          AND timestamp >= ?
-        ORDER BY timestamp ASC
-        """,
-        (crypto, ts_from)
-    )
-    rows = c.fetchall()
-    conn.close()
-
-    # Convertir a OHLC por intervalo de seconds = group_by
-    candles = []
-    bucket = []
-    last_ts = None
-    for ts, price in rows:
-        ts_bucket = ts // group_by * group_by
-        if last_ts is None:
-            last_ts = ts_bucket
-        if ts_bucket != last_ts:
-            if bucket:
-                candles.append({
-                    "ts": last_ts,
-                    "open": bucket[0],
-                    "high": max(bucket),
-                    "low": min(bucket),
-                    "close": bucket[-1]
-                })
-            bucket = []
-            last_ts = ts_bucket
-        bucket.append(price)
-    if bucket:
-        candles.append({
-            "ts": last_ts,
-            "open": bucket[0],
-            "high": max(bucket),
-            "low": min(bucket),
-            "close": bucket[-1]
-        })
-
-    return candles
\ No newline at end of file
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= IMPORTED_VERSION:
+            return 0
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        total = 0
+        first_ts: Optional[int] = None
+        if {"crypto_prices", "cryptocurrency"} <= tables:
+            symbols = [s for (s,) in conn.execute("SELECT DISTINCT symbol FROM cryptocurrency ORDER BY symbol")]
+            for symbol in symbols:
+                pair = f"{symbol.upper()}-{currency}"
+                legacy = conn.execute("""
+                    SELECT p.timestamp, p.price_usd
+                    FROM crypto_prices p JOIN cryptocurrency c ON c.id = p.crypto_id
+                    WHERE c.symbol = ?
+                    ORDER BY p.timestamp, p.id
+                """, (symbol,)).fetchall()
+                if not legacy:
+                    continue
+                lo, hi = _epoch(legacy[0][0]), _epoch(legacy[-1][0])
+                with engine.connect() as db:
+                    existing = set(db.execute(select(Price.ts).where(
+                        Price.crypto == pair,
+                        Price.ts >= lo - _DUPLICATE_WINDOW,
+                        Price.ts <= hi + _DUPLICATE_WINDOW,
+                    )).scalars())
+                rows: List[Dict[str, Any]] = []
+                last = None
+                for timestamp, price in legacy:
+                    ts = _epoch(timestamp)
+                    amount_str = _amount_str(price)
+                    if amount_str == last:
+                        continue
+                    last = amount_str
+                    if any(ts + d in existing for d in range(-_DUPLICATE_WINDOW, _DUPLICATE_WINDOW + 1)):
+                        continue
+                    rows.append({
+                        "crypto": pair, "amount_str": amount_str, "amount_dec": Decimal(amount_str),
+                        "currency": currency, "ts": ts, "fetched_at": ts,
+                    })
+                for i in range(0, len(rows), chunk):
+                    with engine.begin() as db:
+                        db.execute(insert(Price), rows[i:i + chunk])
+                IMPORTED.inc(len(rows), pair=pair)
+                if rows:
+                    first_ts = rows[0]["ts"] if first_ts is None else min(first_ts, rows[0]["ts"])
+                    print(f"[INFO] crypto.db → prices: {len(rows)} ticks de {pair}")
+                total += len(rows)
+        if first_ts is not None:
+            from .rollups import backfill
+            backfill(first_ts)
+        conn.execute(f"PRAGMA user_version = {IMPORTED_VERSION}")
+        conn.commit()
+        print(f"[INFO] Historial de crypto.db importado: {total} ticks")
+        return total
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # python -m app.collector_db import  (init_db también lo hace una sola vez)
+    import sys
+    if len(sys.argv) < 2 or sys.argv[1] != "import":
+        print("Uso: python -m app.collector_db import")
+        sys.exit(1)
+    from .db import init_db
+    init_db()
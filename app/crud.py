@@ -1,41 +1,152 @@
-from sqlalchemy import select, func, desc
+from sqlalchemy import select, func, desc, insert
 from sqlalchemy.orm import Session
+from sqlalchemy.engine import Connection
 from decimal import Decimal
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Dict, Any, Iterable, Iterator
 from .db import Price
+from .metrics import timed
+import os
+import threading
 import time
 
-def last_price_for_crypto(db: Session, crypto: str) -> Optional[Price]:
-    stmt = select(Price).where(Price.crypto == crypto).order_by(desc(Price.ts)).limit(1)
-    return db.execute(stmt).scalars().first()
+# Filas por bloque en las lecturas de series (cursor en streaming, no .all())
+READ_CHUNK_ROWS = int(os.getenv("READ_CHUNK_ROWS", "5000"))
 
-def insert_price_if_changed(db: Session, crypto: str, amount_str: str, amount_dec: Decimal, currency: str, ts: int) -> Optional[Price]:
-    # Evitar insertar si no cambió el precio vs el último insertado
-    last = last_price_for_crypto(db, crypto)
-    if last and last.amount_str == amount_str:
-        return None
-    now = int(time.time())
-    p = Price(crypto=crypto, amount_str=amount_str, amount_dec=amount_dec, currency=currency, ts=ts, fetched_at=now)
-    db.add(p)
-    db.commit()
-    db.refresh(p)
-    return p
-
-def stats_last_hour(db: Session, crypto: str) -> Tuple[Optional[Decimal], Optional[Decimal], Optional[Decimal]]:
-    one_hour_ago = int(time.time()) - 3600
-    stmt = select(
-        func.max(Price.amount_dec),
-        func.min(Price.amount_dec),
-        func.avg(Price.amount_dec),
-    ).where(Price.crypto == crypto, Price.ts >= one_hour_ago)
-    result = db.execute(stmt).one_or_none()
-    if not result:
-        return (None, None, None)
-    return result
+# 🔹 Caché en memoria del último precio insertado por par (evita el SELECT por tick).
+# Se precarga desde la DB al iniciar y solo se actualiza tras un commit exitoso,
+# así se mantiene consistente con la tabla prices aunque falle una inserción.
+_last_price_cache: Dict[str, str] = {}
+_cache_lock = threading.Lock()
+_cache_warmed = False
 
-def fetch_series(db: Session, crypto: str, since_ts: int) -> List[Tuple[int, Decimal, str]]:
-    # Devuelve (ts, amount_dec, amount_str)
-    stmt = select(Price.ts, Price.amount_dec, Price.amount_str).where(
+@timed
+def warm_last_price_cache(db: Session) -> int:
+    """Carga en la caché el último amount_str de cada par presente en prices."""
+    global _cache_warmed
+    latest = (
+        select(Price.crypto, func.max(Price.ts).label("ts"))
+        .group_by(Price.crypto)
+        .subquery()
+    )
+    stmt = (
+        select(Price.crypto, Price.amount_str)
+        .join(latest, (Price.crypto == latest.c.crypto) & (Price.ts == latest.c.ts))
+        .order_by(Price.id.asc())
+    )
+    rows = db.execute(stmt).all()
+    with _cache_lock:
+        _last_price_cache.clear()
+        for crypto, amount_str in rows:
+            # Con empates en ts gana el último insertado (id mayor)
+            _last_price_cache[crypto] = amount_str
+        _cache_warmed = True
+    return len(_last_price_cache)
+
+# 🔹 Sentencias de las consultas calientes (reutilizadas por db.check_query_plans)
+def _last_amount_stmt(crypto: str):
+    return select(Price.amount_str).where(Price.crypto == crypto).order_by(desc(Price.ts)).limit(1)
+
+def _series_stmt(crypto: str, since_ts: int):
+    return select(Price.ts, Price.amount_dec, Price.amount_str).where(
         Price.crypto == crypto, Price.ts >= since_ts
     ).order_by(Price.ts.asc())
-    return [(row[0], row[1], row[2]) for row in db.execute(stmt).all()]
+
+def _series_range_stmt(crypto: str, since_ts: int, until_ts: int):
+    return select(Price.ts, Price.amount_str).where(
+        Price.crypto == crypto, Price.ts >= since_ts, Price.ts <= until_ts
+    ).order_by(Price.ts.asc())
+
+# 🔹 Variantes multi-par: una sola pasada por el índice (crypto, ts) para N pares
+def _series_many_stmt(cryptos: List[str], since_ts: int):
+    return select(Price.crypto, Price.ts, Price.amount_dec, Price.amount_str).where(
+        Price.crypto.in_(cryptos), Price.ts >= since_ts
+    ).order_by(Price.crypto.asc(), Price.ts.asc())
+
+def hot_queries() -> Dict[str, Tuple[Any, str]]:
+    # nombre -> (sentencia, índice que debe aparecer en el plan)
+    since = int(time.time()) - 3600
+    pairs = ["BTC-USD", "ETH-USD"]
+    return {
+        "last_amount_str": (_last_amount_stmt("BTC-USD"), "ix_prices_crypto_ts"),
+        "fetch_series": (_series_stmt("BTC-USD", since), "ix_prices_crypto_ts"),
+        "iter_series": (_series_range_stmt("BTC-USD", since, since + 3600), "ix_prices_crypto_ts"),
+        "fetch_series_many": (_series_many_stmt(pairs, since), "ix_prices_crypto_ts"),
+    }
+
+def _last_amount_str(conn: Connection, crypto: str) -> Optional[str]:
+    # Sin precarga (scripts, benchmarks): se consulta la DB una vez por par y lote
+    return conn.execute(_last_amount_stmt(crypto)).scalar()
+
+@timed
+def changed_rows(conn: Connection, payloads: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filtra un lote de payloads y deja solo los que cambian el precio.
+
+    Compara contra la caché y contra los precios ya aceptados dentro del mismo lote.
+    """
+    now = int(time.time())
+    pending: Dict[str, Optional[str]] = {}
+    rows: List[Dict[str, Any]] = []
+    for p in payloads:
+        crypto = p["pair"]
+        if crypto in pending:
+            last_str = pending[crypto]
+        else:
+            with _cache_lock:
+                last_str = _last_price_cache.get(crypto)
+                warmed = _cache_warmed
+            if last_str is None and not warmed:
+                last_str = _last_amount_str(conn, crypto)
+        if last_str == p["amount_str"]:
+            continue
+        pending[crypto] = p["amount_str"]
+        rows.append({
+            "crypto": crypto,
+            "amount_str": p["amount_str"],
+            "amount_dec": p["amount_dec"],
+            "currency": p["currency"],
+            "ts": p["ts"],
+            "fetched_at": now,
+        })
+    return rows
+
+@timed
+def insert_prices_batch(conn: Connection, rows: List[Dict[str, Any]]) -> None:
+    # executemany dentro de la transacción del llamador (sin commit aquí)
+    if rows:
+        conn.execute(insert(Price), rows)
+
+def remember_last_prices(rows: Iterable[Dict[str, Any]]) -> None:
+    # Llamar solo después del commit del lote
+    with _cache_lock:
+        for r in rows:
+            _last_price_cache[r["crypto"]] = r["amount_str"]
+
+def stream_rows(db: Session, stmt) -> Iterator[Any]:
+    # Lee el resultado en bloques de READ_CHUNK_ROWS: la memoria depende del bloque,
+    # no del tamaño de la ventana pedida
+    result = db.execute(stmt, execution_options={"stream_results": True, "yield_per": READ_CHUNK_ROWS})
+    for part in result.partitions():
+        yield from part
+
+@timed
+def fetch_series(db: Session, crypto: str, since_ts: int) -> List[Tuple[int, Decimal, str]]:
+    # Devuelve (ts, amount_dec, amount_str); para ventanas grandes usar iter_series
+    return [(ts, amount_dec, amount_str) for ts, amount_dec, amount_str in stream_rows(db, _series_stmt(crypto, since_ts))]
+
+def iter_series(db: Session, crypto: str, since_ts: int, until_ts: int) -> Iterator[Tuple[int, str]]:
+    # (ts, amount_str) en [since_ts, until_ts], leídos del cursor sin armar la lista
+    for ts, amount_str in stream_rows(db, _series_range_stmt(crypto, since_ts, until_ts)):
+        yield ts, amount_str
+
+def iter_series_many(db: Session, cryptos: List[str], since_ts: int) -> Iterator[Tuple[str, int, Decimal, str]]:
+    # (crypto, ts, amount_dec, amount_str) ordenado por par y ts
+    for crypto, ts, amount_dec, amount_str in stream_rows(db, _series_many_stmt(cryptos, since_ts)):
+        yield crypto, ts, amount_dec, amount_str
+
+@timed
+def fetch_series_many(db: Session, cryptos: List[str], since_ts: int) -> Dict[str, List[Tuple[int, Decimal, str]]]:
+    # {crypto: [(ts, amount_dec, amount_str)]}; cada par presente aunque no tenga ticks
+    out: Dict[str, List[Tuple[int, Decimal, str]]] = {c: [] for c in cryptos}
+    for crypto, ts, amount_dec, amount_str in iter_series_many(db, cryptos, since_ts):
+        out[crypto].append((ts, amount_dec, amount_str))
+    return out
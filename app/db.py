@@ -1,36 +1,133 @@
-from sqlalchemy import create_engine, Integer, String, Numeric, BigInteger, text
+from sqlalchemy import create_engine, Integer, String, Numeric, BigInteger, Float, Boolean, Index, Text, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, mapped_column, Mapped
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, make_url
 from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 import os
 
 # URL de la base de datos (si no se define en el entorno, usa SQLite por defecto)
 DB_URL = os.getenv("DB_URL", "sqlite:///./crypto_prices.sqlite")
 
-engine: Engine = create_engine(DB_URL, echo=False, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+# Hilos (y conexiones) para consultas fuera del event loop (ver executor.py)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+def _pool_options(url: str) -> dict:
+    # SQLite en memoria usa un pool estático que no acepta tamaño
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite" and u.database in (None, "", ":memory:"):
+        return {}
+    # +1: conexión de larga vida del writer
+    return {"pool_size": DB_POOL_SIZE + 1, "max_overflow": DB_POOL_SIZE}
+
+engine: Engine = create_engine(DB_URL, echo=False, future=True, **_pool_options(DB_URL))
+# expire_on_commit=False: tras el commit no se recarga el objeto (evita el refresh por tick)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False, future=True)
 
 class Base(DeclarativeBase):
     pass
 
 class Price(Base):
     __tablename__ = "prices"
+    # Todas las consultas calientes filtran por crypto y recorren/ordenan por ts
+    __table_args__ = (Index("ix_prices_crypto_ts", "crypto", "ts"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    crypto: Mapped[str] = mapped_column(String(32), index=True)       # ej: BTC-USD
+    crypto: Mapped[str] = mapped_column(String(32))                   # ej: BTC-USD
     amount_str: Mapped[str] = mapped_column(String(64))               # precio exacto string
     amount_dec: Mapped[Decimal] = mapped_column(Numeric(36, 18))      # precio como Decimal
-    currency: Mapped[str] = mapped_column(String(8), index=True)      # USD (desde el par)
-    ts: Mapped[int] = mapped_column(BigInteger, index=True)           # época (segundos)
-    fetched_at: Mapped[int] = mapped_column(BigInteger, index=True)   # época (segundos)
+    currency: Mapped[str] = mapped_column(String(8))                  # USD (desde el par)
+    ts: Mapped[int] = mapped_column(BigInteger)                       # época (segundos)
+    fetched_at: Mapped[int] = mapped_column(BigInteger)               # época (segundos)
+
+# 🔹 Rollups OHLC pre-agregados (minuto/hora/día), se actualizan al cargar cada lote
+class RollupMixin:
+    crypto: Mapped[str] = mapped_column(String(32), primary_key=True)
+    bucket: Mapped[int] = mapped_column(BigInteger, primary_key=True)   # inicio del intervalo (época)
+    open: Mapped[Decimal] = mapped_column(Numeric(36, 18))
+    high: Mapped[Decimal] = mapped_column(Numeric(36, 18))
+    low: Mapped[Decimal] = mapped_column(Numeric(36, 18))
+    close: Mapped[Decimal] = mapped_column(Numeric(36, 18))
+    open_ts: Mapped[int] = mapped_column(BigInteger)                     # ts del tick de apertura
+    close_ts: Mapped[int] = mapped_column(BigInteger)                    # ts del tick de cierre
+    sum: Mapped[Decimal] = mapped_column(Numeric(36, 18))
+    count: Mapped[int] = mapped_column(Integer)
+
+class PriceMinute(RollupMixin, Base):
+    __tablename__ = "prices_1m"
+
+class PriceHour(RollupMixin, Base):
+    __tablename__ = "prices_1h"
+
+class PriceDay(RollupMixin, Base):
+    __tablename__ = "prices_1d"
+
+# 🔹 Alertas (alerts.py): reglas registradas por la API y eventos disparados.
+# Viven en la DB para que cualquier worker pueda registrarlas y leerlas; solo el
+# colector las evalúa
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    crypto: Mapped[str] = mapped_column(String(32))
+    kind: Mapped[str] = mapped_column(String(16))                     # price_cross | pct_change | ema_cross | volatility
+    level: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    direction: Mapped[str] = mapped_column(String(8))                 # up | down | any
+    window: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)   # segundos (pct_change, volatility)
+    fast: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)     # períodos (ema_cross)
+    slow: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    webhook: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)
+    once: Mapped[bool] = mapped_column(Boolean, default=False)
+    created_at: Mapped[int] = mapped_column(BigInteger)
+
+class AlertEvent(Base):
+    __tablename__ = "alert_events"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    rule_id: Mapped[int] = mapped_column(Integer)
+    crypto: Mapped[str] = mapped_column(String(32))
+    ts: Mapped[int] = mapped_column(BigInteger)
+    payload: Mapped[str] = mapped_column(Text)                         # JSON del evento
+
+# 🔹 Migraciones versionadas (SQLite, PRAGMA user_version): (versión, sentencias)
+MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        "CREATE INDEX IF NOT EXISTS ix_prices_crypto_ts ON prices (crypto, ts)",
+        # Índices de una columna: no los usa ninguna consulta y encarecen cada insert
+        "DROP INDEX IF EXISTS ix_prices_crypto",
+        "DROP INDEX IF EXISTS ix_prices_ts",
+        "DROP INDEX IF EXISTS ix_prices_currency",
+        "DROP INDEX IF EXISTS ix_prices_fetched_at",
+    ]),
+]
+
+def migrate() -> int:
+    """Aplica las migraciones pendientes y devuelve la versión final del esquema."""
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        for target, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            for sql in statements:
+                conn.exec_driver_sql(sql)
+            conn.exec_driver_sql(f"PRAGMA user_version = {target}")
+            version = target
+            print(f"[INFO] Migración de esquema aplicada: v{target}")
+    return version
 
 def init_db() -> None:
-    """Crea las tablas y aplica PRAGMAs solo si es SQLite."""
+    """Crea las tablas, aplica migraciones y PRAGMAs solo si es SQLite."""
+    if engine.dialect.name == "sqlite":
+        # Solo tiene efecto en una base nueva (las existentes: python -m app.retention vacuum)
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.commit()
     Base.metadata.create_all(bind=engine)
     if engine.dialect.name == "sqlite":
+        migrate()
         with engine.begin() as conn:
             conn.exec_driver_sql("PRAGMA journal_mode=WAL;")
             conn.exec_driver_sql("PRAGMA synchronous=NORMAL;")
             conn.exec_driver_sql("PRAGMA foreign_keys=ON;")
+    # Importación única del historial del almacén heredado crypto.db
+    from .collector_db import import_history
+    import_history()
 
 def test_connection() -> None:
     """Prueba de conexión y muestra el dialecto. Ayuda a diagnosticar errores DBAPI."""
@@ -43,3 +140,31 @@ def test_connection() -> None:
         if hasattr(e, "orig"):
             print(f"🔎 Driver original: {repr(e.orig)}")
         raise
+
+def check_query_plans() -> Dict[str, str]:
+    """Ejecuta EXPLAIN QUERY PLAN sobre las consultas calientes y verifica el índice usado."""
+    from .crud import hot_queries
+
+    if engine.dialect.name != "sqlite":
+        print("ℹ️  EXPLAIN QUERY PLAN solo se verifica en SQLite")
+        return {}
+    plans: Dict[str, str] = {}
+    failed = []
+    with engine.connect() as conn:
+        for name, (stmt, expected) in hot_queries().items():
+            sql = str(stmt.compile(engine, compile_kwargs={"literal_binds": True}))
+            detail = " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+            plans[name] = detail
+            if expected not in detail or "TEMP B-TREE" in detail:
+                failed.append(name)
+    for name, detail in plans.items():
+        print(f"{'❌' if name in failed else '✅'} {name}: {detail}")
+    if failed:
+        raise RuntimeError(f"Consultas sin el índice esperado: {', '.join(failed)}")
+    return plans
+
+if __name__ == "__main__":
+    # python -m app.db  -> prueba de conexión + verificación de planes de consulta
+    test_connection()
+    init_db()
+    check_query_plans()
@@ -0,0 +1,102 @@
+# app/downsample.py
+# Reducción de series en el servidor para rangos arbitrarios (?from&to&max_points):
+# - pick_resolution(): el nivel más grueso (menos filas que leer) que aún tiene
+#   al menos max_points buckets en el rango; nunca más fino que el pedido.
+# - lttb(): Largest-Triangle-Three-Buckets en streaming, con buckets de tiempo
+#   fijos sobre [start, end]: solo guarda dos buckets a la vez, la serie completa
+#   nunca se materializa. Los puntos elegidos conservan su precio exacto (string).
+# - merge_candles(): velas OHLC fusionadas en buckets más anchos (exacto, sin muestreo).
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+RESOLUTIONS: Dict[str, int] = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+DEFAULT_MAX_POINTS = 1000
+MAX_POINTS = 10000
+
+Point = Dict[str, Any]   # {"ts": int, "price": str}
+
+
+def pick_resolution(finest: str, start: int, end: int, max_points: int) -> str:
+    span = max(1, end - start)
+    allowed = [r for r, size in RESOLUTIONS.items() if size >= RESOLUTIONS[finest]]
+    for res in reversed(allowed):
+        if span / RESOLUTIONS[res] >= max_points:
+            return res
+    return finest
+
+
+def _avg(bucket: List[Point]) -> Tuple[float, float]:
+    return (
+        sum(p["ts"] for p in bucket) / len(bucket),
+        sum(float(p["price"]) for p in bucket) / len(bucket),
+    )
+
+
+def _largest_triangle(a: Point, bucket: List[Point], nxt: Tuple[float, float]) -> Point:
+    # Punto del bucket que forma el triángulo de mayor área con `a` y el promedio siguiente
+    ax, ay = a["ts"], float(a["price"])
+    cx, cy = nxt
+    best, best_area = bucket[0], -1.0
+    for p in bucket:
+        area = abs((ax - cx) * (float(p["price"]) - ay) - (ax - p["ts"]) * (cy - ay))
+        if area > best_area:
+            best, best_area = p, area
+    return best
+
+
+def lttb(points: Iterable[Point], start: int, end: int, max_points: int) -> Iterator[Point]:
+    """Puntos en orden de ts; emite como máximo ~max_points (primero y último incluidos)."""
+    width = max(1.0, (end - start) / max(1, max_points - 2))
+    selected: Optional[Point] = None    # último punto emitido ("a")
+    pending: List[Point] = []           # bucket completo, esperando el promedio del siguiente
+    current: List[Point] = []
+    current_idx = None
+    for p in points:
+        if selected is None:
+            selected = p
+            yield p
+            continue
+        idx = int((p["ts"] - start) // width)
+        if current and idx != current_idx:
+            if pending:
+                selected = _largest_triangle(selected, pending, _avg(current))
+                yield selected
+            pending, current = current, []
+        current.append(p)
+        current_idx = idx
+    if not current:
+        # Solo había un punto (o ninguno)
+        return
+    last = current.pop()
+    if pending:
+        selected = _largest_triangle(selected, pending, _avg(current) if current else (last["ts"], float(last["price"])))
+        yield selected
+    if current:
+        yield _largest_triangle(selected, current, (last["ts"], float(last["price"])))
+    yield last
+
+
+def merge_candles(candles: Iterable[Dict[str, Any]], width: int) -> Iterator[Dict[str, Any]]:
+    """Fusiona velas consecutivas en buckets alineados de `width` segundos."""
+    merged: Optional[Dict[str, Any]] = None
+    for c in candles:
+        bucket = c["ts"] // width * width
+        if merged is not None and merged["ts"] == bucket:
+            if float(c["high"]) > float(merged["high"]):
+                merged["high"] = c["high"]
+            if float(c["low"]) < float(merged["low"]):
+                merged["low"] = c["low"]
+            merged["close"] = c["close"]
+            continue
+        if merged is not None:
+            yield merged
+        merged = {**c, "ts": bucket}
+    if merged is not None:
+        yield merged
+
+
+def candle_width(source: str, start: int, end: int, max_points: int) -> int:
+    # Múltiplo del tamaño del nivel fuente que deja como máximo max_points velas
+    # (max_points - 1: el rango casi nunca empieza alineado a un bucket)
+    size = RESOLUTIONS[source]
+    needed = -(-max(1, end - start) // (max_points - 1))
+    return max(1, -(-needed // size)) * size
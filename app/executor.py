@@ -0,0 +1,30 @@
+# app/executor.py
+# Ejecutores acotados para sacar el trabajo de DB del event loop:
+# - lecturas de la API en un pool de DB_POOL_SIZE hilos
+# - escrituras del writer en un único hilo (SQLite admite un escritor a la vez)
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, TypeVar
+
+from .db import DB_POOL_SIZE
+
+T = TypeVar("T")
+
+read_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db-read")
+write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+
+async def run_db(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(read_executor, partial(fn, *args, **kwargs))
+
+
+async def run_write(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(write_executor, partial(fn, *args, **kwargs))
+
+
+def shutdown() -> None:
+    read_executor.shutdown(wait=False, cancel_futures=True)
+    write_executor.shutdown(wait=True)
@@ -0,0 +1,204 @@
+# app/export.py
+# Lecturas masivas del historial de ticks:
+# - Exportación incremental a Parquet particionado (pair=.../date=.../part-*.parquet)
+#   desde prices: cada pasada solo escribe los ids posteriores a la anterior.
+# - Stream de rangos [from, to] para uno o más pares en NDJSON o Arrow IPC,
+#   leído en bloques (yield_per) sin cargar el resultado completo en memoria.
+# pyarrow es opcional: sin él no hay Parquet ni Arrow IPC (NDJSON sigue disponible).
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Sequence, Tuple
+
+from sqlalchemy import Float, cast, select
+
+from .db import Price, engine
+from .executor import run_db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependencia opcional
+    pa = None
+    pq = None
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "export"))
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "100000"))
+HISTORY_CHUNK = int(os.getenv("HISTORY_CHUNK", "10000"))
+
+_STATE_FILE = "_state.json"
+
+# (crypto, ts, precio exacto, precio float64)
+HistoryRow = Tuple[str, int, str, float]
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def _schema() -> "pa.Schema":
+    return pa.schema([
+        ("crypto", pa.string()),
+        ("ts", pa.int64()),
+        ("price", pa.string()),       # string exacto del tick
+        ("price_f64", pa.float64()),  # para análisis numérico
+    ])
+
+
+def _batch(rows: Sequence[HistoryRow]) -> "pa.RecordBatch":
+    crypto, ts, price, price_f64 = zip(*rows) if rows else ((), (), (), ())
+    return pa.RecordBatch.from_arrays(
+        [pa.array(crypto, pa.string()), pa.array(ts, pa.int64()),
+         pa.array(price, pa.string()), pa.array(price_f64, pa.float64())],
+        schema=_schema(),
+    )
+
+
+# 🔹 Exportación incremental a Parquet
+def _load_state(export_dir: str) -> Dict[str, Any]:
+    path = os.path.join(export_dir, _STATE_FILE)
+    if not os.path.exists(path):
+        return {"last_id": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(export_dir: str, state: Dict[str, Any]) -> None:
+    # Escritura atómica: un corte a mitad no deja el estado a medias
+    path = os.path.join(export_dir, _STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def export_incremental(export_dir: str = EXPORT_DIR, chunk: int = EXPORT_CHUNK) -> int:
+    """Escribe en Parquet los ticks con id > último exportado; devuelve cuántos.
+
+    Un archivo por (par, día) tocado en cada bloque, nombrado por el primer id:
+    si una pasada se corta, la siguiente reescribe los mismos archivos.
+    """
+    if not available():
+        raise RuntimeError("pyarrow no está instalado")
+    os.makedirs(export_dir, exist_ok=True)
+    state = _load_state(export_dir)
+    stmt = select(
+        Price.id, Price.crypto, Price.ts, Price.amount_str, cast(Price.amount_dec, Float)
+    ).where(Price.id > state["last_id"]).order_by(Price.id.asc())
+    total = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk).execute(stmt)
+        for part in result.partitions(chunk):
+            groups: Dict[Tuple[str, str], List[HistoryRow]] = {}
+            first_ids: Dict[Tuple[str, str], int] = {}
+            for pid, crypto, ts, amount_str, price in part:
+                key = (crypto, time.strftime("%Y-%m-%d", time.gmtime(ts)))
+                groups.setdefault(key, []).append((crypto, ts, amount_str, price))
+                first_ids.setdefault(key, pid)
+            for (crypto, date), rows in groups.items():
+                folder = os.path.join(export_dir, f"pair={crypto}", f"date={date}")
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f"part-{first_ids[(crypto, date)]:012d}.parquet")
+                pq.write_table(pa.Table.from_batches([_batch(rows)]), path + ".tmp", compression="zstd")
+                os.replace(path + ".tmp", path)
+            state["last_id"] = part[-1][0]
+            state["exported_at"] = int(time.time())
+            _save_state(export_dir, state)
+            total += len(part)
+    return total
+
+
+async def export_loop() -> None:
+    # EXPORT_INTERVAL_SECONDS > 0 activa la exportación periódica (solo lee de la DB)
+    interval = float(os.getenv("EXPORT_INTERVAL_SECONDS", "0"))
+    if interval <= 0:
+        return
+    if not available():
+        print("[WARN] EXPORT_INTERVAL_SECONDS definido pero pyarrow no está instalado")
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            t0 = time.monotonic()
+            n = await run_db(export_incremental)
+            if n:
+                print(f"[INFO] Exportados {n} ticks a Parquet en {time.monotonic() - t0:.1f}s")
+        except Exception as e:
+            print(f"[WARN] Exportación falló: {type(e).__name__}: {e}")
+
+
+# 🔹 Stream de historial [from, to]
+def iter_history(cryptos: List[str], ts_from: int, ts_to: int, chunk: int = HISTORY_CHUNK) -> Iterator[List[HistoryRow]]:
+    # Un recorrido del índice (crypto, ts) por par, ya ordenado: sin ordenar en memoria
+    stmt = select(
+        Price.crypto, Price.ts, Price.amount_str, cast(Price.amount_dec, Float)
+    ).where(
+        Price.crypto.in_(cryptos), Price.ts >= ts_from, Price.ts <= ts_to
+    ).order_by(Price.crypto.asc(), Price.ts.asc())
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk).execute(stmt)
+        for part in result.partitions(chunk):
+            yield [tuple(row) for row in part]
+
+
+def ndjson_chunk(rows: List[HistoryRow]) -> bytes:
+    return "".join(
+        f'{{"crypto":"{c}","ts":{ts},"price":"{p}"}}\n' for c, ts, p, _ in rows
+    ).encode()
+
+
+class ArrowStreamEncoder:
+    """Arrow IPC (formato stream): el esquema en el primer bloque y luego un RecordBatch por bloque."""
+
+    def __init__(self) -> None:
+        self.sink = io.BytesIO()
+        self.writer = pa.ipc.new_stream(self.sink, _schema())
+
+    def _take(self) -> bytes:
+        # Se vacía el buffer tras cada bloque: la memoria no crece con el rango
+        data = self.sink.getvalue()
+        self.sink.seek(0)
+        self.sink.truncate()
+        return data
+
+    def encode(self, rows: List[HistoryRow]) -> bytes:
+        self.writer.write_batch(_batch(rows))
+        return self._take()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self._take()
+
+
+async def stream_history(cryptos: List[str], ts_from: int, ts_to: int, fmt: str) -> AsyncIterator[bytes]:
+    # Cada bloque se lee en el pool de lectura (executor.py): el event loop no se bloquea
+    rows_iter = iter_history(cryptos, ts_from, ts_to)
+    done = object()
+    encoder = ArrowStreamEncoder() if fmt == "arrow" else None
+    try:
+        while True:
+            rows = await run_db(next, rows_iter, done)
+            if rows is done:
+                break
+            yield encoder.encode(rows) if encoder else ndjson_chunk(rows)
+        if encoder:
+            yield encoder.close()
+    finally:
+        await run_db(rows_iter.close)
+
+
+if __name__ == "__main__":
+    # python -m app.export run [directorio]
+    if len(sys.argv) < 2 or sys.argv[1] != "run":
+        print("Uso: python -m app.export run [directorio]")
+        sys.exit(1)
+    if not available():
+        print("pyarrow no está instalado")
+        sys.exit(1)
+    from .db import init_db
+    init_db()
+    t0 = time.time()
+    n = export_incremental(sys.argv[2] if len(sys.argv) > 2 else EXPORT_DIR)
+    print(f"[INFO] Exportados {n} ticks en {time.time() - t0:.1f}s")
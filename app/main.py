@@ -1,17 +1,27 @@
-import os, asyncio, secrets
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+import os, asyncio, secrets, time
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 
 from .db import init_db, SessionLocal
-from .collector import extraction_loop, setup_event_chain, get_cryptos_from_env
-from .collector_db import insert_cryptos_initial
-from .collector_db import fetch_ohlc  # helper que consultará SQLite
-from .aggregator import table_row, arrays, ohlc   # 🔹 ahora importamos ohlc
-from .schemas import TableResponse, TableRow, ArrayResponse, ArrayPoint
+from .crud import warm_last_price_cache, fetch_series_many
+from .collector import extraction_loop, setup_event_chain, get_cryptos_from_env, writer, event_bus, fetch_scheduler
+from .rolling import rolling_stats
+from .stream import broadcaster, push_tick, push_bucket
+from .cache import response_cache, ALL_PAIRS, CacheKey
+from . import wire, metrics, profiler, roles, ring
+from .ring import tick_ring
+from .executor import run_db, run_write, shutdown as shutdown_executors
+from .retention import retention_loop
+from . import export
+from .aggregator import arrays, arrays_many, arrays_range, ohlc, ohlc_range, price_str   # 🔹 ahora importamos ohlc
+from .downsample import DEFAULT_MAX_POINTS, MAX_POINTS
+from .schemas import TableResponse, TableRow, ArrayResponse, AlertRuleIn
+from . import alerts
+from .alerts import alert_engine
 
 # 🔹 Cargar variables de entorno
 load_dotenv()
@@ -33,52 +43,405 @@ def get_current_user(credentials: HTTPBasicCredentials = Depends(security)):
         )
     return credentials.username
 
+# 🔹 Latencia por ruta (plantilla de la ruta, no la URL: cardinalidad acotada)
+HTTP_SECONDS = metrics.Histogram("http_request_seconds", "Latencia de las peticiones HTTP", ["method", "route", "status"])
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=response.status_code)
+    return response
+
 # 🔹 Servir frontend estático
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+def _warm_state() -> None:
+    with SessionLocal() as db:
+        warm_last_price_cache(db)
+        rolling_stats.warm(db, get_cryptos_from_env())
+
+def _warm_ring() -> None:
+    # Ring buffer de ticks (ring.py) precargado con la última ventana de la DB
+    since = int(time.time()) - ring.WARM_SECONDS
+    with SessionLocal() as db:
+        series = fetch_series_many(db, get_cryptos_from_env(), since)
+    tick_ring.create({c: [(ts, s) for ts, _, s in rows] for c, rows in series.items()}, since)
+
+def _init_db() -> None:
+    # Migraciones e importación única serializadas entre workers
+    with roles.exclusive(roles.LOCK_PATH + ".init"):
+        init_db()
+
+# 🔹 Roles (roles.py): el colector publica el estado caliente, los workers API lo leen
+hot_state_writer = roles.HotStateWriter()
+hot_state_reader = roles.HotStateReader()
+_reading_hot_state = False
+
+def _table_row(crypto: str):
+    if _reading_hot_state:
+        row = hot_state_reader.table_row(crypto)
+        if row is not None:
+            return row
+    return rolling_stats.table_row(crypto)
+
+def _on_hot_state(previous, current) -> None:
+    # Lo que en el colector hacen los handlers de "price_loaded"/"rollup_updated"
+    pairs, buckets = roles.changes(previous, current)
+    for crypto in pairs:
+        response_cache.invalidate(crypto)
+        tick = current["ticks"].get(crypto)
+        if tick is not None:
+            broadcaster.publish("tick", crypto, {"crypto": crypto, **tick})
+        broadcaster.publish("row", crypto, current["rows"][crypto])
+    for bucket in buckets:
+        broadcaster.publish("bucket", bucket["crypto"], bucket)
+
+async def _start_collector(promoted: bool = False) -> None:
+    global _reading_hot_state
+    if promoted:
+        # Worker API que toma el relevo: reconstruye el estado desde la DB
+        _reading_hot_state = False
+        await run_db(_warm_state)
+        print(f"[INFO] Worker {os.getpid()} elegido como colector")
+    if ring.ENABLED:
+        # Antes de arrancar el writer: ningún tick cargado queda fuera del anillo
+        await run_db(_warm_ring)
+        event_bus.on("price_loaded", tick_ring.on_price, policy="block")
+    # Alertas: solo el colector evalúa (sin perder ticks: un cruce no se puede coalescer)
+    await run_db(alert_engine.load)
+    alerts.dispatcher.on_event = lambda e: broadcaster.publish("alert", e["crypto"], e)
+    event_bus.on("price_loaded", alert_engine.on_price, policy="block")
+    asyncio.create_task(alerts.dispatcher.run())
+    asyncio.create_task(alert_engine.reload_loop())
+    setup_event_chain()
+    asyncio.create_task(writer.run())
+    asyncio.create_task(extraction_loop())
+    asyncio.create_task(retention_loop())
+    asyncio.create_task(export.export_loop())
+    if roles.ROLE != "all":
+        asyncio.create_task(hot_state_writer.run(rolling_stats.table_row, get_cryptos_from_env()))
+
+async def _elect() -> None:
+    # auto: sirve la API desde el snapshot mientras otro proceso tenga el lock
+    global _reading_hot_state
+    reader = None
+    while True:
+        if roles.collector_lock.try_acquire():
+            if reader is not None:
+                reader.cancel()
+            await _start_collector(promoted=reader is not None)
+            return
+        if roles.ROLE == "auto" and reader is None:
+            _reading_hot_state = True
+            tick_ring.attach()
+            reader = asyncio.create_task(hot_state_reader.run(_on_hot_state))
+        await asyncio.sleep(roles.ELECTION_RETRY_SECONDS)
+
 # 🔹 Evento de inicio
 @app.on_event("startup")
 async def startup_event():
-    init_db()
-    insert_cryptos_initial()
-    setup_event_chain()
-    asyncio.create_task(extraction_loop())
+    global _reading_hot_state
+    await run_db(_init_db)
+    await run_db(_warm_state)
+    # En modo cola (EVENT_BUS_MODE=queued): las métricas no pierden ticks (block);
+    # invalidar y difundir solo necesita el último estado de cada par (coalesce)
+    event_bus.on("price_loaded", rolling_stats.on_price, policy="block")
+    event_bus.on("price_loaded", response_cache.on_price_loaded, policy="coalesce")
+    event_bus.on("price_loaded", push_tick, policy="coalesce")
+    event_bus.on("rollup_updated", push_bucket, policy="coalesce",
+                 key=lambda b: (b["crypto"], b["resolution"]))
+    if roles.ROLE != "all":
+        event_bus.on("price_loaded", hot_state_writer.on_price, policy="coalesce")
+        event_bus.on("rollup_updated", hot_state_writer.on_bucket, policy="coalesce",
+                     key=lambda b: (b["crypto"], b["resolution"]))
+    event_bus.start()
+    if roles.ROLE == "all":
+        await _start_collector()
+    elif roles.ROLE == "api":
+        _reading_hot_state = True
+        tick_ring.attach()
+        asyncio.create_task(hot_state_reader.run(_on_hot_state))
+    else:
+        asyncio.create_task(_elect())
+
+# 🔹 Al apagar: escribir el último lote pendiente
+@app.on_event("shutdown")
+async def shutdown_event():
+    await run_write(writer.close)
+    await event_bus.stop()
+    shutdown_executors()
+    roles.collector_lock.release()
 
 # 🔹 Página principal (UI)
 @app.get("/", response_class=HTMLResponse)
 async def index():
     return FileResponse("static/index.html")
 
+# 🔹 Consultas síncronas: se ejecutan en el pool de lectura (executor.py)
+def _arrays(crypto: str, resolution: str):
+    with SessionLocal() as db:
+        return arrays(db, crypto, resolution)
+
+def _arrays_range(crypto: str, resolution: str, start: int, end: int, max_points: int):
+    with SessionLocal() as db:
+        return arrays_range(db, crypto, resolution, start, end, max_points)
+
+def _arrays_many(cryptos: List[str], resolutions: List[str]):
+    with SessionLocal() as db:
+        return {res: arrays_many(db, cryptos, res) for res in resolutions}
+
+def _ohlc(crypto: str, resolution: str):
+    with SessionLocal() as db:
+        return [
+            {k: (v if k == "ts" else price_str(v)) for k, v in c.items()}
+            for c in ohlc(db, crypto, resolution)
+        ]
+
+def _ohlc_range(crypto: str, resolution: str, start: int, end: int, max_points: int):
+    with SessionLocal() as db:
+        source, candles = ohlc_range(db, crypto, resolution, start, end, max_points)
+    return source, [{k: (v if k == "ts" else price_str(v)) for k, v in c.items()} for c in candles]
+
+def _range(resolution: str, ts_from: Optional[int], ts_to: Optional[int], max_points: Optional[int]):
+    # None: ventana fija de la resolución (comportamiento original)
+    if ts_from is None and ts_to is None and max_points is None:
+        return None
+    end = ts_to if ts_to is not None else int(time.time())
+    start = ts_from if ts_from is not None else end - {"second": 60, "minute": 3600, "hour": 86400, "day": 30 * 86400}[resolution]
+    if end <= start:
+        raise HTTPException(status_code=400, detail="to must be greater than from")
+    return start, end, max_points or DEFAULT_MAX_POINTS
+
+# 🔹 Respuesta cacheada y comprimida según Accept-Encoding: el cuerpo sin comprimir
+# y cada variante comprimida tienen su propia entrada (misma invalidación por par)
+async def _cached_response(request: Request, key: CacheKey, compute) -> Response:
+    encoding = wire.negotiate(request.headers.get("accept-encoding", ""))
+    if encoding is None:
+        body = await response_cache.get_or_compute(key, compute)
+        return Response(content=body, media_type="application/json", headers={"Vary": "Accept-Encoding"})
+
+    async def compressed() -> bytes:
+        return wire.compress(await response_cache.get_or_compute(key, compute), encoding)
+
+    body = await response_cache.get_or_compute((f"{key[0]}:{encoding}", key[1], key[2]), compressed)
+    return Response(content=body, media_type="application/json",
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+
+def _check_format(format: str) -> str:
+    format = format.lower()
+    if format not in wire.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be rows or columnar")
+    return format
+
 # 🔹 API protegida con autenticación
 @app.get("/api/table", response_model=TableResponse)
-async def get_table(user: str = Depends(get_current_user)):
-    cryptos = get_cryptos_from_env()
-    with SessionLocal() as db:
-        rows: List[TableRow] = [TableRow(**table_row(db, c)) for c in cryptos]
-        return TableResponse(rows=rows)
+async def get_table(request: Request, user: str = Depends(get_current_user)):
+    # Estado incremental en memoria (rolling.py): sin consultas a la DB
+    async def compute() -> bytes:
+        cryptos = get_cryptos_from_env()
+        rows: List[TableRow] = [TableRow(**_table_row(c)) for c in cryptos]
+        return TableResponse(rows=rows).model_dump_json().encode()
+
+    return await _cached_response(request, ("table", "", ALL_PAIRS), compute)
 
 @app.get("/api/arrays/{resolution}/{crypto}", response_model=ArrayResponse)
-async def get_arrays(resolution: str, crypto: str, user: str = Depends(get_current_user)):
+async def get_arrays(request: Request, resolution: str, crypto: str, format: str = "rows",
+                     ts_from: Optional[int] = Query(None, alias="from"),
+                     ts_to: Optional[int] = Query(None, alias="to"),
+                     max_points: Optional[int] = Query(None, ge=3, le=MAX_POINTS),
+                     user: str = Depends(get_current_user)):
     resolution = resolution.lower()
     if resolution not in {"second", "minute", "hour", "day"}:
         raise HTTPException(400, "Invalid resolution")
-    with SessionLocal() as db:
-        pts = [ArrayPoint(**p) for p in arrays(db, crypto.upper(), resolution)]
-        return ArrayResponse(crypto=crypto.upper(), resolution=resolution, points=pts)
+    crypto = crypto.upper()
+    format = _check_format(format)
+    window = _range(resolution, ts_from, ts_to, max_points)
+
+    async def compute() -> bytes:
+        # Con from/to/max_points, "resolution" es el nivel realmente leído (downsample.py)
+        source = resolution
+        if window is None:
+            points = await run_db(_arrays, crypto, resolution)
+        else:
+            source, points = await run_db(_arrays_range, crypto, resolution, *window)
+        if format == "columnar":
+            return wire.series_columnar(crypto, source, points)
+        # Misma forma que ArrayResponse, sin validar un modelo por punto
+        return wire.dumps({"crypto": crypto, "resolution": source, "points": points})
 
-# 🔹 API protegida: OHLC histórico desde SQLite
+    key = (f"arrays:{format}", resolution if window is None else f"{resolution}|{ts_from}|{ts_to}|{max_points}", crypto)
+    return await _cached_response(request, key, compute)
+
+# 🔹 API protegida: OHLC histórico (ticks para "second", rollups para el resto)
 @app.get("/api/ohlc/{resolution}/{crypto}")
-async def get_ohlc(resolution: str, crypto: str, user: str = Depends(get_current_user)):
+async def get_ohlc(request: Request, resolution: str, crypto: str, format: str = "rows",
+                   ts_from: Optional[int] = Query(None, alias="from"),
+                   ts_to: Optional[int] = Query(None, alias="to"),
+                   max_points: Optional[int] = Query(None, ge=3, le=MAX_POINTS),
+                   user: str = Depends(get_current_user)):
     resolution = resolution.lower()
     if resolution not in {"second", "minute", "hour", "day"}:
         raise HTTPException(status_code=400, detail="Invalid resolution")
+    crypto = crypto.upper()
+    format = _check_format(format)
+    window = _range(resolution, ts_from, ts_to, max_points)
 
-    try:
-        candles = fetch_ohlc(crypto.upper(), resolution)
-        return JSONResponse(content={
-            "crypto": crypto.upper(),
-            "resolution": resolution,
+    async def compute() -> bytes:
+        # Precio exacto como string en todas las resoluciones
+        source = resolution
+        if window is None:
+            candles = await run_db(_ohlc, crypto, resolution)
+        else:
+            source, candles = await run_db(_ohlc_range, crypto, resolution, *window)
+        if format == "columnar":
+            return wire.ohlc_columnar(crypto, source, candles)
+        return wire.dumps({
+            "crypto": crypto,
+            "resolution": source,
             "candles": candles
         })
+
+    key = (f"ohlc:{format}", resolution if window is None else f"{resolution}|{ts_from}|{ts_to}|{max_points}", crypto)
+    try:
+        return await _cached_response(request, key, compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching OHLC: {e}")
+
+# 🔹 API protegida: tabla + series de varios pares en una sola petición.
+# Las series salen de una consulta agrupada por nivel (crypto IN (...)), no una por par
+@app.get("/api/batch")
+async def get_batch(
+    request: Request,
+    cryptos: Optional[str] = None,
+    resolutions: str = "",
+    table: bool = False,
+    format: str = "rows",
+    user: str = Depends(get_current_user),
+):
+    wanted = [c.strip().upper() for c in cryptos.split(",") if c.strip()] if cryptos else get_cryptos_from_env()
+    res_list = [r.strip().lower() for r in resolutions.split(",") if r.strip()]
+    if any(r not in {"second", "minute", "hour", "day"} for r in res_list):
+        raise HTTPException(status_code=400, detail="Invalid resolution")
+    format = _check_format(format)
+
+    async def compute() -> bytes:
+        rows = [_table_row(c) for c in wanted] if table else None
+        series = await run_db(_arrays_many, wanted, res_list) if res_list else {}
+        return wire.batch(rows, series, format)
+
+    key = (f"batch:{format}", f"{','.join(res_list)}|{int(table)}|{','.join(wanted)}", ALL_PAIRS)
+    return await _cached_response(request, key, compute)
+
+# 🔹 Contadores de la caché de respuestas
+@app.get("/api/cache/stats")
+async def get_cache_stats(user: str = Depends(get_current_user)):
+    return response_cache.stats()
+
+# 🔹 Contadores del planificador de extracción por par (latencia, errores, ticks perdidos)
+@app.get("/api/fetch/stats")
+async def get_fetch_stats(user: str = Depends(get_current_user)):
+    return fetch_scheduler.stats()
+
+# 🔹 Historial masivo [from, to] para uno o más pares, en streaming (NDJSON o Arrow IPC)
+@app.get("/api/history")
+async def get_history(
+    cryptos: str,
+    ts_from: int = Query(..., alias="from"),
+    ts_to: Optional[int] = Query(None, alias="to"),
+    format: str = "ndjson",
+    user: str = Depends(get_current_user),
+):
+    wanted = [c.strip().upper() for c in cryptos.split(",") if c.strip()]
+    if not wanted:
+        raise HTTPException(status_code=400, detail="cryptos is required")
+    if format not in {"ndjson", "arrow"}:
+        raise HTTPException(status_code=400, detail="format must be ndjson or arrow")
+    if format == "arrow" and not export.available():
+        raise HTTPException(status_code=501, detail="Arrow requires pyarrow")
+    ts_to = ts_to if ts_to is not None else int(time.time())
+    if ts_to < ts_from:
+        raise HTTPException(status_code=400, detail="to must be >= from")
+    media_type = "application/vnd.apache.arrow.stream" if format == "arrow" else "application/x-ndjson"
+    return StreamingResponse(export.stream_history(wanted, ts_from, ts_to, format), media_type=media_type)
+
+# 🔹 Métricas en formato de texto de Prometheus (ETL, EventBus, consultas, rutas)
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(user: str = Depends(get_current_user)):
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# 🔹 Perfil por muestreo de todos los hilos (solo con PROFILER_ENABLED=1), en formato folded
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def get_profile(seconds: float = 10.0, interval: float = 0.005, user: str = Depends(get_current_user)):
+    if not profiler.enabled():
+        raise HTTPException(status_code=404, detail="Profiler disabled (PROFILER_ENABLED=1)")
+    if seconds <= 0 or interval <= 0:
+        raise HTTPException(status_code=400, detail="seconds and interval must be > 0")
+    # Hilo propio (no el pool de lectura): el muestreo dura toda la ventana
+    counts = await asyncio.to_thread(profiler.sample, seconds, interval)
+    if counts is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(profiler.folded(counts), headers={
+        "Content-Disposition": f'attachment; filename="profile-{int(time.time())}.folded"'
+    })
+
+# 🔹 Métricas del EventBus por suscriptor (profundidad, descartes, histograma de tiempos)
+@app.get("/api/bus/stats")
+async def get_bus_stats(user: str = Depends(get_current_user)):
+    return event_bus.stats()
+
+# 🔹 Reglas de alerta: se guardan en alert_rules (cualquier worker); el colector las evalúa
+@app.post("/api/alerts/rules", status_code=201)
+async def create_alert_rule(body: AlertRuleIn, user: str = Depends(get_current_user)):
+    try:
+        rule = alerts.normalize(body.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    created = await run_write(alerts.create_rule, rule)
+    if alert_engine.active:
+        # En el colector entra de inmediato; en otros workers, con la próxima recarga
+        alert_engine.add(created)
+    return created
+
+@app.get("/api/alerts/rules")
+async def get_alert_rules(crypto: Optional[str] = None, user: str = Depends(get_current_user)):
+    def load():
+        with SessionLocal() as db:
+            return alerts.load_rules(db, crypto.strip().upper() if crypto else None)
+    return await run_db(load)
+
+@app.delete("/api/alerts/rules/{rule_id}", status_code=204)
+async def delete_alert_rule(rule_id: int, user: str = Depends(get_current_user)):
+    if not await run_write(alerts.delete_rule, rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    alert_engine.remove(rule_id)
+    return Response(status_code=204)
+
+# 🔹 Alertas disparadas (cola local): paginación por id con ?after=
+@app.get("/api/alerts/events")
+async def get_alert_events(
+    after: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    crypto: Optional[str] = None,
+    user: str = Depends(get_current_user),
+):
+    def load():
+        with SessionLocal() as db:
+            return alerts.load_events(db, after, limit, crypto.strip().upper() if crypto else None)
+    return await run_db(load)
+
+@app.get("/api/alerts/stats")
+async def get_alert_stats(user: str = Depends(get_current_user)):
+    return alert_engine.stats()
+
+# 🔹 Stream server-push (SSE): ticks, filas de la tabla y buckets como deltas
+@app.get("/api/stream")
+async def get_stream(cryptos: Optional[str] = None, user: str = Depends(get_current_user)):
+    wanted = {c.strip().upper() for c in cryptos.split(",") if c.strip()} if cryptos else None
+    client = broadcaster.subscribe(wanted)
+    return StreamingResponse(
+        broadcaster.events(client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
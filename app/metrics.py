@@ -0,0 +1,160 @@
+# app/metrics.py
+# Métricas en formato de texto de Prometheus (GET /metrics), sin dependencias:
+# - Counter / Gauge / Histogram con etiquetas, seguros entre hilos (writer, pool de lectura).
+# - timed(): decorador que mide cada consulta de crud.py / aggregator.py.
+# - Colectores: funciones que leen al exportar los contadores que ya existen
+#   (planificador, EventBus, caché, SSE) sin duplicarlos.
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, TypeVar, Union
+
+from . import bus
+
+T = TypeVar("T")
+
+Labels = Dict[str, Any]
+Sample = Tuple[Labels, Union[float, bus.Histogram]]
+# (nombre, tipo, ayuda, muestras)
+Family = Tuple[str, str, str, List[Sample]]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List["_Metric"] = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def collector(self, fn: Callable[[], Iterable[Family]]) -> Callable[[], Iterable[Family]]:
+        # Se usa como decorador en el módulo dueño del estado
+        self._collectors.append(fn)
+        return fn
+
+    def families(self) -> List[Family]:
+        out = [m.family() for m in self._metrics]
+        for fn in self._collectors:
+            try:
+                out.extend(fn())
+            except Exception as e:
+                print(f"[WARN] Colector de métricas {fn.__qualname__} falló: {type(e).__name__}: {e}")
+        return out
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, kind, help, samples in self.families():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if isinstance(value, bus.Histogram):
+                    cumulative = value.cumulative()
+                    for upper, count in zip([*value.buckets, "+Inf"], cumulative):
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': upper})} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(value.sum)}")
+                    lines.append(f"{name}_count{_labels(labels)} {value.count}")
+                else:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Labels) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def family(self) -> Family:
+        with self._lock:
+            items = list(self._values.items())
+        return self.name, self.kind, self.help, [(dict(zip(self.labelnames, k)), v) for k, v in items]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=bus.HISTOGRAM_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            hist = self._values.get(key)
+            if hist is None:
+                hist = self._values[key] = bus.Histogram(self.buckets)
+            hist.observe(value)
+
+    def family(self) -> Family:
+        # Copia bajo el lock: buckets, suma y conteo del mismo instante
+        with self._lock:
+            items = [(k, _copy(h)) for k, h in self._values.items()]
+        return self.name, self.kind, self.help, [(dict(zip(self.labelnames, k)), v) for k, v in items]
+
+
+def _copy(hist: bus.Histogram) -> bus.Histogram:
+    out = bus.Histogram(hist.buckets)
+    out.counts = list(hist.counts)
+    out.sum = hist.sum
+    out.count = hist.count
+    return out
+
+
+# 🔹 Tiempos de consultas (crud.py / aggregator.py)
+DB_SECONDS = Histogram("db_query_seconds", "Duración de las funciones de consulta", ["function"])
+
+
+def timed(fn: Callable[..., T]) -> Callable[..., T]:
+    label = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - start, function=label)
+
+    return wrapper
@@ -0,0 +1,57 @@
+# app/profiler.py
+# Perfilador por muestreo, opcional (PROFILER_ENABLED=1): durante una ventana de
+# tiempo un hilo lee las pilas de todos los hilos (sys._current_frames) cada
+# `interval` segundos y cuenta pilas "colapsadas" (formato folded:
+# "hilo;modulo:funcion;... N"), listas para flamegraph.pl, speedscope o inferno.
+# Sin instrumentar el código: el costo solo existe mientras se perfila.
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+MAX_SECONDS = 300
+
+
+def enabled() -> bool:
+    return os.getenv("PROFILER_ENABLED", "0") == "1"
+
+
+_running = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+def sample(seconds: float, interval: float = 0.005) -> Optional[Dict[str, int]]:
+    """Muestrea todos los hilos durante `seconds`; None si ya hay un perfil en curso."""
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        own = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + min(seconds, MAX_SECONDS)
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return dict(counts)
+    finally:
+        _running.release()
+
+
+def folded(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in sorted(counts.items()))
+
@@ -0,0 +1,180 @@
+# app/retention.py
+# Retención por niveles y compactación en segundo plano:
+# - ticks crudos (prices) durante RAW_RETENTION_HOURS (48h)
+# - rollups de minuto durante MINUTE_RETENTION_DAYS (90d)
+# - rollups de hora y día sin límite
+# Los rollups ya se mantienen al cargar cada lote, así que compactar es borrar
+# lo que un nivel más grueso ya cubre. Se borra en lotes pequeños en el hilo del
+# writer (sin bloqueos de escritura largos), y después se hace checkpoint del WAL
+# y vacuum incremental. Las lecturas eligen el nivel con cutoff()/COARSER.
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.engine import Connection
+
+from .db import Price, PriceHour, PriceMinute, engine
+from .executor import run_write
+
+# Nivel de respaldo cuando el pedido cae fuera de la retención de su nivel
+COARSER = {"second": "minute", "minute": "hour"}
+
+
+class RetentionPolicy:
+    def __init__(self) -> None:
+        raw_hours = float(os.getenv("RAW_RETENTION_HOURS", "48"))
+        if raw_hours < 25:
+            # /api/table (rolling.warm, pct_change_24h) necesita 24h de ticks
+            print("[WARN] RAW_RETENTION_HOURS < 25 no es válido; se usa 25")
+            raw_hours = 25
+        self.raw_seconds = int(raw_hours * 3600)
+        self.minute_seconds = int(float(os.getenv("MINUTE_RETENTION_DAYS", "90")) * 86400)
+        self.enabled = os.getenv("RETENTION_ENABLED", "1") != "0"
+        self.batch = int(os.getenv("RETENTION_BATCH", "5000"))
+        self.interval = float(os.getenv("RETENTION_INTERVAL_SECONDS", "600"))
+        self.vacuum_pages = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+
+    def cutoff(self, resolution: str, now: Optional[int] = None) -> Optional[int]:
+        """Primer ts que el nivel `resolution` conserva (None = sin límite).
+
+        Alineado al tamaño del nivel siguiente para que ningún bucket grueso
+        quede partido entre dos niveles.
+        """
+        now = int(time.time()) if now is None else now
+        if resolution == "second":
+            return (now - self.raw_seconds) // 60 * 60
+        if resolution == "minute":
+            return (now - self.minute_seconds) // 3600 * 3600
+        return None
+
+
+policy = RetentionPolicy()
+
+
+def covered_cryptos(conn: Connection) -> List[str]:
+    # Solo se compactan pares cuyos rollups de hora cubren todo su historial crudo
+    # (si falta historia en rollups: python -m app.rollups backfill)
+    out = []
+    hour_min = conn.execute(
+        select(PriceHour.crypto, func.min(PriceHour.bucket)).group_by(PriceHour.crypto)
+    ).all()
+    for crypto, first_bucket in hour_min:
+        first_tick = conn.execute(select(func.min(Price.ts)).where(Price.crypto == crypto)).scalar()
+        if first_tick is None or first_tick >= first_bucket:
+            out.append(crypto)
+        else:
+            print(f"[WARN] Retención: {crypto} tiene ticks sin rollup; ejecute el backfill")
+    return out
+
+
+def compact_step(cryptos: List[str], now: Optional[int] = None) -> int:
+    """Un lote: borra hasta policy.batch filas vencidas en una transacción corta."""
+    raw_cut = policy.cutoff("second", now)
+    minute_cut = policy.cutoff("minute", now)
+    deleted = 0
+    with engine.begin() as conn:
+        for crypto in cryptos:
+            left = policy.batch - deleted
+            if left <= 0:
+                break
+            ids = select(Price.id).where(
+                Price.crypto == crypto, Price.ts < raw_cut
+            ).order_by(Price.ts.asc()).limit(left).scalar_subquery()
+            deleted += conn.execute(Price.__table__.delete().where(Price.id.in_(ids))).rowcount
+        for crypto in cryptos:
+            left = policy.batch - deleted
+            if left <= 0:
+                break
+            keys = select(PriceMinute.crypto, PriceMinute.bucket).where(
+                PriceMinute.crypto == crypto, PriceMinute.bucket < minute_cut
+            ).limit(left)
+            deleted += conn.execute(
+                PriceMinute.__table__.delete().where(tuple_(PriceMinute.crypto, PriceMinute.bucket).in_(keys))
+            ).rowcount
+    return deleted
+
+
+def checkpoint() -> Dict[str, str]:
+    # Vacuum incremental y luego checkpoint del WAL (TRUNCATE lo deja en 0 bytes si no hay lectores)
+    out: Dict[str, str] = {}
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+                # sqlite3 (Python) avanza un solo paso por sentencia: una página por llamada
+                free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                for _ in range(min(free, policy.vacuum_pages)):
+                    conn.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+            conn.commit()
+            busy, log, done = conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").one()
+            out["prices"] = f"busy={busy} log={log} checkpointed={done}"
+    return out
+
+
+def run_once(now: Optional[int] = None) -> int:
+    # Pasada completa (CLI / con el colector detenido); cada lote es su propia transacción
+    with engine.connect() as conn:
+        cryptos = covered_cryptos(conn)
+    total = 0
+    while True:
+        n = compact_step(cryptos, now)
+        total += n
+        if n == 0:
+            break
+    checkpoint()
+    return total
+
+
+def _covered() -> List[str]:
+    with engine.connect() as conn:
+        return covered_cryptos(conn)
+
+
+async def retention_loop() -> None:
+    # Cada lote pasa por el hilo del writer: se intercala con los lotes de ticks
+    if not policy.enabled:
+        return
+    while True:
+        await asyncio.sleep(policy.interval)
+        try:
+            t0 = time.monotonic()
+            cryptos = await run_write(_covered)
+            total = 0
+            while True:
+                n = await run_write(compact_step, cryptos)
+                total += n
+                if n == 0:
+                    break
+                await asyncio.sleep(0)   # cede el turno a la API y a la carga
+            result = await run_write(checkpoint)
+            print(f"[INFO] Retención: {total} filas compactadas en {time.monotonic() - t0:.1f}s; WAL {result}")
+        except Exception as e:
+            print(f"[WARN] Retención falló: {type(e).__name__}: {e}")
+
+
+def enable_incremental_vacuum() -> None:
+    # Convierte bases existentes a auto_vacuum=INCREMENTAL (VACUUM completo, una vez,
+    # con el colector detenido). Las bases nuevas ya se crean así (init_db).
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.commit()
+            conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("VACUUM")
+
+
+if __name__ == "__main__":
+    # python -m app.retention run | vacuum
+    if len(sys.argv) < 2 or sys.argv[1] not in ("run", "vacuum"):
+        print("Uso: python -m app.retention run | vacuum")
+        sys.exit(1)
+    from .db import init_db
+    init_db()
+    t0 = time.time()
+    if sys.argv[1] == "vacuum":
+        enable_incremental_vacuum()
+        print(f"[INFO] auto_vacuum=INCREMENTAL aplicado en {time.time() - t0:.1f}s")
+    else:
+        n = run_once()
+        print(f"[INFO] Retención: {n} filas compactadas en {time.time() - t0:.1f}s")
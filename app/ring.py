@@ -0,0 +1,200 @@
+# app/ring.py
+# Ring buffer de ticks recientes en un archivo mapeado en memoria (mmap):
+# - El colector (handler de "price_loaded", después del commit) escribe (ts, precio
+#   exacto) en un anillo de tamaño fijo por par: memoria constante sin importar
+#   cuánto tiempo corra el proceso.
+# - Los workers API (roles.py) y el propio colector leen de ahí las ventanas
+#   recientes (arrays/ohlc "second") sin consultar SQLite ni construir Decimal.
+# - Seqlock por par: el escritor (uno solo) deja `seq` impar mientras escribe un
+#   tick; el lector copia el tramo pedido y reintenta si `seq` cambió entretanto.
+# - `floor` por par: desde qué ts el anillo está completo (inicio de la precarga,
+#   o ts del último tick sobrescrito + 1); ventanas más viejas van a la DB.
+#
+# Archivo: cabecera | nombres de los pares | por par: cabecera (seq, head, floor)
+# + CAPACITY registros (ts, precio ASCII de hasta 32 bytes).
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+
+_ROOT = os.path.dirname(os.path.dirname(__file__))
+
+ENABLED = os.getenv("TICK_RING_ENABLED", "1") == "1"
+PATH = os.getenv("TICK_RING_PATH", os.path.join(_ROOT, "ticks.ring"))
+CAPACITY = int(os.getenv("TICK_RING_CAPACITY", "1024"))
+# Precarga desde la DB al arrancar el colector (cubre ohlc "second": 5 min)
+WARM_SECONDS = 600
+
+MAGIC = b"TICKRNG1"
+_FILE = struct.Struct("<8sIII")       # magic, capacidad, pares, tamaño de registro
+_NAME = struct.Struct("<32s")
+_PAIR = struct.Struct("<QQq")         # seq, head (ticks escritos), floor
+_SEQ = struct.Struct("<Q")
+_TS = struct.Struct("<q")
+_RECORD = struct.Struct("<q32s")      # ts, precio (relleno con \0)
+FILE_HEADER = 64
+PAIR_HEADER = 32
+READ_RETRIES = 100
+
+Series = Dict[str, List[Tuple[int, str]]]
+
+READS = metrics.Counter("tick_ring_reads_total", "Lecturas del ring buffer de ticks por resultado", ["result"])
+
+
+class TickRing:
+    def __init__(self, path: str = PATH, capacity: int = CAPACITY) -> None:
+        self.path = path
+        self.capacity = capacity
+        # Solo la app lee del anillo (attach/create): CLIs y benchmarks van a la DB
+        self.enabled = False
+        self._writer = False
+        self._ino: Optional[int] = None
+        # (mmap, capacidad, {crypto: offset}) en un solo atributo: los hilos del
+        # pool de lectura nunca ven un mapeo a medio instalar
+        self._map: Optional[Tuple[mmap.mmap, int, Dict[str, int]]] = None
+        # Mapeos reemplazados que un lector todavía usaba al cerrarlos (BufferError)
+        self._retired: List[mmap.mmap] = []
+        self._remap_lock = threading.Lock()
+
+    def _swap(self, new: Tuple[mmap.mmap, int, Dict[str, int]]) -> None:
+        # Instala el mapeo nuevo y cierra los anteriores (sin esto cada remapeo
+        # deja abierto el archivo viejo, ya borrado, y su memoria)
+        old, self._map = self._map, new
+        pending = self._retired + ([old[0]] if old is not None else [])
+        self._retired = []
+        for mm in pending:
+            try:
+                mm.close()
+            except BufferError:
+                self._retired.append(mm)   # lector en curso: se cierra en el próximo remapeo
+
+    # 🔹 Escritor (colector)
+    def create(self, series: Series, since: int) -> None:
+        """Crea el anillo con los ticks de la DB (completo desde `since`) y lo publica."""
+        cryptos = list(series)
+        block = PAIR_HEADER + self.capacity * _RECORD.size
+        start = FILE_HEADER + len(cryptos) * _NAME.size
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(start + len(cryptos) * block)
+        with open(tmp, "r+b") as f:
+            mm = mmap.mmap(f.fileno(), 0)
+        _FILE.pack_into(mm, 0, MAGIC, self.capacity, len(cryptos), _RECORD.size)
+        offsets: Dict[str, int] = {}
+        for i, crypto in enumerate(cryptos):
+            _NAME.pack_into(mm, FILE_HEADER + i * _NAME.size, crypto.encode())
+            offsets[crypto] = start + i * block
+            _PAIR.pack_into(mm, offsets[crypto], 0, 0, since)
+        self._swap((mm, self.capacity, offsets))
+        self._writer = True
+        for crypto, rows in series.items():
+            for ts, price in rows:
+                self.append(crypto, ts, price)
+        # Reemplazo atómico: un lector nunca mapea un archivo a medio crear
+        os.replace(tmp, self.path)
+        self.enabled = True
+        print(f"[INFO] Ring buffer de ticks: {len(cryptos)} pares × {self.capacity} ticks en {self.path}")
+
+    def append(self, crypto: str, ts: int, price: str) -> None:
+        mm, cap, offsets = self._map
+        base = offsets.get(crypto)
+        if base is None:
+            return
+        seq, head, floor = _PAIR.unpack_from(mm, base)
+        _SEQ.pack_into(mm, base, seq + 1)   # impar: escritura en curso
+        slot = base + PAIR_HEADER + (head % cap) * _RECORD.size
+        if head >= cap:
+            floor = max(floor, _TS.unpack_from(mm, slot)[0] + 1)
+        raw = price.encode()
+        if len(raw) > 32:
+            # No cabe: el anillo deja de cubrir hasta este tick (se lee de la DB)
+            floor, raw = ts + 1, b""
+        _RECORD.pack_into(mm, slot, ts, raw)
+        _PAIR.pack_into(mm, base, seq + 2, head + 1, floor)
+
+    def on_price(self, row: Dict[str, object]) -> None:
+        # Handler de "price_loaded"
+        if self._writer:
+            self.append(row["crypto"], row["ts"], row["amount_str"])
+
+    # 🔹 Lectores (workers API y el propio colector)
+    def attach(self) -> None:
+        self.enabled = ENABLED
+
+    def _open(self) -> bool:
+        if self._writer:
+            return True
+        try:
+            ino = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return False
+        if self._map is not None and ino == self._ino:
+            return True
+        with self._remap_lock:
+            if self._map is not None and ino == self._ino:
+                return True   # otro hilo ya lo remapeó
+            # Archivo nuevo (colector reiniciado o relevado): se vuelve a mapear
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, cap, n, record_size = _FILE.unpack_from(mm, 0)
+            if magic != MAGIC or record_size != _RECORD.size:
+                mm.close()
+                return False
+            start = FILE_HEADER + n * _NAME.size
+            block = PAIR_HEADER + cap * _RECORD.size
+            offsets = {
+                _NAME.unpack_from(mm, FILE_HEADER + i * _NAME.size)[0].rstrip(b"\0").decode(): start + i * block
+                for i in range(n)
+            }
+            self._swap((mm, cap, offsets))
+            self._ino = ino
+            return True
+
+    def read(self, crypto: str, since: int) -> Optional[List[Tuple[int, str]]]:
+        """Ticks [(ts, precio)] con ts >= since; None si el anillo no cubre la ventana."""
+        if not self.enabled or not self._open():
+            return None
+        mm, cap, offsets = self._map
+        base = offsets.get(crypto)
+        if base is None:
+            READS.inc(result="miss")
+            return None
+        try:
+            chunk = self._scan(mm, cap, base, since)
+        except ValueError:
+            chunk = None   # otro hilo remapeó y cerró este mapeo: se lee de la DB
+        if chunk is None:
+            READS.inc(result="miss")
+            return None
+        READS.inc(result="hit")
+        return [(ts, raw.rstrip(b"\0").decode()) for ts, raw in _RECORD.iter_unpack(chunk)]
+
+    @staticmethod
+    def _scan(mm: mmap.mmap, cap: int, base: int, since: int) -> Optional[bytes]:
+        # Copia consistente (seqlock) de los registros con ts >= since
+        records = base + PAIR_HEADER
+        size = _RECORD.size
+        for _ in range(READ_RETRIES):
+            seq, head, floor = _PAIR.unpack_from(mm, base)
+            if seq & 1:
+                continue
+            if since < floor:
+                break
+            # Desde el más nuevo hacia atrás hasta el primer ts < since
+            n, count = 0, min(head, cap)
+            while n < count and _TS.unpack_from(mm, records + ((head - 1 - n) % cap) * size)[0] >= since:
+                n += 1
+            first = (head - n) % cap
+            if first + n <= cap:
+                chunk = mm[records + first * size:records + (first + n) * size]
+            else:
+                chunk = mm[records + first * size:records + cap * size] + mm[records:records + (first + n - cap) * size]
+            if _SEQ.unpack_from(mm, base)[0] != seq:
+                continue   # el escritor pasó por encima: reintentar
+            return chunk
+        return None
+
+tick_ring = TickRing()
@@ -0,0 +1,233 @@
+# app/roles.py
+# Despliegue multi-proceso (p. ej. uvicorn --workers N):
+# - APP_ROLE=all (por defecto): un proceso extrae, carga y sirve la API (como siempre).
+# - APP_ROLE=auto: todos los workers compiten por un lock de archivo; el que lo
+#   obtiene es el único colector (extracción, carga, retención, exportación) y
+#   los demás solo sirven la API. Si el colector muere el SO libera el lock y
+#   otro worker lo toma (failover).
+# - APP_ROLE=collector / api: rol fijo (collector espera el lock; api nunca extrae).
+# El colector publica un snapshot del estado caliente (filas de /api/table,
+# último tick y último bucket por par) en HOT_STATE_PATH; los workers API lo
+# releen al cambiar, invalidan su caché y lo difunden por SSE: todos los
+# procesos muestran la misma señal B/S.
+import asyncio
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_ROOT = os.path.dirname(os.path.dirname(__file__))
+
+ROLES = ("all", "auto", "collector", "api")
+ROLE = os.getenv("APP_ROLE", "all").lower()
+LOCK_PATH = os.getenv("COLLECTOR_LOCK_PATH", os.path.join(_ROOT, "collector.lock"))
+HOT_STATE_PATH = os.getenv("HOT_STATE_PATH", os.path.join(_ROOT, "hot_state.json"))
+HOT_STATE_INTERVAL = float(os.getenv("HOT_STATE_INTERVAL", "0.5"))
+# Reescritura forzada aunque no haya ticks: la ventana de 1h también avanza sin ellos
+HOT_STATE_MAX_AGE = float(os.getenv("HOT_STATE_MAX_AGE", "30"))
+ELECTION_RETRY_SECONDS = float(os.getenv("ELECTION_RETRY_SECONDS", "5"))
+
+if ROLE not in ROLES:
+    raise ValueError(f"APP_ROLE desconocido: {ROLE!r}")
+
+
+# 🔹 Lock de archivo (se libera solo si el proceso muere)
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class CollectorLock:
+    def __init__(self, path: str = LOCK_PATH) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not _try_lock(fd):
+            os.close(fd)
+            return False
+        # PID del colector: solo informativo (python -m app.roles status)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            _unlock(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+
+collector_lock = CollectorLock()
+
+
+@metrics.registry.collector
+def _role_metrics() -> Iterable[metrics.Family]:
+    collecting = ROLE == "all" or collector_lock.held
+    yield ("app_collector", "gauge", "1 si este proceso es el colector", [({"role": ROLE}, int(collecting))])
+
+
+@contextmanager
+def exclusive(path: str) -> Iterator[None]:
+    # Sección crítica entre procesos (init_db: migraciones + importación única)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        while not _try_lock(fd):
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+# 🔹 Snapshot del estado caliente (escrito por el colector)
+class HotStateWriter:
+    def __init__(self, path: str = HOT_STATE_PATH) -> None:
+        self.path = path
+        self.version = 0
+        self._ticks: Dict[str, Dict[str, Any]] = {}
+        self._buckets: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._dirty = False
+        self._written_at = 0.0
+
+    def on_price(self, row: Dict[str, Any]) -> None:
+        # Handler de "price_loaded"
+        self._ticks[row["crypto"]] = {"ts": row["ts"], "price": row["amount_str"]}
+        self._dirty = True
+
+    def on_bucket(self, bucket: Dict[str, Any]) -> None:
+        # Handler de "rollup_updated"
+        self._buckets[(bucket["crypto"], bucket["resolution"])] = bucket
+        self._dirty = True
+
+    def snapshot(self, rows: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        # En el event loop: copia ticks/buckets (los handlers siguen mutándolos
+        # mientras el hilo serializa) y marca el estado como limpio
+        self.version += 1
+        state = {
+            "version": self.version,
+            "pid": os.getpid(),
+            "written_at": time.time(),
+            "rows": rows,
+            "ticks": dict(self._ticks),
+            "buckets": list(self._buckets.values()),
+        }
+        self._dirty = False
+        return state
+
+    def write(self, state: Dict[str, Any]) -> None:
+        # Escritura atómica: un lector nunca ve un JSON a medias
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp, self.path)
+
+    async def run(self, table_row, cryptos: List[str]) -> None:
+        while True:
+            await asyncio.sleep(HOT_STATE_INTERVAL)
+            if not self._dirty and time.monotonic() - self._written_at < HOT_STATE_MAX_AGE:
+                continue
+            try:
+                state = self.snapshot({c: table_row(c) for c in cryptos})
+                await asyncio.to_thread(self.write, state)
+                self._written_at = time.monotonic()
+            except Exception as e:
+                self._dirty = True   # reintentar en la próxima vuelta
+                print(f"[WARN] Snapshot de estado caliente falló: {type(e).__name__}: {e}")
+
+
+# 🔹 Lectura del snapshot (workers API)
+class HotStateReader:
+    def __init__(self, path: str = HOT_STATE_PATH) -> None:
+        self.path = path
+        self.state: Dict[str, Any] = {"version": 0, "rows": {}, "ticks": {}, "buckets": []}
+        self._mtime = 0
+
+    def table_row(self, crypto: str) -> Optional[Dict[str, Any]]:
+        return self.state["rows"].get(crypto)
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        """Relee el snapshot si cambió; devuelve el anterior (None si no cambió)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime == self._mtime:
+            return None
+        with open(self.path) as f:
+            state = json.load(f)
+        self._mtime = mtime
+        previous, self.state = self.state, state
+        return previous
+
+    async def run(self, on_change) -> None:
+        while True:
+            try:
+                previous = self.poll()
+                if previous is not None:
+                    on_change(previous, self.state)
+            except Exception as e:
+                print(f"[WARN] Lectura del estado caliente falló: {type(e).__name__}: {e}")
+            await asyncio.sleep(HOT_STATE_INTERVAL)
+
+
+def changes(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    # Pares con fila/tick distinto y buckets nuevos o modificados
+    pairs = [
+        c for c, row in current["rows"].items()
+        if row != previous["rows"].get(c) or current["ticks"].get(c) != previous["ticks"].get(c)
+    ]
+    old_buckets = {(b["crypto"], b["resolution"]): b for b in previous["buckets"]}
+    buckets = [b for b in current["buckets"] if old_buckets.get((b["crypto"], b["resolution"])) != b]
+    return pairs, buckets
+
+
+if __name__ == "__main__":
+    # python -m app.roles status: quién tiene el lock del colector y edad del snapshot
+    import sys
+    if len(sys.argv) < 2 or sys.argv[1] != "status":
+        print("Uso: python -m app.roles status")
+        sys.exit(1)
+    probe = CollectorLock()
+    if probe.try_acquire():
+        probe.release()
+        print("[INFO] Sin colector activo")
+    else:
+        with open(LOCK_PATH) as f:
+            print(f"[INFO] Colector activo: pid {f.read().strip() or '?'}")
+    reader = HotStateReader()
+    if reader.poll() is not None:
+        age = time.time() - reader.state["written_at"]
+        print(f"[INFO] Snapshot v{reader.state['version']} de hace {age:.1f}s ({len(reader.state['rows'])} pares)")
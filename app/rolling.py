@@ -0,0 +1,177 @@
+# app/rolling.py
+# Agregador incremental por par alimentado por el EventBus ("price_loaded").
+# Mantiene la ventana de 1h (máx/mín con deques monótonas, suma y Welford para
+# la volatilidad) y el precio ancla de 24h, de modo que /api/table lee estado
+# en O(1) en lugar de consultar la DB.
+import os
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .crud import iter_series_many
+from .signals import DEFAULT_CONFIG, SignalConfig, SignalState, parse_signal_config
+
+HOUR = 3600
+DAY = 86400
+
+
+class PairWindow:
+    def __init__(self, signal_config: SignalConfig = DEFAULT_CONFIG) -> None:
+        self._seq = 0
+        # Ventana 1h: (seq, ts, price)
+        self.ticks: Deque[Tuple[int, int, Decimal]] = deque()
+        # Deques monótonas: máx decreciente, mín creciente
+        self._maxq: Deque[Tuple[int, Decimal]] = deque()
+        self._minq: Deque[Tuple[int, Decimal]] = deque()
+        self._sum = Decimal(0)
+        # Welford: media y suma de cuadrados de desviaciones (M2)
+        self._mean = Decimal(0)
+        self._m2 = Decimal(0)
+        # Ventana 24h: (ts, price); day[0] es el precio ancla
+        self.day: Deque[Tuple[int, Decimal]] = deque()
+        self.last_str: Optional[str] = None
+        self.last_ts: Optional[int] = None
+        # EMA rápida/lenta sobre la misma ventana de 1h
+        self.signal = SignalState(signal_config)
+
+    def add(self, ts: int, price: Decimal, amount_str: str) -> None:
+        self._seq += 1
+        seq = self._seq
+        self.ticks.append((seq, ts, price))
+        while self._maxq and self._maxq[-1][1] <= price:
+            self._maxq.pop()
+        self._maxq.append((seq, price))
+        while self._minq and self._minq[-1][1] >= price:
+            self._minq.pop()
+        self._minq.append((seq, price))
+        self._sum += price
+        n = len(self.ticks)
+        delta = price - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (price - self._mean)
+        self.signal.push(price)
+        self.day.append((ts, price))
+        self.last_str = amount_str
+        self.last_ts = ts
+
+    def _remove_oldest(self) -> None:
+        seq, _, price = self.ticks.popleft()
+        self.signal.evict(price, self.ticks[0][2] if self.ticks else None)
+        if self._maxq and self._maxq[0][0] <= seq:
+            self._maxq.popleft()
+        if self._minq and self._minq[0][0] <= seq:
+            self._minq.popleft()
+        self._sum -= price
+        n = len(self.ticks)
+        if n == 0:
+            self._sum = self._mean = self._m2 = Decimal(0)
+            return
+        delta = price - self._mean
+        self._mean -= delta / n
+        self._m2 -= delta * (price - self._mean)
+
+    def evict(self, now: int) -> None:
+        hour_from = now - HOUR
+        while self.ticks and self.ticks[0][1] < hour_from:
+            self._remove_oldest()
+        day_from = now - DAY
+        while self.day and self.day[0][0] < day_from:
+            self.day.popleft()
+
+    # Lecturas (llamar después de evict)
+    def high(self) -> Optional[Decimal]:
+        return self._maxq[0][1] if self._maxq else None
+
+    def low(self) -> Optional[Decimal]:
+        return self._minq[0][1] if self._minq else None
+
+    def avg(self) -> Optional[Decimal]:
+        return self._sum / Decimal(len(self.ticks)) if self.ticks else None
+
+    def volatility(self) -> Optional[Decimal]:
+        # Desviación estándar poblacional (igual que statistics.pstdev)
+        if not self.ticks:
+            return None
+        var = self._m2 / Decimal(len(self.ticks))
+        return var.sqrt() if var > 0 else Decimal(0)
+
+    def pct_change_24h(self) -> Optional[float]:
+        if len(self.day) < 2:
+            return None
+        first, last = self.day[0][1], self.day[-1][1]
+        return float((last - first) / first * 100)
+
+
+class RollingAggregator:
+    def __init__(self) -> None:
+        self._pairs: Dict[str, PairWindow] = {}
+        self._lock = threading.Lock()
+        # Periodos/umbrales por par, ej. SIGNAL_CONFIG="DOGE-USD=8/21/0.005"
+        self.signal_configs = parse_signal_config(os.getenv("SIGNAL_CONFIG", ""))
+
+    def _new_window(self, crypto: str) -> PairWindow:
+        w = self._pairs[crypto] = PairWindow(self.signal_configs.get(crypto, DEFAULT_CONFIG))
+        return w
+
+    def _window(self, crypto: str) -> PairWindow:
+        w = self._pairs.get(crypto)
+        if w is None:
+            w = self._new_window(crypto)
+        return w
+
+    def on_price(self, row: Dict[str, Any]) -> None:
+        # Handler de "price_loaded": fila insertada en prices
+        with self._lock:
+            w = self._window(row["crypto"])
+            w.add(row["ts"], row["amount_dec"], row["amount_str"])
+            w.evict(int(time.time()))
+
+    def warm(self, db: Session, cryptos: Iterable[str]) -> None:
+        """Reconstruye el estado desde las últimas 24h de prices (una consulta para todos los pares).
+
+        Las filas llegan del cursor en bloques y van directo a las ventanas, sin una
+        lista intermedia de 24h por par.
+        """
+        since = int(time.time()) - DAY
+        cryptos = list(cryptos)
+        with self._lock:
+            for crypto in cryptos:
+                self._new_window(crypto)
+        w, current = None, None
+        for crypto, ts, amount_dec, amount_str in iter_series_many(db, cryptos, since):
+            if crypto != current:
+                w, current = self._pairs[crypto], crypto
+            with self._lock:
+                w.add(ts, amount_dec, amount_str)
+        now = int(time.time())
+        with self._lock:
+            for crypto in cryptos:
+                self._pairs[crypto].evict(now)
+
+    def table_row(self, crypto: str) -> Dict[str, Any]:
+        with self._lock:
+            w = self._window(crypto)
+            w.evict(int(time.time()))
+            high, low, avg = w.high(), w.low(), w.avg()
+            vol = w.volatility()
+            pct24 = w.pct_change_24h()
+            amount_str = w.last_str if w.ticks else "-"
+            sig = w.signal.signal(avg)
+
+        return {
+            "crypto": crypto,
+            "actual_price": amount_str,
+            "highest_1h": str(high) if high is not None else "-",
+            "lower_1h": str(low) if low is not None else "-",
+            "avg_1h": str(avg) if avg is not None else "-",
+            "signal": sig,
+            "volatility_1h": str(vol) if vol else "-",
+            "pct_change_24h": f"{pct24:.2f}%" if pct24 else "-"
+        }
+
+
+rolling_stats = RollingAggregator()
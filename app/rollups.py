@@ -0,0 +1,240 @@
+# app/rollups.py
+# Rollups OHLC por minuto/hora/día (open/high/low/close/sum/count).
+# El writer los actualiza (upsert) en la misma transacción que inserta los ticks,
+# y /api/arrays y /api/ohlc leen de aquí: el costo depende de los buckets, no de los ticks.
+import sys
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from sqlalchemy import Float, case, cast, delete, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import vectorized
+from .db import Base, Price, PriceDay, PriceHour, PriceMinute, engine
+
+ROLLUPS: Dict[str, Tuple[int, Type[Base]]] = {
+    "minute": (60, PriceMinute),
+    "hour": (3600, PriceHour),
+    "day": (86400, PriceDay),
+}
+
+# Fila de rollup: (ts, open, high, low, close, sum, count)
+RollupRow = Tuple[int, Decimal, Decimal, Decimal, Decimal, Decimal, int]
+
+
+# 🔹 Precio de un rollup como string: SQLite guarda NUMERIC como REAL, y el repr
+# más corto del float recupera el string original del tick (open/high/low/close)
+def price_str(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if engine.dialect.name == "sqlite":
+        return format(Decimal(repr(float(value))), "f")
+    return str(value)
+
+
+def mean_str(total: Any, count: int, *prices: Any) -> str:
+    """Promedio del bucket (sum / count) con la precisión de sus ticks (open/high/low/close).
+
+    En SQLite `sum` es REAL: sin redondear, el cociente arrastra el ruido del float.
+    """
+    places = max(0, max(-Decimal(price_str(p)).as_tuple().exponent for p in prices))
+    mean = Decimal(price_str(total)) / Decimal(count)
+    return format(mean.quantize(Decimal(1).scaleb(-places)), "f")
+
+
+def _dialect_insert(model: Type[Base]):
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def partial_rollups(rows: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Agrega un lote de ticks en parciales por (resolución, par, bucket)."""
+    acc: Dict[str, Dict[Tuple[str, int], Dict[str, Any]]] = {res: {} for res in ROLLUPS}
+    for r in rows:
+        crypto, ts, price = r["crypto"], r["ts"], r["amount_dec"]
+        for res, (size, _) in ROLLUPS.items():
+            key = (crypto, ts // size * size)
+            b = acc[res].get(key)
+            if b is None:
+                acc[res][key] = {
+                    "crypto": crypto, "bucket": key[1],
+                    "open": price, "high": price, "low": price, "close": price,
+                    "open_ts": ts, "close_ts": ts, "sum": price, "count": 1,
+                }
+                continue
+            if ts < b["open_ts"]:
+                b["open"], b["open_ts"] = price, ts
+            if ts >= b["close_ts"]:
+                b["close"], b["close_ts"] = price, ts
+            if price > b["high"]:
+                b["high"] = price
+            if price < b["low"]:
+                b["low"] = price
+            b["sum"] += price
+            b["count"] += 1
+    return {res: list(buckets.values()) for res, buckets in acc.items()}
+
+
+def upsert_rollups(conn: Connection, rows: List[Dict[str, Any]]) -> Dict[str, List[Tuple[str, int]]]:
+    # Dentro de la transacción del llamador (sin commit aquí).
+    # Devuelve los buckets tocados por resolución: {res: [(crypto, bucket)]}
+    if not rows:
+        return {}
+    touched: Dict[str, List[Tuple[str, int]]] = {}
+    for res, partials in partial_rollups(rows).items():
+        upsert_partials(conn, res, partials)
+        touched[res] = [(p["crypto"], p["bucket"]) for p in partials]
+    return touched
+
+
+def read_buckets(conn: Connection, touched: Dict[str, List[Tuple[str, int]]]) -> List[Dict[str, Any]]:
+    """Estado completo de los buckets indicados (tras el upsert), para difundirlo."""
+    out: List[Dict[str, Any]] = []
+    for res, keys in touched.items():
+        if not keys:
+            continue
+        model = ROLLUPS[res][1]
+        stmt = select(
+            model.crypto, model.bucket, model.open, model.high, model.low, model.close, model.sum, model.count
+        ).where(tuple_(model.crypto, model.bucket).in_(keys))
+        for crypto, bucket, o, h, l, c, total, count in conn.execute(stmt):
+            out.append({
+                "crypto": crypto, "resolution": res, "ts": bucket,
+                "price": mean_str(total, count, o, h, l, c), "open": o, "high": h, "low": l, "close": c,
+            })
+    return out
+
+
+def upsert_partials(conn: Connection, resolution: str, partials: List[Dict[str, Any]]) -> None:
+    # Fusiona parciales con los buckets existentes (open/close por ts, sum/count acumulados)
+    if not partials:
+        return
+    model = ROLLUPS[resolution][1]
+    t = model.__table__
+    stmt = _dialect_insert(model)
+    ex = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.crypto, t.c.bucket],
+        set_={
+            "open": case((ex.open_ts < t.c.open_ts, ex.open), else_=t.c.open),
+            "open_ts": case((ex.open_ts < t.c.open_ts, ex.open_ts), else_=t.c.open_ts),
+            "high": case((ex.high > t.c.high, ex.high), else_=t.c.high),
+            "low": case((ex.low < t.c.low, ex.low), else_=t.c.low),
+            "close": case((ex.close_ts >= t.c.close_ts, ex.close), else_=t.c.close),
+            "close_ts": case((ex.close_ts >= t.c.close_ts, ex.close_ts), else_=t.c.close_ts),
+            "sum": t.c.sum + ex.sum,
+            "count": t.c.count + ex.count,
+        },
+    )
+    conn.execute(stmt, partials)
+
+
+def read_rollups(db: Session, crypto: str, resolution: str, since_ts: int) -> List[RollupRow]:
+    # Buckets que terminan después de since_ts, en orden ascendente
+    size, model = ROLLUPS[resolution]
+    stmt = select(
+        model.bucket, model.open, model.high, model.low, model.close, model.sum, model.count
+    ).where(
+        model.crypto == crypto, model.bucket > since_ts - size
+    ).order_by(model.bucket.asc())
+    return [tuple(row) for row in db.execute(stmt).all()]
+
+
+def read_rollups_many(db: Session, cryptos: List[str], resolution: str, since_ts: int) -> Dict[str, List[RollupRow]]:
+    # Igual que read_rollups para varios pares en una sola consulta
+    size, model = ROLLUPS[resolution]
+    stmt = select(
+        model.crypto, model.bucket, model.open, model.high, model.low, model.close, model.sum, model.count
+    ).where(
+        model.crypto.in_(cryptos), model.bucket > since_ts - size
+    ).order_by(model.crypto.asc(), model.bucket.asc())
+    out: Dict[str, List[RollupRow]] = {c: [] for c in cryptos}
+    for row in db.execute(stmt):
+        out[row[0]].append(tuple(row[1:]))
+    return out
+
+
+def iter_rollups(db: Session, crypto: str, resolution: str, since_ts: int, until_ts: int) -> Iterator[RollupRow]:
+    # Buckets que se solapan con [since_ts, until_ts], leídos del cursor en orden ascendente
+    size, model = ROLLUPS[resolution]
+    stmt = select(
+        model.bucket, model.open, model.high, model.low, model.close, model.sum, model.count
+    ).where(
+        model.crypto == crypto, model.bucket > since_ts - size, model.bucket <= until_ts
+    ).order_by(model.bucket.asc())
+    for row in db.execute(stmt):
+        yield tuple(row)
+
+
+def rebuild_start(conn: Connection, crypto: str, since_ts: int) -> int:
+    """Primer bucket de día que se puede reconstruir desde prices sin perder historia.
+
+    Si la retención ya compactó ticks viejos (hay rollups de minuto/hora anteriores
+    al primer tick crudo), lo anterior al primer día completo en prices no se toca.
+    """
+    day = ROLLUPS["day"][0]
+    start = since_ts // day * day   # alinear al día para no partir buckets
+    first_tick = conn.execute(select(func.min(Price.ts)).where(Price.crypto == crypto)).scalar()
+    if first_tick is None or start >= first_tick:
+        return start
+    compacted = any(
+        conn.execute(select(func.min(model.bucket)).where(
+            model.crypto == crypto, model.bucket < first_tick // size * size
+        )).scalar() is not None
+        for size, model in (ROLLUPS["minute"], ROLLUPS["hour"])
+    )
+    if not compacted:
+        return start
+    safe = -(-first_tick // day) * day
+    print(f"[WARN] {crypto}: los ticks anteriores a {first_tick} ya se compactaron; "
+          f"se conservan los rollups anteriores a {safe}")
+    return safe
+
+
+# 🔹 Backfill: reconstruye los rollups desde el historial de prices.
+# Ejecutar con el colector detenido: python -m app.rollups backfill [desde_epoch]
+def backfill(since_ts: Optional[int] = None, chunk: int = 50000) -> int:
+    total = 0
+    with engine.connect() as conn:
+        cryptos = [c for (c,) in conn.execute(select(Price.crypto).distinct())]
+        for crypto in cryptos:
+            start = rebuild_start(conn, crypto, since_ts or 0)
+            for _, model in ROLLUPS.values():
+                conn.execute(delete(model).where(model.crypto == crypto, model.bucket >= start))
+            use_np = vectorized.available()
+            # Con NumPy se lee el precio como REAL y se agrupa con reduceat
+            price_col = cast(Price.amount_dec, Float) if use_np else Price.amount_dec
+            stmt = select(Price.ts, price_col).where(
+                Price.crypto == crypto, Price.ts >= start
+            ).order_by(Price.ts.asc(), Price.id.asc())
+            result = conn.execution_options(stream_results=True).execute(stmt)
+            while True:
+                batch = result.fetchmany(chunk)
+                if not batch:
+                    break
+                if use_np:
+                    # Los buckets partidos entre bloques se fusionan en el upsert
+                    ts, px = vectorized.to_arrays(batch)
+                    for res, (size, _) in ROLLUPS.items():
+                        upsert_partials(conn, res, vectorized.rollup_partials(crypto, ts, px, size))
+                else:
+                    upsert_rollups(conn, [{"crypto": crypto, "ts": ts, "amount_dec": a} for ts, a in batch])
+                total += len(batch)
+            conn.commit()
+            print(f"[INFO] Rollups reconstruidos para {crypto}")
+    return total
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill":
+        print("Uso: python -m app.rollups backfill [desde_epoch]")
+        sys.exit(1)
+    from .db import init_db
+    init_db()
+    t0 = time.time()
+    n = backfill(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    print(f"[INFO] Backfill: {n} ticks en {time.time() - t0:.1f}s")
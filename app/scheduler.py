@@ -0,0 +1,201 @@
+# app/scheduler.py
+# Planificador de extracción por par: límite global con token bucket, intervalo
+# adaptativo por par (rápido si el precio se mueve, lento si está quieto), ticks
+# con jitter y corrección de deriva, y backoff exponencial ante 429/5xx/errores.
+import asyncio
+import heapq
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from . import metrics
+
+FETCH_SECONDS = metrics.Histogram("etl_fetch_seconds", "Latencia de cada petición de precio", ["pair"])
+FETCH_ERRORS = metrics.Counter("etl_fetch_errors_total", "Peticiones de precio fallidas", ["pair", "reason"])
+
+FetchFn = Callable[[str], Awaitable[Dict[str, Any]]]
+EmitFn = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class PairState:
+    def __init__(self, pair: str, interval: float, base: float) -> None:
+        self.pair = pair
+        self.interval = interval
+        self.base = base                      # instante planificado (sin jitter)
+        self.inflight = False
+        self.failures = 0
+        self.last_amount: Optional[str] = None
+        # Contadores
+        self.fetches = 0
+        self.errors = 0
+        self.missed = 0
+        self.latency_last = 0.0
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+        self.lag_last = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_s": round(self.interval, 3),
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "missed_ticks": self.missed,
+            "consecutive_failures": self.failures,
+            "latency_last_ms": round(self.latency_last * 1000, 1),
+            "latency_avg_ms": round(self.latency_avg * 1000, 1),
+            "latency_max_ms": round(self.latency_max * 1000, 1),
+            "lag_last_ms": round(self.lag_last * 1000, 1),
+        }
+
+
+class FetchScheduler:
+    def __init__(self) -> None:
+        base = float(os.getenv("FETCH_INTERVAL_SECONDS", "5"))
+        self.min_interval = float(os.getenv("FETCH_MIN_INTERVAL", str(base)))
+        self.max_interval = float(os.getenv("FETCH_MAX_INTERVAL", str(base * 4)))
+        self.base_interval = min(max(base, self.min_interval), self.max_interval)
+        self.jitter = float(os.getenv("FETCH_JITTER", "0.1"))
+        self.backoff_base = float(os.getenv("FETCH_BACKOFF_BASE", "1"))
+        self.backoff_max = float(os.getenv("FETCH_BACKOFF_MAX", "60"))
+        rate = float(os.getenv("FETCH_RATE_LIMIT", "10"))   # peticiones/s globales
+        self.bucket = TokenBucket(rate, float(os.getenv("FETCH_RATE_BURST", str(rate))))
+        self.semaphore = asyncio.Semaphore(int(os.getenv("FETCH_CONCURRENCY", "8")))
+        self.pairs: Dict[str, PairState] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: Set["asyncio.Task[None]"] = set()
+
+    def _push(self, st: PairState, at: float) -> None:
+        heapq.heappush(self._heap, (at, st.pair))
+        if self._wake is not None:
+            self._wake.set()
+
+    def _next_fire(self, st: PairState) -> float:
+        # Corrección de deriva: la base avanza un intervalo desde lo planificado,
+        # no desde que terminó la petición. Si ya pasó, se cuentan ticks perdidos.
+        now = time.monotonic()
+        st.base += st.interval
+        if st.base < now:
+            behind = int((now - st.base) // st.interval) + 1
+            st.missed += behind
+            st.base += behind * st.interval
+        return st.base + random.uniform(-self.jitter, self.jitter) * st.interval
+
+    def _backoff(self, st: PairState, retry_after: Optional[float]) -> float:
+        st.failures += 1
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (st.failures - 1))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        now = time.monotonic()
+        # La base se re-alinea para no contar como perdidos los ticks del backoff
+        st.base = now + delay
+        return st.base
+
+    def _adapt(self, st: PairState, amount: Optional[str]) -> None:
+        if st.last_amount is not None:
+            if amount != st.last_amount:
+                st.interval = max(self.min_interval, st.interval / 2)
+            else:
+                st.interval = min(self.max_interval, st.interval * 1.5)
+        st.last_amount = amount
+
+    async def _fetch_one(self, st: PairState, fetch: FetchFn, emit: EmitFn, scheduled: float) -> None:
+        payload = None
+        retry_after: Optional[float] = None
+        try:
+            async with self.semaphore:
+                await self.bucket.acquire()
+                start = time.monotonic()
+                st.lag_last = max(0.0, start - scheduled)
+                try:
+                    payload = await fetch(st.pair)
+                except httpx.HTTPStatusError as e:
+                    header = e.response.headers.get("Retry-After")
+                    if header and header.isdigit():
+                        retry_after = float(header)
+                    raise
+                finally:
+                    elapsed = time.monotonic() - start
+                    FETCH_SECONDS.observe(elapsed, pair=st.pair)
+                    st.latency_last = elapsed
+                    st.latency_max = max(st.latency_max, elapsed)
+                    st.latency_avg = elapsed if st.fetches == 0 else 0.8 * st.latency_avg + 0.2 * elapsed
+                    st.fetches += 1
+            st.failures = 0
+            self._adapt(st, payload.get("amount_str"))
+            next_at = self._next_fire(st)
+        except Exception as e:
+            # 429, 5xx, timeouts, errores de red: backoff exponencial por par
+            st.errors += 1
+            reason = str(e.response.status_code) if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+            FETCH_ERRORS.inc(pair=st.pair, reason=reason)
+            next_at = self._backoff(st, retry_after)
+            if st.failures == 1:
+                # Solo el primer fallo de una racha: el backoff no inunda el log
+                print(f"[WARN] Petición de {st.pair} falló ({reason}): {e}; reintento en {next_at - time.monotonic():.1f}s")
+        finally:
+            st.inflight = False
+        self._push(st, next_at)
+        if payload is not None:
+            await emit(payload)
+
+    async def run(self, pairs: List[str], fetch: FetchFn, emit: EmitFn) -> None:
+        self._wake = asyncio.Event()
+        now = time.monotonic()
+        for i, pair in enumerate(pairs):
+            # Escalonar el arranque para no enviar todas las peticiones en ráfaga
+            start = now + self.base_interval * i / max(1, len(pairs))
+            st = self.pairs[pair] = PairState(pair, self.base_interval, start)
+            self._push(st, start)
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            at, pair = self._heap[0]
+            delay = at - time.monotonic()
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            st = self.pairs[pair]
+            if st.inflight:
+                # La petición anterior sigue en curso: tick perdido
+                st.missed += 1
+                self._push(st, self._next_fire(st))
+                continue
+            st.inflight = True
+            task = asyncio.create_task(self._fetch_one(st, fetch, emit, at))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {pair: st.stats() for pair, st in self.pairs.items()}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 
 class TableRow(BaseModel):
     crypto: str
@@ -22,3 +22,16 @@ class ArrayResponse(BaseModel):
     crypto: str
     resolution: str
     points: List[ArrayPoint]
+
+class AlertRuleIn(BaseModel):
+    # kind: price_cross (level = precio), pct_change (level = % sobre window),
+    # volatility (level = desviación/promedio en % sobre window), ema_cross (fast/slow)
+    crypto: str
+    kind: Literal["price_cross", "pct_change", "ema_cross", "volatility"]
+    level: Optional[float] = None
+    direction: Optional[Literal["up", "down", "any"]] = None
+    window: Optional[int] = None
+    fast: Optional[int] = None
+    slow: Optional[int] = None
+    webhook: Optional[str] = None
+    once: bool = False
@@ -1,5 +1,5 @@
 from decimal import Decimal, InvalidOperation
-from typing import List, Tuple, Optional, Union
+from typing import Dict, List, Tuple, Optional, Union
 
 def ema(values: List[Decimal], period: int) -> List[Decimal]:
     # Cálculo EMA clásico
@@ -46,3 +46,111 @@ def signal_bs(prices: List[Decimal], avg_1h: Optional[Union[Decimal, float, str]
             pass
 
     return "-"
+
+# 🔹 Motor incremental de señales (O(1) por tick)
+# Mantiene EMA rápida/lenta sobre la MISMA ventana que usa signal_bs (la EMA se
+# siembra con el primer precio de la ventana). Al expulsar el tick más antiguo
+# x0 (nuevo primero x1) la EMA se corrige con: e' = e - (1-k)^(n-1) * (x0 - x1),
+# así el resultado B/S/- coincide con signal_bs sobre la ventana completa.
+
+class SignalConfig:
+    __slots__ = ("fast", "slow", "min_points", "band_up", "band_down")
+
+    def __init__(self, fast: int = 5, slow: int = 15, band: Union[Decimal, str] = "0.002",
+                 min_points: Optional[int] = None) -> None:
+        band = Decimal(str(band))
+        self.fast = fast
+        self.slow = slow
+        self.min_points = min_points if min_points is not None else slow
+        self.band_up = Decimal(1) + band
+        self.band_down = Decimal(1) - band
+
+DEFAULT_CONFIG = SignalConfig()
+
+def parse_signal_config(raw: str) -> Dict[str, SignalConfig]:
+    # "BTC-USD=5/15/0.002,DOGE-USD=8/21/0.005" -> {par: SignalConfig}
+    configs: Dict[str, SignalConfig] = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        pair, spec = item.split("=", 1)
+        parts = spec.strip().split("/")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid signal config for {pair!r}: {spec!r}")
+        band = parts[2] if len(parts) == 3 else "0.002"
+        configs[pair.strip().upper()] = SignalConfig(int(parts[0]), int(parts[1]), band)
+    return configs
+
+class _WindowEma:
+    __slots__ = ("k", "q", "value", "prev", "_d", "_d_prev")
+
+    def __init__(self, period: int) -> None:
+        self.k = Decimal(2) / Decimal(period + 1)
+        self.q = Decimal(1) - self.k
+        self.value: Optional[Decimal] = None   # EMA de la ventana completa
+        self.prev: Optional[Decimal] = None    # EMA sin el último tick
+        self._d = Decimal(1)                   # (1-k)^(n-1)
+        self._d_prev = Decimal(1)              # (1-k)^(n-2)
+
+    def push(self, v: Decimal) -> None:
+        if self.value is None:
+            self.value = v
+            self._d = Decimal(1)
+            return
+        self.prev, self._d_prev = self.value, self._d
+        self.value = (v - self.value) * self.k + self.value
+        self._d = self._d * self.q
+
+    def evict(self, x0: Decimal, x1: Optional[Decimal], n: int) -> None:
+        # n: tamaño de la ventana antes de expulsar x0
+        if n <= 1 or x1 is None:
+            self.value = self.prev = None
+            return
+        diff = x0 - x1
+        self.value -= self._d * diff
+        self._d = self._d / self.q
+        if n >= 3:
+            self.prev -= self._d_prev * diff
+            self._d_prev = self._d_prev / self.q
+        else:
+            self.prev = None
+
+class SignalState:
+    """Estado EMA rápida/lenta de un par sobre su ventana de 1h."""
+    __slots__ = ("config", "n", "last", "_fast", "_slow")
+
+    def __init__(self, config: SignalConfig = DEFAULT_CONFIG) -> None:
+        self.config = config
+        self.n = 0
+        self.last: Optional[Decimal] = None
+        self._fast = _WindowEma(config.fast)
+        self._slow = _WindowEma(config.slow)
+
+    def push(self, price: Decimal) -> None:
+        self._fast.push(price)
+        self._slow.push(price)
+        self.n += 1
+        self.last = price
+
+    def evict(self, x0: Decimal, x1: Optional[Decimal]) -> None:
+        self._fast.evict(x0, x1, self.n)
+        self._slow.evict(x0, x1, self.n)
+        self.n -= 1
+        if self.n == 0:
+            self.last = None
+
+    def signal(self, avg_1h: Optional[Decimal]) -> str:
+        cfg = self.config
+        if self.n < cfg.min_points or self.n < 2:
+            return "-"
+        f, s = self._fast, self._slow
+        if f.prev <= s.prev and f.value > s.value:
+            return "B"
+        if f.prev >= s.prev and f.value < s.value:
+            return "S"
+        if avg_1h is not None:
+            if self.last > avg_1h * cfg.band_up:
+                return "B"
+            if self.last < avg_1h * cfg.band_down:
+                return "S"
+        return "-"
@@ -0,0 +1,96 @@
+# app/stream.py
+# Difusión server-push (SSE) alimentada por el EventBus. Cada cliente tiene una
+# cola acotada; si un cliente lento la llena se le desconecta (slow consumer)
+# para que nunca frene a la carga ni a los demás clientes.
+import asyncio
+import json
+import os
+from typing import Any, Dict, Iterable, Optional, Set
+
+from . import metrics
+from .rolling import rolling_stats
+
+
+class StreamClient:
+    def __init__(self, maxsize: int, cryptos: Optional[Set[str]] = None) -> None:
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=maxsize)
+        self.cryptos = cryptos
+        self.dropped = False
+
+    def wants(self, crypto: str) -> bool:
+        return self.cryptos is None or crypto in self.cryptos
+
+
+class Broadcaster:
+    def __init__(self, maxsize: Optional[int] = None) -> None:
+        self.maxsize = maxsize or int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+        self.clients: Set[StreamClient] = set()
+        self.dropped_total = 0
+
+    def subscribe(self, cryptos: Optional[Set[str]] = None) -> StreamClient:
+        client = StreamClient(self.maxsize, cryptos)
+        self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client: StreamClient) -> None:
+        self.clients.discard(client)
+
+    def publish(self, event: str, crypto: str, data: Dict[str, Any]) -> None:
+        # Se serializa una sola vez para todos los clientes
+        message = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        for client in list(self.clients):
+            if not client.wants(crypto):
+                continue
+            try:
+                client.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self._drop(client)
+
+    def _drop(self, client: StreamClient) -> None:
+        # Cliente lento: se vacía su cola y se le envía el fin del stream
+        client.dropped = True
+        self.dropped_total += 1
+        self.clients.discard(client)
+        while not client.queue.empty():
+            client.queue.get_nowait()
+        client.queue.put_nowait(None)
+
+    async def events(self, client: StreamClient, heartbeat: float = 15.0):
+        # Generador para StreamingResponse (text/event-stream)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(client.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(client)
+
+
+broadcaster = Broadcaster()
+
+
+@metrics.registry.collector
+def _stream_metrics() -> Iterable[metrics.Family]:
+    yield ("stream_clients", "gauge", "Clientes SSE conectados", [({}, len(broadcaster.clients))])
+    yield ("stream_dropped_total", "counter", "Clientes SSE desconectados por lentos", [({}, broadcaster.dropped_total)])
+
+
+# 🔹 Handlers del EventBus ("price_loaded" / "rollup_updated")
+def push_tick(row: Dict[str, Any]) -> None:
+    if not broadcaster.clients:
+        return
+    crypto = row["crypto"]
+    broadcaster.publish("tick", crypto, {"crypto": crypto, "ts": row["ts"], "price": row["amount_str"]})
+    broadcaster.publish("row", crypto, rolling_stats.table_row(crypto))
+
+
+def push_bucket(bucket: Dict[str, Any]) -> None:
+    if not broadcaster.clients:
+        return
+    broadcaster.publish("bucket", bucket["crypto"], bucket)
@@ -0,0 +1,69 @@
+# app/vectorized.py
+# Motor vectorizado opcional (NumPy) para el backfill de rollups: pasa cada bloque
+# de ticks a arreglos contiguos int64/float64 y calcula OHLC/sum/count por bucket
+# con reduceat. El string Decimal sigue siendo la fuente del precio mostrado.
+# Si NumPy no está instalado (o USE_NUMPY=0) se usa el camino Decimal.
+import os
+from typing import Any, Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+
+def available() -> bool:
+    return np is not None and os.getenv("USE_NUMPY", "1") != "0"
+
+
+def to_arrays(rows: List[Tuple[int, Any]]) -> Tuple["np.ndarray", "np.ndarray"]:
+    n = len(rows)
+    ts = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    px = np.fromiter((float(r[1]) for r in rows), dtype=np.float64, count=n)
+    return ts, px
+
+
+def bucket_starts(ts: "np.ndarray", size: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    # Índices donde empieza cada bucket (ts ordenado) y la clave de cada bucket
+    keys = ts // size * size
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64), keys
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return starts, keys[starts]
+
+
+def bucket_ohlc(ts: "np.ndarray", px: "np.ndarray", size: int) -> Dict[str, "np.ndarray"]:
+    """OHLC + sum/count por bucket de `size` segundos."""
+    starts, keys = bucket_starts(ts, size)
+    if len(starts) == 0:
+        empty_f = np.empty(0, dtype=np.float64)
+        empty_i = np.empty(0, dtype=np.int64)
+        return {"bucket": empty_i, "open": empty_f, "high": empty_f, "low": empty_f,
+                "close": empty_f, "open_ts": empty_i, "close_ts": empty_i,
+                "sum": empty_f, "count": empty_i}
+    ends = np.concatenate((starts[1:], [len(px)])) - 1
+    return {
+        "bucket": keys,
+        "open": px[starts],
+        "high": np.maximum.reduceat(px, starts),
+        "low": np.minimum.reduceat(px, starts),
+        "close": px[ends],
+        "open_ts": ts[starts],
+        "close_ts": ts[ends],
+        "sum": np.add.reduceat(px, starts),
+        "count": ends - starts + 1,
+    }
+
+
+def rollup_partials(crypto: str, ts: "np.ndarray", px: "np.ndarray", size: int) -> List[Dict[str, Any]]:
+    # Filas parciales listas para rollups.upsert_partials
+    b = bucket_ohlc(ts, px, size)
+    return [
+        {"crypto": crypto, "bucket": int(b["bucket"][i]),
+         "open": float(b["open"][i]), "high": float(b["high"][i]),
+         "low": float(b["low"][i]), "close": float(b["close"][i]),
+         "open_ts": int(b["open_ts"][i]), "close_ts": int(b["close_ts"][i]),
+         "sum": float(b["sum"][i]), "count": int(b["count"][i])}
+        for i in range(len(b["bucket"]))
+    ]
+
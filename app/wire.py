@@ -0,0 +1,139 @@
+# app/wire.py
+# Formato de respuesta de series/OHLC:
+# - dumps(): JSON rápido (orjson si está instalado, si no json con separadores compactos).
+# - Forma columnar opcional (?format=columnar): arrays "ts" (delta) + precios como
+#   números JSON, escritos desde el string exacto del precio (sin float ni pydantic).
+# - Compresión negociada por Accept-Encoding: brotli (si está instalado) o gzip.
+import gzip
+import json
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # dependencia opcional
+    brotli = None
+
+FORMATS = ("rows", "columnar")
+
+_JSON_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, separators=(",", ":"), default=_default).encode()
+
+
+def number(value: Any) -> str:
+    # Token de número JSON con el mismo texto que el precio exacto (ej. "114410.875")
+    text = value if isinstance(value, str) else str(value)
+    if _JSON_NUMBER.fullmatch(text):
+        return text
+    return repr(float(text))
+
+
+def delta_ts(ts: Sequence[int]) -> List[int]:
+    # [t0, t1 - t0, t2 - t1, ...]: enteros pequeños, más cortos en el cable
+    return [t - ts[i - 1] if i else t for i, t in enumerate(ts)]
+
+
+def _column_fields(ts: Sequence[int], columns: Dict[str, Iterable[Any]]) -> str:
+    parts = ['"ts_encoding":"delta","ts":', dumps(delta_ts(ts)).decode()]
+    for name, values in columns.items():
+        parts.append(f',"{name}":[{",".join(number(v) for v in values)}]')
+    return "".join(parts)
+
+
+def _columns(header: Dict[str, Any], ts: Sequence[int], columns: Dict[str, Iterable[Any]]) -> bytes:
+    return (dumps(header)[:-1].decode() + "," + _column_fields(ts, columns) + "}").encode()
+
+
+def series_columnar(crypto: str, resolution: str, points: List[Dict[str, Any]]) -> bytes:
+    return _columns(
+        {"crypto": crypto, "resolution": resolution, "format": "columnar"},
+        [p["ts"] for p in points],
+        {"price": (p["price"] for p in points)},
+    )
+
+
+def ohlc_columnar(crypto: str, resolution: str, candles: List[Dict[str, Any]]) -> bytes:
+    return _columns(
+        {"crypto": crypto, "resolution": resolution, "format": "columnar"},
+        [c["ts"] for c in candles],
+        {k: (c[k] for c in candles) for k in ("open", "high", "low", "close")},
+    )
+
+
+def batch(table: Optional[List[Dict[str, Any]]], series: Dict[str, Dict[str, List[Dict[str, Any]]]], format: str) -> bytes:
+    """Respuesta de /api/batch: {"table": [...], "series": {res: {crypto: puntos}}}.
+
+    En columnar cada serie es {"ts_encoding","ts","price"} sin repetir crypto/resolución.
+    """
+    if format != "columnar":
+        body: Dict[str, Any] = {"series": series}
+        if table is not None:
+            body = {"table": table, **body}
+        return dumps(body)
+    parts = ["{"]
+    if table is not None:
+        parts += ['"table":', dumps(table).decode(), ","]
+    parts.append('"format":"columnar","series":{')
+    parts.append(",".join(
+        dumps(res).decode() + ":{" + ",".join(
+            dumps(crypto).decode() + ":{" + _column_fields(
+                [p["ts"] for p in points], {"price": (p["price"] for p in points)}
+            ) + "}"
+            for crypto, points in by_crypto.items()
+        ) + "}"
+        for res, by_crypto in series.items()
+    ))
+    parts.append("}}")
+    return "".join(parts).encode()
+
+
+# 🔹 Compresión
+def negotiate(accept_encoding: str) -> Optional[str]:
+    # q=0 rechaza la codificación; gana el q más alto (br antes que gzip si empatan).
+    # "*" vale para las codificaciones no nombradas
+    q: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = (x.strip() for x in part.split(";"))
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        q[name.lower()] = weight
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for coding in offered:
+        weight = q.get(coding, q.get("*", 0.0))
+        if weight > best_q:
+            best, best_q = coding, weight
+    return best
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=5)
+    return body
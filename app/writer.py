@@ -0,0 +1,145 @@
+# app/writer.py
+# Etapa de carga por lotes: acumula payloads transformados y los escribe en
+# prices (SQLAlchemy) y sus rollups OHLC con una transacción por lote.
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from . import metrics
+from .crud import changed_rows, insert_prices_batch, remember_last_prices
+from .db import engine
+from .executor import run_write
+from .rollups import read_buckets, upsert_rollups
+
+LOAD_SECONDS = metrics.Histogram("etl_load_batch_seconds", "Duración de cada lote (filtro, insert, rollups, commit)")
+TICKS = metrics.Counter("etl_ticks_total", "Ticks que llegaron a la carga, por resultado", ["result"])
+LOAD_FAILURES = metrics.Counter("etl_load_failures_total", "Lotes con error de escritura (vuelven al buffer y se reintentan)")
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        max_batch: Optional[int] = None,
+        max_delay: Optional[float] = None,
+        on_flush: Optional[Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], Awaitable[None]]] = None,
+    ) -> None:
+        self.max_batch = max_batch or int(os.getenv("WRITE_BATCH_SIZE", "100"))
+        self.max_delay = max_delay if max_delay is not None else float(os.getenv("WRITE_BATCH_SECONDS", "1.0"))
+        # Tope de ticks pendientes mientras la escritura falla (p. ej. "database is locked")
+        self.max_pending = int(os.getenv("WRITE_MAX_PENDING", str(self.max_batch * 10)))
+        self.on_flush = on_flush
+        self._buffer: List[Dict[str, Any]] = []
+        self._first_at: Optional[float] = None
+        self._full: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[Connection] = None
+
+    # 🔹 Conexión de larga vida (no se pide una al pool por lote)
+    def _connection(self) -> Connection:
+        if self._conn is None or self._conn.closed:
+            self._conn = engine.connect()
+        return self._conn
+
+    def add(self, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            if not self._buffer:
+                self._first_at = time.monotonic()
+            self._buffer.append(payload)
+            full = len(self._buffer) >= self.max_batch
+        if full and self._full is not None:
+            self._full.set()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Escribe el lote pendiente; devuelve las filas insertadas en prices."""
+        return self._write()[0]
+
+    def _write(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        # (filas insertadas, buckets de rollup actualizados)
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+            self._first_at = None
+        if not batch:
+            return [], []
+        start = time.perf_counter()
+        conn = self._connection()
+        try:
+            rows = changed_rows(conn, batch)
+            insert_prices_batch(conn, rows)
+            buckets = read_buckets(conn, upsert_rollups(conn, rows))
+            conn.commit()
+        except OperationalError:
+            # Transitorio (base bloqueada, disco): el lote se reintenta
+            conn.rollback()
+            LOAD_FAILURES.inc()
+            self._requeue(batch)
+            raise
+        except Exception:
+            # Reintentar no lo arreglaría: el lote se descarta
+            conn.rollback()
+            TICKS.inc(len(batch), result="dropped")
+            raise
+        remember_last_prices(rows)
+        LOAD_SECONDS.observe(time.perf_counter() - start)
+        TICKS.inc(len(rows), result="inserted")
+        TICKS.inc(len(batch) - len(rows), result="unchanged")
+        print(f"[INFO] Lote escrito: {len(batch)} ticks, {len(rows)} precios nuevos")
+        return rows, buckets
+
+    def _requeue(self, batch: List[Dict[str, Any]]) -> None:
+        # El lote fallido vuelve al frente del buffer y se reintenta en el próximo
+        # vaciado (remember_last_prices no corrió: changed_rows lo vuelve a filtrar).
+        # Por encima de max_pending se descartan los ticks más viejos
+        with self._lock:
+            self._buffer = batch + self._buffer
+            overflow = len(self._buffer) - self.max_pending
+            if overflow > 0:
+                del self._buffer[:overflow]
+                TICKS.inc(overflow, result="dropped")
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+
+    async def _flush_and_notify(self) -> None:
+        try:
+            # La escritura corre en el hilo del writer, no en el event loop
+            rows, buckets = await run_write(self._write)
+        except Exception as e:
+            # OperationalError: el lote volvió al buffer y se reintenta tras max_delay
+            print(f"[WARN] Error escribiendo lote ({self.pending()} ticks pendientes): {type(e).__name__}: {e}")
+            return
+        if rows and self.on_flush is not None:
+            await self.on_flush(rows, buckets)
+
+    async def run(self) -> None:
+        # Vacía por tamaño (evento) o por tiempo (max_delay desde el primer tick del lote)
+        self._full = asyncio.Event()
+        while True:
+            timeout = self.max_delay
+            if self._first_at is not None:
+                timeout = max(0.0, self.max_delay - (time.monotonic() - self._first_at))
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            if self._buffer:
+                await self._flush_and_notify()
+
+    async def drain(self) -> None:
+        # Vacía lo pendiente y notifica (cierre ordenado, benchmarks)
+        if self._buffer:
+            await self._flush_and_notify()
+
+    def close(self) -> None:
+        if self._buffer:
+            self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,144 @@
+# bench/etl.py
+# Benchmark de la cadena completa EventBus → transform → load (BatchWriter)
+# contra la fuente simulada: ticks/s, latencia extremo a extremo (p50/p99,
+# desde que el tick entra al bus hasta "price_loaded") y crecimiento de la DB.
+#
+#   python -m bench.etl --pairs 50 --rate 2000 --seconds 10 [--replay ticks.csv] [--json out.json]
+#
+# Usa bases temporales (DB_URL y COLLECTOR_DB_PATH) salvo que se indique --workdir.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark de ingesta con la fuente simulada")
+    p.add_argument("--pairs", type=int, default=50)
+    p.add_argument("--rate", type=float, default=2000.0, help="ticks/s objetivo (total)")
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--replay", default=None, help="CSV pair,amount para repetir ticks grabados")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--bus-mode", choices=("sync", "queued"), default=None, help="EVENT_BUS_MODE")
+    p.add_argument("--slow-handler-ms", type=float, default=0.0,
+                   help="añade un suscriptor de price_loaded que tarda esto (coalesce)")
+    p.add_argument("--workdir", default=None)
+    p.add_argument("--json", default=None, help="guardar el resultado en este archivo")
+    return p.parse_args()
+
+
+def _db_size(paths: List[str]) -> int:
+    total = 0
+    for path in paths:
+        for suffix in ("", "-wal"):
+            if os.path.exists(path + suffix):
+                total += os.path.getsize(path + suffix)
+    return total
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def _run(args: argparse.Namespace, db_files: List[str]) -> Dict[str, Any]:
+    # Importar después de fijar las variables de entorno
+    from app.collector import SimulatedSource, event_bus, setup_event_chain, writer
+    from app.db import init_db
+    from app.executor import run_db, shutdown
+
+    pairs = [f"SIM{i}-USD" for i in range(args.pairs)]
+    await run_db(init_db)
+    setup_event_chain()
+
+    sent: Dict[Tuple[str, str], float] = {}
+    latencies: List[float] = []
+    loaded = 0
+
+    def on_loaded(row: Dict[str, Any]) -> None:
+        nonlocal loaded
+        loaded += 1
+        # Con replay un mismo precio puede repetirse: se mide contra su último envío
+        t = sent.pop((row["crypto"], row["amount_str"]), None)
+        if t is not None:
+            latencies.append(time.perf_counter() - t)
+
+    event_bus.on("price_loaded", on_loaded)
+    if args.slow_handler_ms:
+        async def slow(row: Dict[str, Any]) -> None:
+            await asyncio.sleep(args.slow_handler_ms / 1000)
+        event_bus.on("price_loaded", slow, policy="coalesce")
+    event_bus.start()
+    source = SimulatedSource(replay_path=args.replay, seed=args.seed)
+    size_before = _db_size(db_files)
+    writer_task = asyncio.create_task(writer.run())
+
+    emitted = 0
+    t0 = time.perf_counter()
+    deadline = t0 + args.seconds
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        # Ritmo objetivo: si vamos atrasados no se duerme (se mide el máximo alcanzable)
+        due = t0 + emitted / args.rate
+        if due > now:
+            await asyncio.sleep(due - now)
+        payload = await source.fetch(pairs[emitted % len(pairs)])
+        sent[(payload["pair"], payload["amount_str"])] = time.perf_counter()
+        await event_bus.emit("price_raw", payload)
+        emitted += 1
+    ingest_elapsed = time.perf_counter() - t0
+    await writer.drain()
+    await event_bus.join()
+    total_elapsed = time.perf_counter() - t0
+    writer_task.cancel()
+    await asyncio.gather(writer_task, return_exceptions=True)
+    writer.close()
+    await event_bus.stop()
+    shutdown()
+
+    size_after = _db_size(db_files)
+    return {
+        "bus_mode": event_bus.mode,
+        "pairs": args.pairs,
+        "target_rate": args.rate,
+        "seconds": round(ingest_elapsed, 3),
+        "ticks_emitted": emitted,
+        "ticks_loaded": loaded,
+        "emit_ticks_per_s": round(emitted / ingest_elapsed, 1),
+        "loaded_ticks_per_s": round(loaded / total_elapsed, 1),
+        "latency_p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "db_growth_bytes": size_after - size_before,
+        "bytes_per_tick": round((size_after - size_before) / loaded, 1) if loaded else 0.0,
+    }
+
+
+def main() -> None:
+    args = _parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_etl_")
+    prices_db = os.path.join(workdir, "prices.sqlite")
+    # Ruta inexistente: el benchmark nunca importa el crypto.db del proyecto
+    legacy_db = os.path.join(workdir, "crypto.db")
+    os.environ["DB_URL"] = f"sqlite:///{prices_db}"
+    os.environ["COLLECTOR_DB_PATH"] = legacy_db
+    if args.bus_mode:
+        os.environ["EVENT_BUS_MODE"] = args.bus_mode
+    result = asyncio.run(_run(args, [prices_db]))
+    result["workdir"] = workdir
+    for k, v in result.items():
+        print(f"{k:>20}: {v}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# bench/memory.py
+# Regresión de memoria de las lecturas de series: siembra un par con 1 tick/s y
+# mide con tracemalloc el pico de cada lectura sobre ventanas de tamaño creciente
+# con el mismo presupuesto de salida (max_points). Los caminos en streaming
+# (cursor en bloques + bucketers incrementales / LTTB) deben quedar acotados por
+# la salida, no por los ticks leídos; fetch_series materializa la ventana y se
+# muestra como referencia.
+#
+#   python -m bench.memory [--rows 25000,100000] [--max-points 2000] [--tolerance 1.5]
+#
+# Sale con código 1 si el pico de un camino en streaming crece más de `tolerance`
+# veces entre la ventana más chica y la más grande.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Callable, Dict, List
+
+# Caminos que deben tener memoria acotada por la salida
+STREAMING = ("crud.iter_series", "aggregator.arrays_range[second]", "aggregator.ohlc_range[second]")
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Regresión de memoria de las lecturas de series")
+    p.add_argument("--rows", default="25000,100000", help="ticks por ventana (lista, 1 tick/s)")
+    p.add_argument("--max-points", type=int, default=2000)
+    p.add_argument("--tolerance", type=float, default=1.5, help="crecimiento de pico tolerado")
+    p.add_argument("--workdir", default=None)
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return p.parse_args()
+
+
+def _peak(fn: Callable[[], Any]) -> int:
+    fn()   # calentamiento (caché de sentencias compiladas)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def _child(args: argparse.Namespace) -> Dict[str, Any]:
+    # Corre en su propio proceso: DB_URL ya apunta a la base temporal
+    from app.aggregator import arrays_range, ohlc_range
+    from app.crud import fetch_series, iter_series
+    from app.db import SessionLocal, engine, init_db
+    from bench.suite import _ints, _seed
+
+    init_db()
+    sizes = sorted(_ints(args.rows))
+    crypto = "BTC-USD"
+    _, end = _seed(sizes[-1], [crypto], 1)
+    mp = args.max_points
+    out: Dict[str, Dict[str, int]] = {}
+    with SessionLocal() as db:
+        for n in sizes:
+            start = end - n + 1
+            checks = {
+                "crud.fetch_series": lambda: fetch_series(db, crypto, start),
+                "crud.iter_series": lambda: deque(iter_series(db, crypto, start, end), maxlen=0),
+                "aggregator.arrays_range[second]": lambda: arrays_range(db, crypto, "second", start, end, mp),
+                "aggregator.ohlc_range[second]": lambda: ohlc_range(db, crypto, "second", start, end, mp),
+            }
+            for name, fn in checks.items():
+                out.setdefault(name, {})[str(n)] = _peak(fn)
+    engine.dispose()
+    return {"sizes": sizes, "max_points": mp, "peaks": out}
+
+
+def _run_child(args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    db = os.path.join(workdir, f"memory_{int(time.time())}.sqlite")
+    env = dict(os.environ)
+    env["DB_URL"] = f"sqlite:///{db}"
+    env["COLLECTOR_DB_PATH"] = os.path.join(workdir, "crypto.db")
+    env["RETENTION_ENABLED"] = "0"
+    cmd = [sys.executable, "-m", "bench.memory", "--child", "--rows", args.rows, "--max-points", str(args.max_points)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(cmd, env=env, cwd=root, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Medición falló:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check(report: Dict[str, Any], tolerance: float) -> List[str]:
+    """Caminos en streaming cuyo pico crece más de `tolerance` veces."""
+    small, big = (str(n) for n in (report["sizes"][0], report["sizes"][-1]))
+    out = []
+    for name in STREAMING:
+        peaks = report["peaks"][name]
+        ratio = peaks[big] / max(1, peaks[small])
+        if ratio > tolerance:
+            out.append(f"{name}: {peaks[small]} → {peaks[big]} bytes (x{ratio:.2f})")
+    return out
+
+
+def main() -> int:
+    args = _parse_args()
+    if args.child:
+        print(json.dumps(_child(args)))
+        return 0
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_memory_")
+    os.makedirs(workdir, exist_ok=True)
+    report = _run_child(args, workdir)
+    sizes = report["sizes"]
+    print(f"Pico de memoria (KiB, tracemalloc) por ventana, max_points={report['max_points']}")
+    print(f"{'lectura':<36}" + "".join(f"{f'{n} ticks':>16}" for n in sizes))
+    for name, peaks in report["peaks"].items():
+        mark = "*" if name in STREAMING else " "
+        print(f"{mark}{name:<35}" + "".join(f"{peaks[str(n)] / 1024:>16.1f}" for n in sizes))
+    print("(* = debe quedar acotado por la salida)")
+    failures = check(report, args.tolerance)
+    if failures:
+        print(f"\n[WARN] {len(failures)} lecturas crecen con la ventana (> x{args.tolerance}):")
+        for line in failures:
+            print(f"  {line}")
+        return 1
+    print(f"\n[INFO] Lecturas en streaming acotadas (≤ x{args.tolerance} entre {sizes[0]} y {sizes[-1]} ticks)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# bench/suite.py
+# Benchmark reproducible de las rutas calientes sobre historiales sintéticos:
+# crud.fetch_series, aggregator.arrays/ohlc/arrays_many, rolling.warm (/api/table),
+# signals.signal_bs y la carga por lotes (BatchWriter), para varios tamaños
+# (filas totales × pares). Cada escenario siembra su propia base SQLite
+# (1 tick/s por par, terminando ahora) y corre en un subproceso aparte.
+#
+#   python -m bench.suite --rows 10000,100000,1000000 --pairs 1,50,500 [--repeat 5] [--json out.json]
+#   python -m bench.suite --rows 100000 --pairs 50 --compare base.json [--threshold 0.10]
+#
+# Por función: mediana/mín/media en ms, operaciones/s, filas/s y pico de memoria
+# (tracemalloc: asignaciones de Python, no la caché de páginas de SQLite).
+# --compare marca regresiones de mediana por encima del umbral y sale con código 1.
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def _parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark de consultas, señales y carga")
+    p.add_argument("--rows", default="10000,100000", help="filas totales por escenario (lista)")
+    p.add_argument("--pairs", default="1,50", help="número de pares por escenario (lista)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--ingest-ticks", type=int, default=5000)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workdir", default=None)
+    p.add_argument("--json", default=None, help="guardar el resultado en este archivo")
+    p.add_argument("--compare", default=None, help="JSON de una corrida anterior")
+    p.add_argument("--threshold", type=float, default=0.10, help="regresión tolerada (fracción)")
+    p.add_argument("--scenario", default=None, help=argparse.SUPPRESS)   # ROWS:PAIRS (subproceso)
+    return p.parse_args()
+
+
+def _ints(text: str) -> List[int]:
+    return [int(float(x)) for x in text.split(",") if x.strip()]
+
+
+# 🔹 Siembra: paseo aleatorio por par, un tick por segundo hasta ahora
+def _seed(rows: int, pairs: List[str], seed: int) -> Tuple[float, int]:
+    from app import rollups
+    from app.db import engine
+
+    rnd = random.Random(seed)
+    per_pair = max(1, rows // len(pairs))
+    end = int(time.time())
+    t0 = time.perf_counter()
+    sql = "INSERT INTO prices (crypto, amount_str, amount_dec, currency, ts, fetched_at) VALUES (?, ?, ?, ?, ?, ?)"
+    chunk: List[Tuple[Any, ...]] = []
+    with engine.connect() as conn:
+        for pair in pairs:
+            price = rnd.uniform(0.1, 50000)
+            for i in range(per_pair):
+                price *= 1.0 + rnd.gauss(0.0, 0.0005)
+                amount = f"{price:.6f}"
+                ts = end - per_pair + i + 1
+                chunk.append((pair, amount, float(amount), "USD", ts, ts))
+                if len(chunk) >= 50000:
+                    conn.exec_driver_sql(sql, chunk)
+                    chunk = []
+        if chunk:
+            conn.exec_driver_sql(sql, chunk)
+        conn.commit()
+    rollups.backfill(end - per_pair)
+    return time.perf_counter() - t0, end
+
+
+def _measure(fn: Callable[[], Any], repeat: int, rows: Callable[[Any], int]) -> Dict[str, Any]:
+    fn()   # calentamiento (caché de páginas, planes de consulta)
+    times: List[float] = []
+    result = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    median = statistics.median(times)
+    n = rows(result)
+    return {
+        "median_ms": round(median * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "mean_ms": round(statistics.fmean(times) * 1000, 3),
+        "ops_per_s": round(1 / median, 1) if median else None,
+        "rows": n,
+        "rows_per_s": round(n / median, 1) if median else None,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _count(result: Any) -> int:
+    if isinstance(result, dict):
+        return sum(_count(v) for v in result.values())
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 1
+
+
+def _ingest(pairs: List[str], ticks: int, end: int, repeat: int) -> Dict[str, Any]:
+    # Ruta de carga real: changed_rows + insert + rollups + commit, en lotes de WRITE_BATCH_SIZE
+    from decimal import Decimal
+
+    from app.crud import warm_last_price_cache
+    from app.db import SessionLocal
+    from app.writer import BatchWriter
+
+    with SessionLocal() as db:
+        warm_last_price_cache(db)
+    writer = BatchWriter()
+    rnd = random.Random(0)
+    state = {"ts": end}
+
+    def run() -> int:
+        for i in range(ticks):
+            pair = pairs[i % len(pairs)]
+            if i % len(pairs) == 0:
+                state["ts"] += 1
+            amount = f"{rnd.uniform(1, 1000):.6f}"
+            writer.add({"pair": pair, "amount_str": amount, "amount_dec": Decimal(amount),
+                        "currency": "USD", "ts": state["ts"]})
+            if writer.pending() >= writer.max_batch:
+                writer.flush()
+        writer.flush()
+        return ticks
+
+    out = _measure(run, repeat, lambda n: n)
+    writer.close()
+    return out
+
+
+def _scenario(rows: int, n_pairs: int, args: argparse.Namespace) -> Dict[str, Any]:
+    # Corre en su propio proceso: DB_URL ya apunta a la base del escenario
+    from app.aggregator import arrays, arrays_many, ohlc
+    from app.crud import fetch_series
+    from app.db import SessionLocal, engine, init_db
+    from app.rolling import RollingAggregator
+    from app.signals import signal_bs
+
+    init_db()
+    pairs = [f"P{i:03d}-USD" for i in range(n_pairs)]
+    seed_seconds, end = _seed(rows, pairs, args.seed)
+    crypto = pairs[0]
+    results: Dict[str, Dict[str, Any]] = {}
+    with SessionLocal() as db:
+        since = int(time.time()) - 3600
+        results["crud.fetch_series[1h]"] = _measure(lambda: fetch_series(db, crypto, since), args.repeat, _count)
+        for res in ("second", "minute", "hour", "day"):
+            results[f"aggregator.arrays[{res}]"] = _measure(lambda: arrays(db, crypto, res), args.repeat, _count)
+            results[f"aggregator.ohlc[{res}]"] = _measure(lambda: ohlc(db, crypto, res), args.repeat, _count)
+        # /api/table sale del estado incremental; su costo en la DB es la precarga al arrancar
+        results["rolling.warm[all]"] = _measure(
+            lambda: RollingAggregator().warm(db, pairs), args.repeat, lambda _: len(pairs))
+        results["aggregator.arrays_many[minute,all]"] = _measure(
+            lambda: arrays_many(db, pairs, "minute"), args.repeat, _count)
+        series = fetch_series(db, crypto, since)
+        prices = [p for _, p, _ in series]
+        avg = sum(prices) / len(prices) if prices else None
+        results["signals.signal_bs[1h]"] = _measure(lambda: signal_bs(prices, avg), args.repeat, lambda _: len(prices))
+    results[f"ingest[{args.ingest_ticks} ticks]"] = _ingest(pairs, args.ingest_ticks, end, args.repeat)
+    engine.dispose()
+    db_path = engine.url.database
+    return {
+        "rows": rows,
+        "pairs": n_pairs,
+        "seed_seconds": round(seed_seconds, 2),
+        "db_bytes": os.path.getsize(db_path) if db_path and os.path.exists(db_path) else None,
+        "results": results,
+    }
+
+
+def _run_scenario(rows: int, pairs: int, args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    db = os.path.join(workdir, f"bench_{rows}_{pairs}.sqlite")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    env = dict(os.environ)
+    env["DB_URL"] = f"sqlite:///{db}"
+    # Ruta inexistente: el benchmark nunca importa el crypto.db del proyecto
+    env["COLLECTOR_DB_PATH"] = os.path.join(workdir, "crypto.db")
+    env["RETENTION_ENABLED"] = "0"
+    cmd = [sys.executable, "-m", "bench.suite", "--scenario", f"{rows}:{pairs}",
+           "--repeat", str(args.repeat), "--ingest-ticks", str(args.ingest_ticks), "--seed", str(args.seed)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(cmd, env=env, cwd=root, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Escenario {rows}:{pairs} falló:\n{proc.stderr}")
+    # La última línea es el JSON (las anteriores son logs [INFO])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _meta(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    try:
+        import numpy  # noqa: F401
+        has_numpy = True
+    except ImportError:
+        has_numpy = False
+    return {
+        "timestamp": int(time.time()),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "numpy": has_numpy,
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+    }
+
+
+def _print(scenario: Dict[str, Any]) -> None:
+    print(f"\n== {scenario['rows']} filas × {scenario['pairs']} pares "
+          f"(siembra {scenario['seed_seconds']}s, {scenario['db_bytes']} bytes)")
+    print(f"{'función':<38}{'mediana ms':>12}{'ops/s':>10}{'filas/s':>14}{'pico KiB':>11}")
+    for name, r in scenario["results"].items():
+        print(f"{name:<38}{r['median_ms']:>12}{r['ops_per_s'] or '-':>10}{r['rows_per_s'] or '-':>14}{r['peak_kib']:>11}")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Regresiones de mediana (> threshold) en escenarios y funciones comunes."""
+    base = {(s["rows"], s["pairs"]): s["results"] for s in baseline["scenarios"]}
+    out = []
+    for s in current["scenarios"]:
+        old = base.get((s["rows"], s["pairs"]))
+        if old is None:
+            continue
+        for name, r in s["results"].items():
+            if name not in old or not old[name]["median_ms"]:
+                continue
+            ratio = r["median_ms"] / old[name]["median_ms"]
+            if ratio > 1 + threshold:
+                out.append(f"{s['rows']}×{s['pairs']} {name}: {old[name]['median_ms']} → {r['median_ms']} ms (x{ratio:.2f})")
+    return out
+
+
+def main() -> int:
+    args = _parse_args()
+    if args.scenario:
+        rows, pairs = (int(x) for x in args.scenario.split(":"))
+        print(json.dumps(_scenario(rows, pairs, args)))
+        return 0
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_suite_")
+    os.makedirs(workdir, exist_ok=True)
+    report: Dict[str, Any] = {"meta": _meta(args), "scenarios": []}
+    for rows in _ints(args.rows):
+        for pairs in _ints(args.pairs):
+            if pairs > rows:
+                continue
+            scenario = _run_scenario(rows, pairs, args, workdir)
+            report["scenarios"].append(scenario)
+            _print(scenario)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n[WARN] {len(regressions)} regresiones (> {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\n[INFO] Sin regresiones respecto de {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,20 +30,19 @@ const parseNum = (s) => {
 };
 
 // ==== Tabla principal ====
-async function fetchTable() {
-  try {
-    const res = await fetch('/api/table', { headers: AUTH_HEADER });
-    if (!res.ok) throw new Error(await res.text());
-    const data = await res.json();
+let tableOrder = [];   // orden de filas según /api/table
+let lastRows = {};     // crypto -> última fila recibida
+let renderPending = false;
 
-    // Render filas
-    tbody.innerHTML = '';
-    data.rows.forEach(r => {
-      const tr = document.createElement('tr');
-      const pct = parsePct(r.pct_change_24h);
-      const vol = parseNum(r.volatility_1h);
+function renderTable() {
+  const rows = tableOrder.map(c => lastRows[c]).filter(Boolean);
+  tbody.innerHTML = '';
+  rows.forEach(r => {
+    const tr = document.createElement('tr');
+    const pct = parsePct(r.pct_change_24h);
+    const vol = parseNum(r.volatility_1h);
 
-      tr.innerHTML = `
+    tr.innerHTML = `
         <td><b>${r.crypto ?? '-'}</b></td>
         <td class="num">${fmt(r.actual_price)}</td>
         <td class="num">${fmt(r.highest_1h)}</td>
@@ -52,20 +51,40 @@ async function fetchTable() {
         <td class="num">${fmt(vol)}</td>
         <td class="num" style="font-weight:700; color:${pct>0?'#16a34a':pct<0?'#dc2626':'#6b7280'}">${pct.toFixed(2)}%</td>
         <td class="sig signal-${r.signal ?? '-'}">${r.signal ?? '-'}</td>`;
-      tbody.appendChild(tr);
-    });
+    tbody.appendChild(tr);
+  });
+  // Paneles de análisis (se actualizan en sitio)
+  buildAnalysis(rows);
+}
+
+// Agrupa varias filas del stream en un solo render
+function scheduleRender() {
+  if (renderPending) return;
+  renderPending = true;
+  setTimeout(() => { renderPending = false; renderTable(); }, 250);
+}
+
+async function fetchTable() {
+  try {
+    // Tabla + series de todos los pares en la resolución actual, en una sola petición
+    const resolution = resSelect.value || 'minute';
+    const res = await fetch(`/api/batch?table=true&resolutions=${resolution}&format=columnar`, { headers: AUTH_HEADER });
+    if (!res.ok) throw new Error(await res.text());
+    const data = await res.json();
+
+    tableOrder = data.table.map(r => r.crypto);
+    data.table.forEach(r => { lastRows[r.crypto] = r; });
+    batchSeries = { resolution, byCrypto: (data.series || {})[resolution] || {} };
+    renderTable();
 
     // Rellenar select de cryptos (primera vez o si cambia el conjunto)
     const current = cryptoSelect.value;
-    const symbols = data.rows.map(r => r.crypto);
+    const symbols = tableOrder;
     if (cryptoSelect.options.length === 0 || Array.from(cryptoSelect.options).map(o=>o.value).join(',') !== symbols.join(',')) {
       cryptoSelect.innerHTML = symbols.map(s => `<option value="${s}">${s}</option>`).join('');
       if (symbols.includes(current)) cryptoSelect.value = current;
     }
 
-    // Cargar paneles de análisis
-    buildAnalysis(data.rows);
-
     // Si no hay gráfico cargado aún, dibuja
     if (!priceChart) drawChart();
   } catch (err) {
@@ -74,16 +93,35 @@ async function fetchTable() {
 }
 
 // ==== Gráfico de línea (arrays/{res}/{crypto}) ====
+// Series recibidas en el último /api/batch: el primer dibujo no necesita otra petición
+let batchSeries = null;
+
+function columnarPoints(data) {
+  // Formato columnar: ts en deltas (t0, t1-t0, ...) y precios como números
+  const deltas = data.ts || [], prices = data.price || [];
+  const points = [];
+  let ts = 0;
+  for (let i = 0; i < deltas.length; i++) {
+    ts += deltas[i];
+    const y = Number(prices[i]);
+    if (Number.isFinite(ts) && Number.isFinite(y)) points.push({ x: ts * 1000, y });
+  }
+  return points;
+}
+
 async function fetchSeries(crypto, resolution) {
-  const res = await fetch(`/api/arrays/${resolution}/${crypto}`, { headers: AUTH_HEADER });
+  if (batchSeries && batchSeries.resolution === resolution && batchSeries.byCrypto[crypto]) {
+    const points = columnarPoints(batchSeries.byCrypto[crypto]);
+    batchSeries = null;
+    return { points, crypto, resolution };
+  }
+  // Un punto por píxel como máximo: el servidor reduce la serie (LTTB)
+  const width = document.getElementById('chart').clientWidth || 1000;
+  const maxPoints = Math.min(10000, Math.max(100, Math.round(width * (window.devicePixelRatio || 1))));
+  const res = await fetch(`/api/arrays/${resolution}/${crypto}?format=columnar&max_points=${maxPoints}`, { headers: AUTH_HEADER });
   if (!res.ok) throw new Error(await res.text());
   const data = await res.json();
-  const points = (data.points || []).map(p => {
-    const ts = (typeof p.ts === 'number') ? p.ts * 1000 : Date.parse(p.ts);
-    const y  = parseNum(p.price);
-    return { x: ts, y };
-  }).filter(pt => Number.isFinite(pt.x) && Number.isFinite(pt.y));
-  return { points, crypto: data.crypto, resolution: data.resolution };
+  return { points: columnarPoints(data), crypto: data.crypto, resolution: data.resolution };
 }
 
 async function drawChart() {
@@ -141,69 +179,140 @@ async function drawChart() {
   }
 }
 
-// ==== Panel: Análisis ====
-function buildAnalysis(rows) {
-  // 1) Volatilidad top 5
-  const vol = rows
-    .map(r => ({ crypto: r.crypto, v: parseNum(r.volatility_1h) }))
-    .sort((a,b)=>b.v-a.v)
-    .slice(0,5);
-  const volLabels = vol.map(x=>x.crypto);
-  const volData = vol.map(x=>x.v);
+// ==== Stream en vivo (SSE leído con fetch para poder enviar Authorization) ====
+const WINDOW_SECONDS = { second: 60, minute: 3600, hour: 86400, day: 30 * 86400 };
+let streamOk = false;
+
+function handleSse(chunk) {
+  let event = 'message', data = '';
+  chunk.split('\n').forEach(line => {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) data += line.slice(5).trim();
+  });
+  if (!data) return;
+  const msg = JSON.parse(data);
+  if (event === 'row') {
+    lastRows[msg.crypto] = msg;
+    if (!tableOrder.includes(msg.crypto)) tableOrder.push(msg.crypto);
+    scheduleRender();
+  } else if (event === 'tick') {
+    if (resSelect.value === 'second' && msg.crypto === cryptoSelect.value) appendPoint(msg.ts * 1000, parseNum(msg.price));
+  } else if (event === 'bucket') {
+    if (msg.resolution === resSelect.value && msg.crypto === cryptoSelect.value) appendPoint(msg.ts * 1000, parseNum(msg.price));
+  }
+}
+
+// Agrega (o actualiza si es el mismo bucket) un punto al gráfico existente
+function appendPoint(x, y) {
+  if (!priceChart || isDrawing || !Number.isFinite(x) || !Number.isFinite(y)) return;
+  const data = priceChart.data.datasets[0].data;
+  const last = data[data.length - 1];
+  if (last && last.x === x) last.y = y;
+  else if (!last || x > last.x) data.push({ x, y });
+  else return;
+  const from = x - (WINDOW_SECONDS[resSelect.value] || 3600) * 1000;
+  while (data.length && data[0].x < from) data.shift();
+  pointsCount.textContent = data.length;
+  lastPrice.textContent = fmt(y);
+  priceChart.update('none');
+}
+
+async function startStream() {
+  let delay = 1000;
+  while (true) {
+    try {
+      const res = await fetch('/api/stream', { headers: AUTH_HEADER });
+      if (!res.ok || !res.body) throw new Error(`stream HTTP ${res.status}`);
+      streamOk = true;
+      delay = 1000;
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buf = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += decoder.decode(value, { stream: true });
+        let idx;
+        while ((idx = buf.indexOf('\n\n')) >= 0) {
+          handleSse(buf.slice(0, idx));
+          buf = buf.slice(idx + 2);
+        }
+      }
+    } catch (err) {
+      console.error('Error en stream:', err);
+    }
+    // Desconectado (o descartado por lento): resincronizar y reintentar
+    streamOk = false;
+    await new Promise(r => setTimeout(r, delay));
+    delay = Math.min(delay * 2, 30000);
+    fetchTable();
+    drawChart();
+  }
+}
 
-  const vc = document.getElementById('volatilityChart').getContext('2d');
-  if (volChart) volChart.destroy();
-  volChart = new Chart(vc, {
+// ==== Panel: Análisis ====
+// Crea el gráfico la primera vez; luego solo reemplaza los datos
+function upsertBar(chart, canvasId, label, labels, data) {
+  if (chart) {
+    chart.data.labels = labels;
+    chart.data.datasets[0].data = data;
+    chart.update('none');
+    return chart;
+  }
+  return new Chart(document.getElementById(canvasId).getContext('2d'), {
     type: 'bar',
-    data: { labels: volLabels, datasets: [{ label: 'Volatilidad 1H', data: volData }] },
+    data: { labels, datasets: [{ label, data }] },
     options: {
       responsive:true,
       scales: { y: { beginAtZero: true } },
       plugins: { legend: { display: false } }
     }
   });
+}
+
+function buildAnalysis(rows) {
+  // 1) Volatilidad top 5
+  const vol = rows
+    .map(r => ({ crypto: r.crypto, v: parseNum(r.volatility_1h) }))
+    .sort((a,b)=>b.v-a.v)
+    .slice(0,5);
+  volChart = upsertBar(volChart, 'volatilityChart', 'Volatilidad 1H', vol.map(x=>x.crypto), vol.map(x=>x.v));
 
   // 2) Ganadores top 5 por % 24H
   const winners = rows
     .map(r => ({ crypto: r.crypto, p: parsePct(r.pct_change_24h) }))
     .sort((a,b)=>b.p-a.p)
     .slice(0,5);
-  const gLabels = winners.map(x=>x.crypto);
-  const gData = winners.map(x=>x.p);
-
-  const gc = document.getElementById('gainersChart').getContext('2d');
-  if (gainersChart) gainersChart.destroy();
-  gainersChart = new Chart(gc, {
-    type: 'bar',
-    data: { labels: gLabels, datasets: [{ label: '% 24H', data: gData }] },
-    options: {
-      responsive:true,
-      scales: { y: { beginAtZero: true } },
-      plugins: { legend: { display: false } }
-    }
-  });
+  gainersChart = upsertBar(gainersChart, 'gainersChart', '% 24H', winners.map(x=>x.crypto), winners.map(x=>x.p));
 
   // 3) Distribución de señales
   const counts = rows.reduce((acc, r) => { acc[r.signal || '-'] = (acc[r.signal || '-']||0)+1; return acc; }, {});
   const sLabels = Object.keys(counts);
   const sData = Object.values(counts);
 
-  const sc = document.getElementById('signalsChart').getContext('2d');
-  if (signalsChart) signalsChart.destroy();
-  signalsChart = new Chart(sc, {
-    type: 'doughnut',
-    data: { labels: sLabels, datasets: [{ data: sData }] },
-    options: { responsive: true, plugins: { legend: { position: 'bottom' } } }
-  });
+  if (signalsChart) {
+    signalsChart.data.labels = sLabels;
+    signalsChart.data.datasets[0].data = sData;
+    signalsChart.update('none');
+  } else {
+    const sc = document.getElementById('signalsChart').getContext('2d');
+    signalsChart = new Chart(sc, {
+      type: 'doughnut',
+      data: { labels: sLabels, datasets: [{ data: sData }] },
+      options: { responsive: true, plugins: { legend: { position: 'bottom' } } }
+    });
+  }
 }
 
 // ==== Eventos / timers ====
-setInterval(fetchTable, 5000);  // tabla + paneles
-setInterval(() => { if (!isDrawing) drawChart(); }, 10000);  // gráfico serie
+// El stream empuja los cambios; el sondeo solo actúa como respaldo sin stream
+setInterval(() => { if (!streamOk) fetchTable(); }, 5000);  // tabla + paneles
+setInterval(() => { if (!streamOk && !isDrawing) drawChart(); }, 10000);  // gráfico serie
 cryptoSelect.addEventListener('change', drawChart);
 resSelect.addEventListener('change', drawChart);
 
 // Primer render
 fetchTable();
+startStream();
 
 window.addEventListener('resize', () => { if (priceChart) priceChart.resize(); });
@@ -0,0 +1,35 @@
+# tests/conftest.py
+# Base SQLite temporal para toda la sesión: app.db crea el engine al importarse,
+# así que el entorno se fija aquí, antes de que cualquier test importe app
+import os
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix="crypto_tests_")
+os.environ["DB_URL"] = f"sqlite:///{os.path.join(_TMP, 'prices.sqlite')}"
+os.environ["COLLECTOR_DB_PATH"] = os.path.join(_TMP, "crypto.db")   # no existe: sin importación
+os.environ["RETENTION_ENABLED"] = "0"
+
+# Ticks de prueba (1 por segundo) del par sembrado
+SEED_PAIR = "BTC-USD"
+SEED_ROWS = 20000
+
+
+@pytest.fixture(scope="session")
+def db():
+    """Engine sobre la base temporal, con tablas y migraciones aplicadas."""
+    from app.db import engine, init_db
+
+    init_db()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def seeded(db):
+    """Siembra SEED_ROWS ticks de SEED_PAIR (con rollups): devuelve (par, ts del último)."""
+    from bench.suite import _seed
+
+    _, end = _seed(SEED_ROWS, [SEED_PAIR], 1)
+    return SEED_PAIR, end
@@ -0,0 +1,50 @@
+# tests/test_memory.py
+# Las lecturas en streaming deben tener un pico de memoria acotado por la salida
+# (max_points), no por los ticks de la ventana (misma medición que bench/memory.py)
+from collections import deque
+
+import pytest
+
+from bench.memory import STREAMING, _peak
+
+MAX_POINTS = 500
+WINDOWS = (5000, 20000)
+TOLERANCE = 1.5
+# Bloque del cursor menor que la ventana chica: si no, el bloque domina el pico
+CHUNK_ROWS = 1000
+
+
+@pytest.fixture(scope="module")
+def peaks(seeded):
+    from app import crud
+    from app.aggregator import arrays_range, ohlc_range
+    from app.crud import fetch_series, iter_series
+    from app.db import SessionLocal
+
+    crypto, end = seeded
+    out = {}
+    with pytest.MonkeyPatch.context() as mp, SessionLocal() as db:
+        mp.setattr(crud, "READ_CHUNK_ROWS", CHUNK_ROWS)
+        for n in WINDOWS:
+            start = end - n + 1
+            checks = {
+                "crud.fetch_series": lambda: fetch_series(db, crypto, start),
+                "crud.iter_series": lambda: deque(iter_series(db, crypto, start, end), maxlen=0),
+                "aggregator.arrays_range[second]": lambda: arrays_range(db, crypto, "second", start, end, MAX_POINTS),
+                "aggregator.ohlc_range[second]": lambda: ohlc_range(db, crypto, "second", start, end, MAX_POINTS),
+            }
+            for name, fn in checks.items():
+                out.setdefault(name, {})[n] = _peak(fn)
+    return out
+
+
+def test_reference_path_grows_with_window(peaks):
+    # Sin esto la comparación no prueba nada: fetch_series materializa la ventana
+    small, big = (peaks["crud.fetch_series"][n] for n in WINDOWS)
+    assert big > 2 * small
+
+
+@pytest.mark.parametrize("name", STREAMING)
+def test_streaming_peak_bounded_by_output(peaks, name):
+    small, big = (peaks[name][n] for n in WINDOWS)
+    assert big <= TOLERANCE * max(1, small), f"{name}: {small} → {big} bytes"
@@ -0,0 +1,20 @@
+# tests/test_query_plans.py
+# Las consultas calientes de crud.py deben usar ix_prices_crypto_ts (sin ordenar en temporal)
+from app.db import check_query_plans, migrate, MIGRATIONS
+
+
+def test_schema_is_migrated(db):
+    assert migrate() == MIGRATIONS[-1][0]
+    with db.connect() as conn:
+        indexes = {name for (name,) in conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'prices'"
+        )}
+    assert "ix_prices_crypto_ts" in indexes
+
+
+def test_hot_queries_use_crypto_ts_index(db):
+    plans = check_query_plans()
+    assert plans
+    for name, detail in plans.items():
+        assert "ix_prices_crypto_ts" in detail, name
+        assert "TEMP B-TREE" not in detail, name